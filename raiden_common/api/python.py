@@ -32,6 +32,7 @@
     WithdrawMismatch,
 )
 from raiden_common.settings import DEFAULT_RETRY_TIMEOUT, PythonApiConfig
+from raiden_common.storage.sqlite import EventID
 from raiden_common.storage.utils import TimestampedEvent
 from raiden_common.transfer import channel, views
 from raiden_common.transfer.architecture import Event, StateChange, TransferTask
@@ -1207,6 +1208,7 @@ def get_raiden_events_payment_history_with_timestamps(
         target_address: Address = None,
         limit: int = None,
         offset: int = None,
+        after: EventID = None,
     ) -> List[TimestampedEvent]:
         if token_address and not is_binary_address(token_address):
             raise InvalidBinaryAddress(
@@ -1244,6 +1246,7 @@ def get_raiden_events_payment_history_with_timestamps(
             offset=offset,
             token_network_address=token_network_address,
             partner_address=target_address,
+            after=after,
         )
         events = [
             e
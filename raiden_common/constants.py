@@ -29,7 +29,7 @@
 DOC_URL = "https://raiden-network.readthedocs.io/en/latest/rest_api.html"
 SECURITY_EXPRESSION = r"\[CRITICAL UPDATE.*?\]"
 
-RAIDEN_DB_VERSION = RaidenDBVersion(27)
+RAIDEN_DB_VERSION = RaidenDBVersion(28)
 SQLITE_MIN_REQUIRED_VERSION = (3, 9, 0)
 PROTOCOL_VERSION = RaidenProtocolVersion(1)
 
@@ -184,6 +184,27 @@ class RoutingMode(Enum):
     PRIVATE = "private"
 
 
+class SQLiteJournalMode(Enum):
+    """Journal modes supported by the node's database.
+
+    PERSIST uses an exclusive lock, other processes can not read the database
+    while the node is running. WAL allows concurrent readers.
+    """
+
+    PERSIST = "PERSIST"
+    WAL = "WAL"
+
+
+class SQLiteSynchronous(Enum):
+    """SQLite `synchronous` settings. With the WAL journal mode NORMAL does not
+    fsync on every commit, the last commits may be lost on power failure but
+    the database can not be corrupted.
+    """
+
+    NORMAL = "NORMAL"
+    FULL = "FULL"
+
+
 # See gas measurements in raiden contracts for these values, rounded up
 GAS_REQUIRED_REGISTER_SECRET_BATCH_BASE = 23000
 GAS_REQUIRED_PER_SECRET_IN_BATCH = 26000
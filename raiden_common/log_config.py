@@ -12,6 +12,7 @@
 import structlog
 
 from raiden_common.exceptions import ConfigurationError
+from raiden_common.utils.logging import LazyField
 
 LOG_BLACKLIST: Dict[Pattern, str] = {
     re.compile(r"\b(access_?token=)([a-z0-9_-]+)", re.I): r"\1<redacted>",
@@ -121,6 +122,31 @@ def add_greenlet_name(
     return event_dict
 
 
+def resolve_lazy_fields(
+    _logger: str, _method_name: str, event_dict: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Compute the values of the `LazyField`s in the event dict.
+
+    This runs in the formatters, i.e. only for the records which passed the
+    level filters of a handler.
+    """
+    for key, value in event_dict.items():
+        if isinstance(value, LazyField):
+            event_dict[key] = value.resolve()
+    return event_dict
+
+
+def _renderer(renderer: Callable) -> Callable:
+    """Returns a formatter processor which resolves the lazy fields before
+    calling `renderer`.
+    """
+
+    def wrapper(logger: str, method_name: str, event_dict: Dict[str, Any]) -> Any:
+        return renderer(logger, method_name, resolve_lazy_fields(logger, method_name, event_dict))
+
+    return wrapper
+
+
 def redactor(blacklist: Dict[Pattern, str]) -> Callable[[str], str]:
     """Returns a function which transforms a str, replacing all matches for its replacement"""
 
@@ -255,22 +281,26 @@ def configure_logging(
             "formatters": {
                 "plain": {
                     "()": structlog.stdlib.ProcessorFormatter,
-                    "processor": _chain(structlog.dev.ConsoleRenderer(colors=False), redact),
+                    "processor": _chain(
+                        _renderer(structlog.dev.ConsoleRenderer(colors=False)), redact
+                    ),
                     "foreign_pre_chain": processors,
                 },
                 "json": {
                     "()": structlog.stdlib.ProcessorFormatter,
-                    "processor": _chain(structlog.processors.JSONRenderer(), redact),
+                    "processor": _chain(_renderer(structlog.processors.JSONRenderer()), redact),
                     "foreign_pre_chain": processors,
                 },
                 "colorized": {
                     "()": structlog.stdlib.ProcessorFormatter,
-                    "processor": _chain(structlog.dev.ConsoleRenderer(colors=True), redact),
+                    "processor": _chain(
+                        _renderer(structlog.dev.ConsoleRenderer(colors=True)), redact
+                    ),
                     "foreign_pre_chain": processors,
                 },
                 "debug": {
                     "()": structlog.stdlib.ProcessorFormatter,
-                    "processor": _chain(structlog.processors.JSONRenderer(), redact),
+                    "processor": _chain(_renderer(structlog.processors.JSONRenderer()), redact),
                     "foreign_pre_chain": processors,
                 },
             },
@@ -26,6 +26,7 @@
 from raiden_common.exceptions import MatrixSyncMaxTimeoutReached, TransportError
 from raiden_common.messages.abstract import Message
 from raiden_common.network.transport.matrix.sync_progress import SyncProgress
+from raiden_common.settings import DEFAULT_TRANSPORT_MATRIX_SYNC_MAX_QUEUED_RESPONSES
 from raiden_common.utils.debugging import IDLE
 from raiden_common.utils.notifying_queue import NotifyingQueue
 from raiden_common.utils.typing import Address, AddressHex, AddressMetadata
@@ -197,7 +198,14 @@ def disable_push_notifications(self) -> Dict[str, Any]:
 
 
 class GMatrixClient(MatrixClient):
-    """Gevent-compliant MatrixClient subclass"""
+    """Gevent-compliant MatrixClient subclass
+
+    The sync is pipelined: the `sync_worker` queues every response and starts
+    the next long-poll right away, while the `message_worker` processes the
+    queued responses. The sync is only delayed when more than
+    `max_queued_responses` responses wait to be processed. The durations of the
+    stages are recorded in `sync_progress.metrics`.
+    """
 
     sync_worker: Optional[Greenlet] = None
     message_worker: Optional[Greenlet] = None
@@ -217,12 +225,16 @@ def __init__(
         http_retry_delay: Callable[[], Iterable[float]] = lambda: repeat(1),
         environment: Environment = Environment.PRODUCTION,
         user_agent: str = None,
+        max_queued_responses: int = DEFAULT_TRANSPORT_MATRIX_SYNC_MAX_QUEUED_RESPONSES,
     ) -> None:
 
         self.token: Optional[str] = None
         self.environment = environment
         self.handle_messages_callback = handle_messages_callback
         self.response_queue: NotifyingQueue[Tuple[UUID, JSONResponse, datetime]] = NotifyingQueue()
+        self.max_queued_responses = max_queued_responses
+        # Set whenever queued responses were processed, to wake up a sync waiting on them
+        self._responses_processed = Event()
         self.stop_event = Event()
 
         super().__init__(
@@ -313,6 +325,7 @@ def listen_forever(
 
         while not self.stop_event.is_set():
             try:
+                self._wait_for_queued_responses()
                 # may be killed and raise exception from message_worker
                 self._sync(timeout_ms, latency_ms)
                 _bad_sync_timeout = bad_sync_timeout
@@ -417,6 +430,7 @@ def stop_listener_thread(self) -> None:
             "Listener greenlet exited",
             node=node_address_from_userid(self.user_id),
             user_id=self.user_id,
+            sync_metrics=self.sync_progress.metrics,
         )
         self.sync_worker = None
         self.message_worker = None
@@ -481,6 +495,27 @@ def blocking_sync(self, timeout_ms: int, latency_ms: int) -> None:
 
         self._handle_responses(pending_queue)
 
+    def _wait_for_queued_responses(self) -> None:
+        """Back-pressure, wait while too many responses are waiting to be processed"""
+        if len(self.response_queue) < self.max_queued_responses:
+            return
+
+        log.debug(
+            "Sync waiting for queued responses to be processed",
+            node=node_address_from_userid(self.user_id),
+            user_id=self.user_id,
+            current_size=len(self.response_queue),
+        )
+        time_before_wait = time.monotonic()
+        while (
+            len(self.response_queue) >= self.max_queued_responses and not self.stop_event.is_set()
+        ):
+            self._responses_processed.clear()
+            gevent.wait(  # pylint: disable=gevent-disable-wait
+                {self._responses_processed, self.stop_event}, count=1
+            )
+        self.sync_progress.metrics.backpressure.record(time.monotonic() - time_before_wait)
+
     def _sync(self, timeout_ms: int, latency_ms: int) -> None:
         """Reimplements MatrixClient._sync"""
         log.debug(
@@ -529,6 +564,7 @@ def _sync(self, timeout_ms: int, latency_ms: int) -> None:
             since=self.sync_token, timeout_ms=timeout_ms, filter=self._sync_filter_id
         )
         time_after_sync = time.monotonic()
+        self.sync_progress.metrics.request.record(time_after_sync - time_before_sync)
 
         log.debug(
             "api.sync returned",
@@ -582,15 +618,18 @@ def _handle_message(
             # The Queue's iterator cannot be used because it defaults do `get`.
             currently_queued_response_tokens = []
             currently_queued_responses = []
+            now = datetime.now()
             for token, response, received_at in response_queue.queue.queue:
                 assert response is not None, "None is not a valid value for a Matrix response."
 
+                processing_lag = now - received_at
+                self.sync_progress.metrics.queue.record(processing_lag.total_seconds())
                 log.debug(
                     "Handling Matrix response",
                     token=token,
                     node=node_address_from_userid(self.user_id),
                     current_size=len(response_queue),
-                    processing_lag=datetime.now() - received_at,
+                    processing_lag=processing_lag,
                 )
                 currently_queued_response_tokens.append(token)
                 currently_queued_responses.append(response)
@@ -604,6 +643,9 @@ def _handle_message(
             time_before_processing = time.monotonic()
             self._handle_responses(currently_queued_responses)
             time_after_processing = time.monotonic()
+            self.sync_progress.metrics.processing.record(
+                time_after_processing - time_before_processing
+            )
             log.debug(
                 "Processed queued Matrix responses",
                 node=node_address_from_userid(self.user_id),
@@ -617,6 +659,7 @@ def _handle_message(
             # at-least-once semantics.
             for _ in currently_queued_responses:
                 response_queue.get(block=False)
+            self._responses_processed.set()
 
             self.sync_progress.set_processed(currently_queued_response_tokens)
 
@@ -1,3 +1,4 @@
+from dataclasses import dataclass, field
 from datetime import datetime
 from uuid import UUID
 
@@ -31,6 +32,42 @@ def wait(self, timeout: Optional[float] = None) -> Optional[List[UUID]]:
         return self.tokens
 
 
+@dataclass
+class SyncStageMetrics:
+    """Durations of a stage of the sync pipeline, in seconds"""
+
+    count: int = 0
+    total: float = 0.0
+    maximum: float = 0.0
+    last: float = 0.0
+
+    def record(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
+        self.last = duration
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+@dataclass
+class SyncMetrics:
+    """Instrumentation of the stages of the sync pipeline
+
+    - request: duration of the `/sync` long-polls
+    - backpressure: time the sync waited for queued responses to be processed
+    - queue: time the responses waited in the queue before being processed
+    - processing: duration of the processing of the queued responses
+    """
+
+    request: SyncStageMetrics = field(default_factory=SyncStageMetrics)
+    backpressure: SyncStageMetrics = field(default_factory=SyncStageMetrics)
+    queue: SyncStageMetrics = field(default_factory=SyncStageMetrics)
+    processing: SyncStageMetrics = field(default_factory=SyncStageMetrics)
+
+
 class SyncProgress:
     """
     SyncProgress tracks the current progress of matrix's long polling sync.
@@ -58,6 +95,7 @@ def __init__(
         self.last_synced: Optional[UUID] = None
         self.last_processed: Optional[UUID] = None
         self.response_queue = response_queue
+        self.metrics = SyncMetrics()
 
     def set_synced(self, token: UUID) -> None:
         self.sync_iteration += 1
@@ -1,7 +1,8 @@
 import itertools
 import time
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque
 from dataclasses import dataclass
+from heapq import heappop, heappush
 from random import randint
 from typing import TYPE_CHECKING, Counter as CounterType
 from urllib.parse import urlparse
@@ -24,7 +25,12 @@
     MatrixMessageType,
 )
 from raiden_common.exceptions import RaidenUnrecoverableError, TransportError
-from raiden_common.messages.abstract import Message, RetrieableMessage, SignedRetrieableMessage
+from raiden_common.messages.abstract import (
+    Message,
+    RetrieableMessage,
+    SignedMessage,
+    SignedRetrieableMessage,
+)
 from raiden_common.messages.healthcheck import Ping, Pong
 from raiden_common.messages.synchronization import Delivered, Processed
 from raiden_common.network.pathfinding import PFSProxy
@@ -46,7 +52,9 @@
     make_client,
     make_message_batches,
     make_user_id,
-    validate_and_parse_message,
+    parse_signed_messages,
+    recover_senders,
+    validate_senders,
     validate_userid_signature,
 )
 from raiden_common.network.transport.utils import timeout_exponential_backoff
@@ -58,10 +66,10 @@
     CANONICAL_IDENTIFIER_UNORDERED_QUEUE,
     QueueIdentifier,
 )
-from raiden_common.transfer.state import QueueIdsToQueues
+from raiden_common.transfer.state import MessageQueue, QueueIdsToQueues
 from raiden_common.utils.capabilities import capconfig_to_dict
 from raiden_common.utils.formatting import to_checksum_address
-from raiden_common.utils.logging import redact_secret
+from raiden_common.utils.logging import LazyField, redact_secret, serialize_redacted
 from raiden_common.utils.runnable import Runnable
 from raiden_common.utils.system import get_system_spec
 from raiden_common.utils.tracing import matrix_client_enable_requests_tracing
@@ -71,14 +79,13 @@
     AddressHex,
     AddressMetadata,
     Any,
-    Callable,
     ChainID,
+    Deque,
     Dict,
     Iterable,
     Iterator,
     List,
     MessageID,
-    NamedTuple,
     Optional,
     Set,
     Tuple,
@@ -91,9 +98,6 @@
 log = structlog.get_logger(__name__)
 
 
-# A RetryQueue is considered idle after this many iterations without a message
-RETRY_QUEUE_IDLE_AFTER = 10
-
 SET_PRESENCE_INTERVAL = 60
 
 
@@ -111,76 +115,68 @@ def _metadata_key_func(message_data: "_RetryQueue._MessageData") -> str:
     return uid
 
 
-class _RetryQueue(Runnable):
-    """A helper Runnable to send batched messages to receiver through transport"""
+class _RetryQueue:
+    """A helper to send batched messages to receiver through transport
+
+    The queue doesn't have a greenlet of its own, the ``_RetryScheduler`` of
+    the transport checks it whenever one of its messages is due.
+    """
 
-    class _MessageData(NamedTuple):
+    @dataclass(eq=False)
+    class _MessageData:
         """Small helper data structure for message queue"""
 
         queue_identifier: QueueIdentifier
         message: Message
         text: str
-        # generator that tells if the message should be sent now
-        expiration_generator: Iterator[bool]
+        # the timeouts between the retries of the message
+        timeouts: Iterator[float]
         address_metadata: Optional[AddressMetadata]
+        # monotonic time at which the message has to be sent next, zero to send it right away
+        next_retry: float = 0.0
 
     def __init__(self, transport: "MatrixTransport", receiver: Address) -> None:
         self.transport = transport
         self.receiver = receiver
-        self._message_queue: List[_RetryQueue._MessageData] = []
-        self._notify_event = gevent.event.Event()
-        self._idle_since: int = 0  # Counter of idle iterations
-        super().__init__()
-        self.greenlet.name = f"RetryQueue recipient:{to_checksum_address(self.receiver)}"
+        # Ordered by insertion, keyed by ``_message_key`` to find duplicates and
+        # remove messages in constant time
+        self._message_queue: Dict[Tuple[QueueIdentifier, Any], _RetryQueue._MessageData] = {}
+        # deadline at which the queue is scheduled to be checked, if any
+        self.scheduled_at: Optional[float] = None
 
     @property
     def log(self) -> Any:
         return self.transport.log
 
     @staticmethod
-    def _expiration_generator(
-        timeout_generator: Iterable[float], now: Callable[[], float] = time.time
-    ) -> Iterator[bool]:
-        """Stateful generator that yields True if more than timeout has passed since previous True,
-        False otherwise.
-
-        Helper method to tell when a message needs to be retried (more than timeout seconds
-        passed since last time it was sent).
-        timeout is iteratively fetched from timeout_generator
-        First value is True to always send message at least once
+    def _message_key(
+        queue_identifier: QueueIdentifier, message: Message
+    ) -> Tuple[QueueIdentifier, Any]:
+        """Key of a message in the queue
+
+        Retrieable messages are identified by their message identifier, all
+        others by the message itself, i.e. by their content.
         """
-        for timeout in timeout_generator:
-            _next = now() + timeout  # next value is now + next generated timeout
-            yield True
-            while now() < _next:  # yield False while next is still in the future
-                yield False
+        if isinstance(message, RetrieableMessage):
+            return queue_identifier, message.message_identifier
+        return queue_identifier, message
 
     def enqueue(
         self,
         queue_identifier: QueueIdentifier,
         messages: List[Tuple[Message, Optional[AddressMetadata]]],
     ) -> None:
-        """Enqueue a message to be sent, and notify main loop"""
+        """Enqueue a message to be sent, and notify the retry scheduler"""
         msg = (
             f"queue_identifier.recipient ({to_checksum_address(queue_identifier.recipient)}) "
             f" must match self.receiver ({to_checksum_address(self.receiver)})."
         )
         assert queue_identifier.recipient == self.receiver, msg
 
-        timeout_generator = timeout_exponential_backoff(
-            self.transport._config.retries_before_backoff,
-            self.transport._config.retry_interval_initial,
-            self.transport._config.retry_interval_max,
-        )
-
-        encoded_messages = []
         for message, address_metadata in messages:
-            already_queued = any(
-                queue_identifier == data.queue_identifier and message == data.message
-                for data in self._message_queue
-            )
+            key = self._message_key(queue_identifier, message)
 
-            if already_queued:
+            if key in self._message_queue:
                 self.log.warning(
                     "Message already in queue - ignoring",
                     receiver=to_checksum_address(self.receiver),
@@ -188,17 +184,19 @@ def enqueue(
                     message=redact_secret(DictSerializer.serialize(message)),
                 )
             else:
-                expiration_generator = self._expiration_generator(timeout_generator)
-                data = _RetryQueue._MessageData(
+                timeouts = timeout_exponential_backoff(
+                    self.transport._config.retries_before_backoff,
+                    self.transport._config.retry_interval_initial,
+                    self.transport._config.retry_interval_max,
+                )
+                self._message_queue[key] = _RetryQueue._MessageData(
                     queue_identifier=queue_identifier,
                     message=message,
                     text=MessageSerializer.serialize(message),
-                    expiration_generator=expiration_generator,
+                    timeouts=timeouts,
                     address_metadata=address_metadata,
                 )
-                encoded_messages.append(data)
 
-        self._message_queue.extend(encoded_messages)
         self.notify()
 
     def enqueue_unordered(
@@ -213,21 +211,26 @@ def enqueue_unordered(
         )
 
     def notify(self) -> None:
-        """Notify main loop to check if anything needs to be sent"""
-        self._notify_event.set()
+        """Notify the retry scheduler to check if anything needs to be sent"""
+        self.transport._retry_scheduler.schedule(self, time.monotonic())
 
-    def _check_and_send(self) -> None:
+    def _check_and_send(self) -> Optional[float]:
         """Check and send all pending/queued messages that are not waiting on retry timeout
 
         After composing the to-be-sent message, also message queue from messages that are not
         present in the respective SendMessageEvent queue anymore
+
+        Returns the monotonic time at which the next message is due, or ``None`` if the
+        queue is empty.
         """
         if not self.transport.greenlet:
             self.log.warning("Can't retry", reason="Transport not yet started")
-            return
+            if not self._message_queue:
+                return None
+            return time.monotonic() + self.transport._config.retry_interval_initial
         if self.transport._stop_event.ready():
             self.log.warning("Can't retry", reason="Transport stopped")
-            return
+            return None
 
         # On startup protocol messages must be sent only after the monitoring
         # services are updated. For more details refer to the method
@@ -243,19 +246,26 @@ def _check_and_send(self) -> None:
         # XXX-UAM: reachability check was here
 
         def message_is_in_queue(message_data: _RetryQueue._MessageData) -> bool:
-            if message_data.queue_identifier not in self.transport._queueids_to_queues:
+            queue = self.transport._queueids_to_queues.get(message_data.queue_identifier)
+            if queue is None:
                 # The Raiden queue for this queue identifier has been removed
                 return False
-            return any(
-                isinstance(message_data.message, RetrieableMessage)
-                and send_event.message_identifier == message_data.message.message_identifier
-                for send_event in self.transport._queueids_to_queues[message_data.queue_identifier]
-            )
+            if not isinstance(message_data.message, RetrieableMessage):
+                return False
+
+            message_identifier = message_data.message.message_identifier
+            if isinstance(queue, MessageQueue):
+                return message_identifier in queue.message_identifiers
+            return any(send_event.message_identifier == message_identifier for send_event in queue)
 
         # batch by user_id, so that we can potentially combine data for send-to-device calls
-        queue_by_user_id = sorted(self._message_queue[:], key=_metadata_key_func)
-        for user_id, batch in itertools.groupby(queue_by_user_id, _metadata_key_func):
-            message_data_batch = list(batch)
+        queue_by_user_id: Dict[str, List[_RetryQueue._MessageData]] = defaultdict(list)
+        for message_data in self._message_queue.values():
+            queue_by_user_id[_metadata_key_func(message_data)].append(message_data)
+
+        now = time.monotonic()
+        removed: List[_RetryQueue._MessageData] = []
+        for user_id, message_data_batch in queue_by_user_id.items():
             if user_id == "":
                 address_metadata = None
             else:
@@ -270,39 +280,35 @@ def message_is_in_queue(message_data: _RetryQueue._MessageData) -> bool:
                 #   - Those are immediately remove from the local queue
                 #     since they are only sent once
                 # - Retryable
-                #   - Those are retried according to their retry generator
+                #   - Those are retried according to their retry timeouts
                 #     as long as they haven't been
                 #     removed from the Raiden queue
-                remove = False
                 if isinstance(message_data.message, (Delivered, Ping, Pong)):
                     # e.g. Delivered, send only once and then clear
                     # TODO: Is this correct? Will a missed Delivered be 'fixed' by the
                     #       later `Processed` message?
-                    remove = True
                     message_texts.append(message_data.text)
+                    removed.append(message_data)
                 elif not message_is_in_queue(message_data):
-                    remove = True
                     self.log.debug(
                         "Stopping message send retry",
                         queue=message_data.queue_identifier,
                         message=message_data.message,
                         reason="Message was removed from queue or queue was removed",
                     )
-                else:
-                    # The message is still eligible for retry, consult the expiration generator if
-                    # it should be retried now
-                    if next(message_data.expiration_generator):
-                        message_texts.append(message_data.text)
-                        if self.transport._environment is Environment.DEVELOPMENT:
-                            if isinstance(message_data.message, RetrieableMessage):
-                                self.transport._counters["retry"][
-                                    (
-                                        message_data.message.__class__.__name__,
-                                        message_data.message.message_identifier,
-                                    )
-                                ] += 1
-                if remove:
-                    self._message_queue.remove(message_data)
+                    removed.append(message_data)
+                elif message_data.next_retry <= now:
+                    # The message is still eligible for retry and its retry is due
+                    message_data.next_retry = now + next(message_data.timeouts)
+                    message_texts.append(message_data.text)
+                    if self.transport._environment is Environment.DEVELOPMENT:
+                        if isinstance(message_data.message, RetrieableMessage):
+                            self.transport._counters["retry"][
+                                (
+                                    message_data.message.__class__.__name__,
+                                    message_data.message.message_identifier,
+                                )
+                            ] += 1
 
             if message_texts:
                 self.log.debug(
@@ -313,44 +319,169 @@ def message_is_in_queue(message_data: _RetryQueue._MessageData) -> bool:
                         self.receiver, message_batch, receiver_metadata=address_metadata
                     )
 
+        for message_data in removed:
+            key = self._message_key(message_data.queue_identifier, message_data.message)
+            # The message may have been enqueued again while sending
+            if self._message_queue.get(key) is message_data:
+                del self._message_queue[key]
+
+        return min((data.next_retry for data in self._message_queue.values()), default=None)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} for {to_normalized_address(self.receiver)}>"
+
+
+class _RetryScheduler(Runnable):
+    """A helper Runnable which checks the retry queues of all receivers when they are due
+
+    Instead of a greenlet per receiver which polls its queue, the deadlines of
+    the queues are kept in a heap. The scheduler only wakes up when the
+    earliest deadline is reached or a queue is notified about new messages.
+    """
+
+    def __init__(self, transport: "MatrixTransport") -> None:
+        self.transport = transport
+        # Entries are ``(deadline, sequence, retry_queue)``. An entry is stale if the
+        # queue has been rescheduled in the meantime, those are skipped when popped.
+        self._deadlines: List[Tuple[float, int, _RetryQueue]] = []
+        self._sequence = itertools.count()
+        self._wakeup = Event()
+        super().__init__()
+        self.greenlet.name = "RetryScheduler"
+
+    @property
+    def log(self) -> Any:
+        return self.transport.log
+
+    def schedule(self, retry_queue: _RetryQueue, deadline: float) -> None:
+        """Check ``retry_queue`` at ``deadline``, unless it is scheduled earlier already"""
+        if retry_queue.scheduled_at is not None and retry_queue.scheduled_at <= deadline:
+            return
+
+        retry_queue.scheduled_at = deadline
+        heappush(self._deadlines, (deadline, next(self._sequence), retry_queue))
+        if self._deadlines[0][2] is retry_queue:
+            self.notify()
+
+    def notify(self) -> None:
+        """Notify main loop that the earliest deadline has changed"""
+        self._wakeup.set()
+
     def _run(self) -> None:
         msg = (
-            """_RetryQueue started before transport._raiden_service is set. """
-            """_RetryQueue should not be started before transport.start() is called"""
+            """_RetryScheduler started before transport._raiden_service is set. """
+            """_RetryScheduler should not be started before transport.start() is called"""
         )
 
         assert self.transport._raiden_service is not None, msg
         self.greenlet.name = (
-            f"RetryQueue "
-            f"node:{to_checksum_address(self.transport._raiden_service.address)} "
-            f"recipient:{to_checksum_address(self.receiver)}"
+            f"RetryScheduler "
+            f"node:{to_checksum_address(self.transport._raiden_service.address)}"
         )
         # run while transport parent is running
         while not self.transport._stop_event.ready():
-            self._notify_event.clear()
-            if self._message_queue:
-                self._idle_since = 0
-                self._check_and_send()
-            else:
-                self._idle_since += 1
+            self._wakeup.clear()
+
+            now = time.monotonic()
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, _, retry_queue = heappop(self._deadlines)
+                if retry_queue.scheduled_at != deadline:
+                    continue
+
+                retry_queue.scheduled_at = None
+                next_retry = retry_queue._check_and_send()
+                if next_retry is not None:
+                    self.schedule(retry_queue, next_retry)
+
+            timeout = None
+            if self._deadlines:
+                timeout = max(self._deadlines[0][0] - time.monotonic(), 0)
+            # wait until the earliest deadline (or to be notified) before checking again
+            self._wakeup.wait(timeout)
+
+
+class _ToDeviceBatcher:
+    """Coalesces the to-device messages to all receivers into shared requests
+
+    A single ``sendToDevice`` request can carry a distinct body for every
+    (user, device) pair. Instead of doing one request per call of
+    ``MatrixTransport._send_to_device_raw``, the messages are collected for
+    ``send_flush_latency`` seconds and then sent with as few requests as the
+    ``send_max_request_size`` allows.
 
-            if self.is_idle:
-                # There have been no messages to process for a while. Exit.
-                # A new instance will be created by `MatrixTransport._get_retrier()` if necessary
-                self.log.debug("Exiting idle RetryQueue", queue=self)
-                return
-            # wait up to retry_interval (or to be notified) before checking again
-            self._notify_event.wait(self.transport._config.retry_interval_initial)
+    A request carries at most one body per (user, device) pair, so the bodies
+    for a pair are delivered in the order they were submitted.
+    """
+
+    def __init__(self, transport: "MatrixTransport") -> None:
+        self.transport = transport
+        self.greenlet: Optional[gevent.Greenlet] = None
+        self._pending: Dict[Tuple[UserID, str], Deque[Dict[str, str]]] = {}
+        # Number of requests which would have been done without coalescing
+        self.submitted = 0
+        self._submitted_and_sent = 0
+        # Number of requests which were actually done
+        self.requests = 0
 
     @property
-    def is_idle(self) -> bool:
-        return self._idle_since >= RETRY_QUEUE_IDLE_AFTER
+    def requests_saved(self) -> int:
+        return self._submitted_and_sent - self.requests
 
-    def __str__(self) -> str:
-        return self.greenlet.name
+    def submit(self, user_ids: Set[UserID], device_id: str, content: Dict[str, str]) -> None:
+        if not user_ids:
+            return
 
-    def __repr__(self) -> str:
-        return f"<{self.__class__.__name__} for {to_normalized_address(self.receiver)}>"
+        for user_id in user_ids:
+            self._pending.setdefault((user_id, device_id), deque()).append(content)
+        self.submitted += 1
+
+        if self.greenlet is None or self.greenlet.ready():
+            self.greenlet = gevent.spawn_later(
+                self.transport._config.send_flush_latency, self.flush
+            )
+            self.greenlet.name = "ToDeviceBatcher.flush"
+            self.greenlet.link_exception(self.transport.on_error)
+
+    def flush(self) -> None:
+        requests_before = self.requests
+        while self._pending:
+            messages = self._take_request()
+            self.requests += 1
+            self.transport._client.api.send_to_device(
+                event_type="m.room.message", messages=messages
+            )
+
+        self._submitted_and_sent = self.submitted
+        self.transport.log.debug(
+            "Sent coalesced to-device requests",
+            requests=self.requests - requests_before,
+            total_requests=self.requests,
+            total_requests_saved=self.requests_saved,
+        )
+
+    def _take_request(self) -> Dict[UserID, Dict[str, Dict[str, str]]]:
+        messages: Dict[UserID, Dict[str, Dict[str, str]]] = defaultdict(dict)
+        request_size = 0
+        for key in list(self._pending):
+            bodies = self._pending[key]
+            body_size = len(bodies[0]["body"])
+            if (
+                messages
+                and request_size + body_size > self.transport._config.send_max_request_size
+            ):
+                break
+
+            user_id, device_id = key
+            messages[user_id][device_id] = bodies.popleft()
+            request_size += body_size
+
+            # Move the pair to the end, so that the pairs which did not fit are
+            # the first ones in the next request
+            del self._pending[key]
+            if bodies:
+                self._pending[key] = bodies
+
+        return messages
 
 
 class MatrixTransport(Runnable):
@@ -395,6 +526,7 @@ def _http_retry_delay() -> Iterable[float]:
             http_retry_delay=_http_retry_delay,
             environment=environment,
             user_agent=f"Raiden {version}",
+            max_queued_responses=config.sync_max_queued_responses,
         )
 
         if enable_tracing:
@@ -416,6 +548,8 @@ def _http_retry_delay() -> Iterable[float]:
         self.greenlets: List[gevent.Greenlet] = []
 
         self._address_to_retrier: Dict[Address, _RetryQueue] = {}
+        self._retry_scheduler = _RetryScheduler(transport=self)
+        self._to_device_batcher = _ToDeviceBatcher(transport=self)
         self._displayname_cache = DisplayNameCache()
 
         self._broadcast_queue: JoinableQueue[Tuple[str, Message]] = JoinableQueue()
@@ -522,11 +656,8 @@ def start(  # type: ignore
         self._initialize_first_sync()
         self._initialize_sync()
 
-        # (re)start any _RetryQueue which was initialized before start
-        for retrier in self._address_to_retrier.values():
-            if not retrier:
-                self.log.debug("Starting retrier", retrier=retrier)
-                retrier.start()
+        # start the retry scheduler, it also sends the messages queued before start
+        self._start_retry_scheduler()
 
         super().start()  # start greenlet
         self._started = True
@@ -560,6 +691,9 @@ def _run(self) -> None:
         except gevent.GreenletExit:  # killed without exception
             self._stop_event.set()
             gevent.killall(self.greenlets)  # kill children
+            self._retry_scheduler.greenlet.kill()
+            if self._to_device_batcher.greenlet is not None:
+                self._to_device_batcher.greenlet.kill()
             raise  # re-raise to keep killed status
 
     def stop(self) -> None:
@@ -577,21 +711,22 @@ def stop(self) -> None:
         self._stop_event.set()
         self._broadcast_event.set()
 
-        for retrier in self._address_to_retrier.values():
-            if retrier:
-                retrier.notify()
+        self._retry_scheduler.notify()
 
-        # Wait for retriers which already started to exit, then discard them
-        # Retriers which have not been started yet just get discarded
-        # In the meanwhile no other retriers should be started since stop_event is set
+        # Wait for the retry scheduler to exit, then discard the queues. No new
+        # messages are sent in the meanwhile since stop_event is set.
         #
-        # No need to get on them, exceptions are re-raised because of the
+        # No need to get on it, exceptions are re-raised because of the
         # `link_exception`
-        gevent.wait(  # pylint: disable=gevent-disable-wait
-            {r.greenlet for r in self._address_to_retrier.values() if r.greenlet}
-        )
+        if self._retry_scheduler:
+            gevent.wait({self._retry_scheduler.greenlet})  # pylint: disable=gevent-disable-wait
+        self._retry_scheduler = _RetryScheduler(transport=self)
         self._address_to_retrier = {}
 
+        # Send the messages which are waiting to be coalesced
+        if self._to_device_batcher.greenlet is not None:
+            gevent.wait({self._to_device_batcher.greenlet})  # pylint: disable=gevent-disable-wait
+
         # We have to stop the client before the address manager. Otherwise the
         # sync thread might call the address manager after the manager has been
         # stopped.
@@ -620,6 +755,8 @@ def stop(self) -> None:
                 "Transport performance report",
                 counters=counters_most_common,
                 message_ack_durations=self._message_timing_keeper.generate_report(),
+                to_device_requests=self._to_device_batcher.requests,
+                to_device_requests_saved=self._to_device_batcher.requests_saved,
             )
 
         self.log.debug("Matrix stopped", config=self._config)
@@ -666,10 +803,7 @@ def send_async(self, message_queues: List[MessagesQueue]) -> None:
             self.log.debug(
                 "Send async",
                 receiver_address=to_checksum_address(receiver_address),
-                messages=[
-                    redact_secret(DictSerializer.serialize(message))
-                    for message, _ in queue.messages
-                ],
+                messages=LazyField(serialize_redacted, [message for message, _ in queue.messages]),
                 queue_identifier=queue.queue_identifier,
             )
 
@@ -803,6 +937,8 @@ def _validate_matrix_messages(
 
         raiden_messages: List[ReceivedRaidenMessage] = []
         call_messages: List[ReceivedCallMessage] = []
+        # The senders of all messages of the batch are recovered at once
+        parsed_messages: List[Tuple[List[SignedMessage], Address, AddressMetadata]] = []
 
         for message in messages:
 
@@ -838,21 +974,31 @@ def _validate_matrix_messages(
 
             sender_metadata: AddressMetadata = dict(user_id=UserID(sender_id))
             if is_raiden_message:
-                for parsed_message in validate_and_parse_message(
-                    message["content"]["body"], peer_address
-                ):
-                    raiden_message = ReceivedRaidenMessage(
-                        message=parsed_message,
-                        sender=peer_address,
-                        sender_metadata=sender_metadata,
+                parsed_messages.append(
+                    (
+                        parse_signed_messages(message["content"]["body"], peer_address),
+                        peer_address,
+                        sender_metadata,
                     )
-                    raiden_messages.append(raiden_message)
+                )
             if is_call_message:
                 call_message = ReceivedCallMessage(
                     message=message,
                     sender=peer_address,
                 )
                 call_messages.append(call_message)
+
+        recover_senders(
+            [message for signed_messages, _, _ in parsed_messages for message in signed_messages]
+        )
+        for signed_messages, peer_address, sender_metadata in parsed_messages:
+            for parsed_message in validate_senders(signed_messages, peer_address):
+                raiden_message = ReceivedRaidenMessage(
+                    message=parsed_message,
+                    sender=peer_address,
+                    sender_metadata=sender_metadata,
+                )
+                raiden_messages.append(raiden_message)
         return raiden_messages, call_messages
 
     def _process_raiden_messages(self, all_messages: List[ReceivedRaidenMessage]) -> None:
@@ -904,16 +1050,20 @@ def _handle_messages(self, messages: List[MatrixMessage]) -> bool:
     def _get_retrier(self, receiver: Address) -> _RetryQueue:
         """Construct and return a _RetryQueue for receiver"""
         retrier = self._address_to_retrier.get(receiver)
-        # The RetryQueue may have exited due to being idle
-        if retrier is None or retrier.greenlet.ready():
+        if retrier is None:
             retrier = _RetryQueue(transport=self, receiver=receiver)
             self._address_to_retrier[receiver] = retrier
-            if not self._stop_event.ready():
-                retrier.start()
-            # ``Runnable.start()`` may re-create the internal greenlet
-            retrier.greenlet.link_exception(self.on_error)
+        if not self._stop_event.ready():
+            self._start_retry_scheduler()
         return retrier
 
+    def _start_retry_scheduler(self) -> None:
+        if self._retry_scheduler:
+            return
+        self._retry_scheduler.start()
+        # ``Runnable.start()`` may re-create the internal greenlet
+        self._retry_scheduler.greenlet.link_exception(self.on_error)
+
     def _send_with_retry(self, queue: MessagesQueue) -> None:
         recipient = queue.queue_identifier.recipient
         retrier = self._get_retrier(recipient)
@@ -936,23 +1086,21 @@ def _send_to_device_raw(
         device_id: str = "*",
         message_type: MatrixMessageType = MatrixMessageType.TEXT,
     ) -> None:
-        # Sends data to multiple users via to-device in a single Matrix API call
+        # Sends data to multiple users via to-device. The request is shared with
+        # the messages to other receivers which are sent within the flush latency.
         assert self._raiden_service is not None, "_raiden_service not set"
 
-        messages = {
-            user_id: {device_id: {"msgtype": message_type.value, "body": data}}
-            for user_id in user_ids
-        }
-
         self.log.debug(
             "Send to-device message",
             device_id=device_id,
             receivers=user_ids,
             multicast=bool(len(user_ids) > 1),
-            data=data.replace("\n", "\\n"),
+            data=LazyField(data.replace, "\n", "\\n"),
         )
 
-        self._client.api.send_to_device(event_type="m.room.message", messages=messages)
+        self._to_device_batcher.submit(
+            user_ids, device_id, {"msgtype": message_type.value, "body": data}
+        )
 
     def _send_raw(
         self,
@@ -976,7 +1124,7 @@ def _send_raw(
                 "Cannot send raw message without address metadata.",
                 receiver=to_checksum_address(receiver_address),
                 send_medium=communication_medium.value,
-                data=data.replace("\n", "\\n"),
+                data=LazyField(data.replace, "\n", "\\n"),
             )
             return
         else:
@@ -986,7 +1134,7 @@ def _send_raw(
             "Send raw message",
             receiver=to_checksum_address(receiver_address),
             send_medium=communication_medium.value,
-            data=data.replace("\n", "\\n"),
+            data=LazyField(data.replace, "\n", "\\n"),
         )
 
         msg = "Only to-device messages are supported."
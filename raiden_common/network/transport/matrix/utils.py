@@ -58,6 +58,10 @@
 # The maximum matrix event size is 65 kB. Since events are larger than just the message
 # content we chose a conservative value
 MATRIX_MAX_BATCH_SIZE = 50_000
+# Number of messages of which the senders are recovered by one task of the threadpool.
+# The senders of smaller batches are recovered right away, since handing them over to
+# a thread costs about as much as recovering them.
+RECOVER_SENDERS_CHUNK_SIZE = 32
 JSONResponse = Dict[str, Any]
 capabilities_schema = CapabilitiesSchema()
 
@@ -548,7 +552,13 @@ def make_client(
 
 
 def validate_and_parse_message(data: Any, peer_address: Address) -> List[Message]:
-    messages: List[Message] = []
+    messages = parse_signed_messages(data, peer_address)
+    recover_senders(messages)
+    return validate_senders(messages, peer_address)
+
+
+def parse_signed_messages(data: Any, peer_address: Address) -> List[SignedMessage]:
+    messages: List[SignedMessage] = []
 
     if not isinstance(data, str):
         log.warning(
@@ -579,6 +589,40 @@ def validate_and_parse_message(data: Any, peer_address: Address) -> List[Message
                 peer_address=to_checksum_address(peer_address),
             )
             continue
+        messages.append(message)
+
+    return messages
+
+
+def recover_senders(messages: Sequence[SignedMessage]) -> None:
+    """Recover the senders of a batch of signed messages
+
+    The recovery of the public keys is done by the native secp256k1 library,
+    which releases the GIL. The senders of large batches are therefore
+    recovered by the threads of the hub's threadpool, in parallel and without
+    blocking the other greenlets. The senders are cached by the messages.
+    """
+    if len(messages) <= RECOVER_SENDERS_CHUNK_SIZE:
+        _recover_senders(messages)
+        return
+
+    threadpool = gevent.get_hub().threadpool
+    pending = [
+        threadpool.spawn(_recover_senders, messages[start : start + RECOVER_SENDERS_CHUNK_SIZE])
+        for start in range(0, len(messages), RECOVER_SENDERS_CHUNK_SIZE)
+    ]
+    for result in pending:
+        result.get()
+
+
+def _recover_senders(messages: Sequence[SignedMessage]) -> List[Optional[Address]]:
+    return [message.sender for message in messages]
+
+
+def validate_senders(messages: List[SignedMessage], peer_address: Address) -> List[Message]:
+    valid_messages: List[Message] = []
+
+    for message in messages:
         if message.sender != peer_address:
             log.warning(
                 "Message not signed by sender!",
@@ -587,9 +631,9 @@ def validate_and_parse_message(data: Any, peer_address: Address) -> List[Message
                 peer_address=to_checksum_address(peer_address),
             )
             continue
-        messages.append(message)
+        valid_messages.append(message)
 
-    return messages
+    return valid_messages
 
 
 def my_place_or_yours(our_address: Address, partner_address: Address) -> Address:
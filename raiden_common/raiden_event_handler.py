@@ -73,7 +73,7 @@
     SendSecretReveal,
     SendUnlock,
 )
-from raiden_common.transfer.state import ChainState, NettingChannelEndState
+from raiden_common.transfer.state import ChainState, LocksDict, NettingChannelEndState
 from raiden_common.transfer.views import (
     get_channelstate_by_canonical_identifier,
     get_channelstate_by_token_network_and_partner,
@@ -131,7 +131,7 @@ def _update_lock_info(
     old_state.secrethashes_to_lockedlocks.update(
         {secret: unlock.lock for secret, unlock in old_state.secrethashes_to_unlockedlocks.items()}
     )
-    old_state.secrethashes_to_unlockedlocks = {}
+    old_state.secrethashes_to_unlockedlocks.clear()
 
     # In the time between the states, some locks might have been unlocked
     # on-chain. Update their state to "on-chain unlocked".
@@ -152,11 +152,13 @@ def _update_lock_info(
     # on-chain unlocks, so we wrongly consider the tokens in the outgoing
     # channel to be ours and send an on-chain unlock although we won't
     # unlock any tokens to our benefit.
-    old_state.secrethashes_to_lockedlocks = {
-        secret: lock
-        for secret, lock in old_state.secrethashes_to_lockedlocks.items()
-        if secret in chain_state.payment_mapping.secrethashes_to_task
-    }
+    old_state.secrethashes_to_lockedlocks = LocksDict(
+        {
+            secret: lock
+            for secret, lock in old_state.secrethashes_to_lockedlocks.items()
+            if secret in chain_state.payment_mapping.secrethashes_to_task
+        }
+    )
 
 
 class EventHandler(ABC):
@@ -59,7 +59,8 @@
 from raiden_common.services import send_pfs_update, update_monitoring_service_from_balance_proof
 from raiden_common.settings import RaidenConfig
 from raiden_common.storage import sqlite, wal
-from raiden_common.storage.serialization import DictSerializer, JSONSerializer
+from raiden_common.storage.compaction import StateCompactor
+from raiden_common.storage.serialization import BinarySerializer, JSONSerializer
 from raiden_common.storage.sqlite import HIGH_STATECHANGE_ULID, Range
 from raiden_common.storage.wal import WriteAheadLog
 from raiden_common.tasks import AlarmTask
@@ -111,7 +112,7 @@
 )
 from raiden_common.utils.formatting import lpex, to_checksum_address
 from raiden_common.utils.gevent import spawn_named
-from raiden_common.utils.logging import redact_secret
+from raiden_common.utils.logging import LazyField, serialize_redacted
 from raiden_common.utils.runnable import Runnable
 from raiden_common.utils.secrethash import sha256_secrethash
 from raiden_common.utils.signer import LocalSigner, Signer
@@ -404,6 +405,8 @@ def __init__(
 
         self.contract_manager: ContractManager = ContractManager(config.contracts_path)
         self.wal: Optional[WriteAheadLog] = None
+        self.compactor: Optional[StateCompactor] = None
+        self.compaction_greenlet: Optional[Greenlet] = None
         self.db_lock: Optional[filelock.UnixFileLock] = None
 
         if pfs_proxy is None:
@@ -542,6 +545,12 @@ def stop(self) -> None:
         assert (
             self.wal
         ), f"The Service must have been started before it can be stopped. node:{self!r}"
+        if self.compaction_greenlet is not None:
+            # Every step of the compaction is a transaction, it can be
+            # interrupted in between.
+            self.compaction_greenlet.kill()
+            self.compaction_greenlet = None
+        self.wal.flush()
         self.wal.storage.close()
         self.wal = None
 
@@ -639,6 +648,15 @@ def _make_initial_state(self) -> ChainState:
 
         return initial_state
 
+    def _log_replay_progress(self, progress: wal.ReplayProgress) -> None:
+        log.info(
+            "Replaying state changes",
+            node=to_checksum_address(self.address),
+            replayed=progress.replayed,
+            total=progress.total,
+            eta=progress.eta,
+        )
+
     def _initialize_wal(self) -> None:
         if self.database_dir is not None:
             try:
@@ -656,7 +674,13 @@ def _initialize_wal(self) -> None:
         self.maybe_upgrade_db()
 
         storage = sqlite.SerializedSQLiteStorage(
-            database_path=self.config.database_path, serializer=JSONSerializer()
+            database_path=self.config.database_path,
+            serializer=BinarySerializer()
+            if self.config.storage.binary_encoding
+            else JSONSerializer(),
+            journal_mode=self.config.storage.journal_mode,
+            synchronous=self.config.storage.synchronous,
+            wal_autocheckpoint=self.config.storage.wal_autocheckpoint,
         )
         storage.update_version()
         storage.log_run()
@@ -677,6 +701,7 @@ def _initialize_wal(self) -> None:
                 state_change_range=Range(state_change_start, HIGH_STATECHANGE_ULID),
                 storage=storage,
                 transition_function=node.state_transition,  # type: ignore
+                progress=self._log_replay_progress,
             )
         except SerializationError:
             raise RaidenUnrecoverableError(
@@ -698,7 +723,27 @@ def _initialize_wal(self) -> None:
         msg = "The state must be a ChainState instance."
         assert isinstance(state, ChainState), msg
 
-        self.wal = WriteAheadLog(state, storage, node.state_transition)
+        self.wal = WriteAheadLog(
+            state,
+            storage,
+            node.state_transition,
+            copy_on_write=self.config.storage.copy_on_write_state,
+            group_commit_window=self.config.storage.group_commit_window,
+            group_commit_max_batches=self.config.storage.group_commit_max_batches,
+            checkpoint_on_snapshot=self.config.storage.checkpoint_on_snapshot,
+            delta_snapshots=self.config.storage.delta_snapshots,
+            snapshot_rebase_interval=self.config.storage.snapshot_rebase_interval,
+            snapshot_keep_bases=self.config.storage.snapshot_keep_bases,
+            background_snapshots=self.config.storage.background_snapshots,
+        )
+
+        if self.config.storage.compaction:
+            self.compactor = StateCompactor(
+                self.wal,
+                batch_size=self.config.storage.compaction_batch_size,
+                keep_payment_history=self.config.storage.compaction_keep_payment_history,
+                vacuum_pages=self.config.storage.compaction_vacuum_pages,
+            )
 
         # The `Block` state change is dispatched only after all the events
         # for that given block have been processed, filters can be safely
@@ -889,10 +934,7 @@ def handle_state_changes(self, state_changes: List[StateChange]) -> List[Greenle
         log.debug(
             "State changes",
             node=to_checksum_address(self.address),
-            state_changes=[
-                redact_secret(DictSerializer.serialize(state_change))
-                for state_change in state_changes
-            ],
+            state_changes=LazyField(serialize_redacted, state_changes),
         )
 
         raiden_events = []
@@ -934,6 +976,7 @@ def _trigger_state_change_effects(
         monitoring_updates: Dict[CanonicalIdentifier, BalanceProofStateChange] = {}
         pfs_fee_updates: Set[CanonicalIdentifier] = set()
         pfs_capacity_updates: Set[CanonicalIdentifier] = set()
+        latest_block: Optional[Block] = None
 
         for state_change in state_changes:
             if self.config.services.monitoring_enabled and isinstance(
@@ -952,10 +995,15 @@ def _trigger_state_change_effects(
                 else:
                     pfs_capacity_updates.add(canonical_identifier)
             if isinstance(state_change, Block):
-                self.transport.expire_services_addresses(
-                    self.rpc_client.get_block(state_change.block_hash)["timestamp"],
-                    state_change.block_number,
-                )
+                latest_block = state_change
+
+        # The registrations of the services only expire, checking them against
+        # the newest block of the batch is enough
+        if latest_block is not None:
+            self.transport.expire_services_addresses(
+                self.rpc_client.get_block(latest_block.block_hash)["timestamp"],
+                latest_block.block_number,
+            )
 
         for event in events:
             if isinstance(event, PFS_UPDATE_FEE_EVENTS):
@@ -982,7 +1030,7 @@ def _trigger_state_change_effects(
         log.debug(
             "Raiden events",
             node=to_checksum_address(self.address),
-            raiden_events=[redact_secret(DictSerializer.serialize(event)) for event in events],
+            raiden_events=LazyField(serialize_redacted, events),
         )
 
         self.state_change_qty += len(state_changes)
@@ -1000,6 +1048,20 @@ def _maybe_snapshot(self) -> None:
             log.debug("Storing snapshot")
             self.wal.snapshot(self.state_change_qty)
             self.state_change_qty_snapshot = self.state_change_qty
+            self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        """Compact the database in the background, unless the previous
+        compaction is still running.
+        """
+        if self.compactor is None:
+            return
+
+        if self.compaction_greenlet is not None and not self.compaction_greenlet.ready():
+            return
+
+        self.compaction_greenlet = spawn_named("rs-compaction", self.compactor.run)
+        self.compaction_greenlet.link_exception(self.on_error)
 
     def async_handle_events(
         self, chain_state: ChainState, raiden_events: List[RaidenEvent]
@@ -1147,8 +1209,15 @@ def _best_effort_synchronize_with_confirmed_head(
         )
         assert self.blockchain_events, msg
 
-        state_changes = []
-        raiden_events = []
+        state_changes: List[StateChange] = []
+        raiden_events: List[Event] = []
+
+        # The `Block` of a batch without blockchain events is only dispatched
+        # once the next batch has events or the synchronization stops. A run of
+        # such batches is handled by a single transition to its last block,
+        # which saves a transition, a write to the WAL and a `get_block`
+        # request per batch while catching up.
+        deferred_block: Optional[Block] = None
 
         guard = SyncTimeout(current_confirmed_head, timeout)
         while guard.should_continue(self.blockchain_events.last_fetched_block):
@@ -1157,8 +1226,26 @@ def _best_effort_synchronize_with_confirmed_head(
                 # No blocks could be fetched (due to timeout), retry
                 continue
 
+            block_state_change = Block(
+                block_number=poll_result.polled_block_number,
+                gas_limit=poll_result.polled_block_gas_limit,
+                block_hash=poll_result.polled_block_hash,
+            )
+            if not poll_result.events:
+                deferred_block = block_state_change
+                self._log_sync_progress(poll_result.polled_block_number, current_confirmed_head)
+                continue
+
             assert self.wal, "raiden.wal not set"
             with self.wal.process_state_change_atomically() as dispatcher:
+                # The blocks before the events must be handled first, e.g. a
+                # lock may expire before its secret is registered on-chain.
+                if deferred_block is not None:
+                    events = dispatcher.dispatch(deferred_block)
+                    state_changes.append(deferred_block)
+                    raiden_events.extend(events)
+                    deferred_block = None
+
                 for event in poll_result.events:
                     # Important: `blockchainevent_to_statechange` has to be called
                     # with the block of the current confirmed head! An unconfirmed
@@ -1210,24 +1297,23 @@ def _best_effort_synchronize_with_confirmed_head(
                 # deposit will be off-by-one, and it will point to the block
                 # immediately before the channel existed. This breaks a proxy
                 # precondition which crashes the client.
-                block_state_change = Block(
-                    block_number=poll_result.polled_block_number,
-                    gas_limit=poll_result.polled_block_gas_limit,
-                    block_hash=poll_result.polled_block_hash,
-                )
                 events = dispatcher.dispatch(block_state_change)
                 state_changes.append(block_state_change)
                 raiden_events.extend(events)
 
             self._log_sync_progress(poll_result.polled_block_number, current_confirmed_head)
 
+        if deferred_block is not None:
+            assert self.wal, "raiden.wal not set"
+            with self.wal.process_state_change_atomically() as dispatcher:
+                events = dispatcher.dispatch(deferred_block)
+                state_changes.append(deferred_block)
+                raiden_events.extend(events)
+
         log.debug(
             "State changes",
             node=to_checksum_address(self.address),
-            state_changes=[
-                redact_secret(DictSerializer.serialize(state_change))
-                for state_change in state_changes
-            ],
+            state_changes=LazyField(serialize_redacted, state_changes),
         )
 
         event_greenlets = self._trigger_state_change_effects(
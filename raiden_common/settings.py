@@ -4,7 +4,12 @@
 from eth_typing import BlockNumber
 from eth_utils import denoms, to_hex
 
-from raiden_common.constants import MATRIX_AUTO_SELECT_SERVER, Environment
+from raiden_common.constants import (
+    MATRIX_AUTO_SELECT_SERVER,
+    Environment,
+    SQLiteJournalMode,
+    SQLiteSynchronous,
+)
 from raiden_common.network.pathfinding import PFSConfig
 from raiden_common.utils.typing import (
     Address,
@@ -41,6 +46,14 @@
 # - Network latency
 # - The Raiden node might not be able to process the messages immediately
 DEFAULT_TRANSPORT_MATRIX_SYNC_LATENCY = 15_000
+# Maximum number of sync responses waiting to be processed, the next sync is delayed
+# until the processing catches up.
+DEFAULT_TRANSPORT_MATRIX_SYNC_MAX_QUEUED_RESPONSES = 10
+# Time to wait for messages to other receivers before a to-device request is sent,
+# all messages sent in the meantime are coalesced into the same request.
+DEFAULT_TRANSPORT_MATRIX_SEND_FLUSH_LATENCY = 0.01
+# Upper bound for the summed up sizes of the message bodies of a to-device request
+DEFAULT_TRANSPORT_MATRIX_SEND_MAX_REQUEST_SIZE = 500_000
 DEFAULT_MATRIX_KNOWN_SERVERS = {
     Environment.PRODUCTION: (
         "https://raw.githubusercontent.com/raiden-network/raiden-service-bundle"
@@ -146,6 +159,9 @@ class MatrixTransportConfig:
     available_servers: List[str]
     sync_timeout: int = DEFAULT_TRANSPORT_MATRIX_SYNC_TIMEOUT
     sync_latency: int = DEFAULT_TRANSPORT_MATRIX_SYNC_LATENCY
+    sync_max_queued_responses: int = DEFAULT_TRANSPORT_MATRIX_SYNC_MAX_QUEUED_RESPONSES
+    send_flush_latency: float = DEFAULT_TRANSPORT_MATRIX_SEND_FLUSH_LATENCY
+    send_max_request_size: int = DEFAULT_TRANSPORT_MATRIX_SEND_MAX_REQUEST_SIZE
     capabilities_config: CapabilitiesConfig = CapabilitiesConfig()
 
 
@@ -174,6 +190,54 @@ class BlockchainConfig:
     block_batch_size_config: BlockBatchSizeConfig = BlockBatchSizeConfig()
 
 
+@dataclass
+class StorageConfig:
+    #: Share the unmodified channels and payment tasks with the previous state
+    #: instead of copying the whole `ChainState` for every batch of state
+    #: changes. See `raiden_common.storage.copy_on_write`.
+    copy_on_write_state: bool = False
+    #: Seconds a batch of state changes waits for other batches to share its
+    #: database commit, `None` commits every batch on its own.
+    group_commit_window: Optional[float] = None
+    #: Commit the group early once it has this many batches.
+    group_commit_max_batches: int = 64
+    #: WAL allows other processes, e.g. `tools/debugging/replay_wal.py`, to
+    #: read the database while the node is running.
+    journal_mode: SQLiteJournalMode = SQLiteJournalMode.PERSIST
+    #: `None` keeps SQLite's default, which is FULL.
+    synchronous: Optional[SQLiteSynchronous] = None
+    #: Pages in the write-ahead log before SQLite checkpoints it automatically,
+    #: `None` keeps SQLite's default.
+    wal_autocheckpoint: Optional[int] = None
+    #: Checkpoint the write-ahead log after every state snapshot.
+    checkpoint_on_snapshot: bool = True
+    #: Store only the channels and payment tasks which changed since the last
+    #: full snapshot. See `raiden_common.storage.delta_snapshot`.
+    delta_snapshots: bool = False
+    #: Number of delta snapshots written between two full snapshots.
+    snapshot_rebase_interval: int = 10
+    #: Delete all but this many full snapshots, with their deltas. `None`
+    #: keeps every snapshot.
+    snapshot_keep_bases: Optional[int] = None
+    #: Serialize and write the snapshots in the background, without blocking
+    #: the dispatch of state changes.
+    background_snapshots: bool = False
+    #: Write new state changes, events and snapshots with the compact
+    #: `BinarySerializer` instead of JSON. Databases with rows in either
+    #: encoding are readable independently of this setting.
+    binary_encoding: bool = False
+    #: Delete the state changes and events which are not needed to restore
+    #: the state after every snapshot. See `raiden_common.storage.compaction`.
+    compaction: bool = False
+    #: Number of state changes deleted per transaction by the compaction.
+    compaction_batch_size: int = 1000
+    #: Keep the events of the payment history, and their state changes.
+    compaction_keep_payment_history: bool = True
+    #: Free pages returned to the file system per step after the compaction,
+    #: `None` keeps them for reuse by SQLite.
+    compaction_vacuum_pages: Optional[int] = 1024
+
+
 @dataclass
 class RestApiConfig:
     rest_api_enabled: bool = True
@@ -206,6 +270,7 @@ class RaidenConfig:
     blockchain: BlockchainConfig = BlockchainConfig()
     mediation_fees: MediationFeeConfig = MediationFeeConfig()
     services: ServiceConfig = ServiceConfig()
+    storage: StorageConfig = StorageConfig()
     development_environment: ContractDevEnvironment = ContractDevEnvironment.DEMO
 
     transport_type: str = "matrix"
@@ -0,0 +1,254 @@
+"""Compaction of the state changes and events.
+
+Restoring the node only needs the newest snapshot and the state changes
+written after it, but the `state_changes` and `state_events` tables are never
+cleaned up. Older rows are still read by the lookups of
+`raiden_common.storage.restore`, which search the balance proofs of a channel
+to settle it, the balance proofs with the on-chain locksroots to unlock it,
+and the transfer of a payment task. The state is then
+restored at the found state change, which needs the snapshot before it and
+every state change in between.
+
+The compaction keeps the state changes newer than the full snapshot preceding
+all of these records, the *horizon*, and deletes the older ones in small
+transactions, which are interleaved with the writes of the node.
+"""
+import time
+
+import gevent
+import structlog
+
+from raiden_common.constants import LOCKSROOT_OF_NO_LOCKS
+from raiden_common.storage.restore import (
+    get_event_with_balance_proof_by_balance_hash,
+    get_event_with_balance_proof_by_locksroot,
+    get_state_change_with_balance_proof_by_balance_hash,
+    get_state_change_with_balance_proof_by_locksroot,
+    get_state_change_with_transfer_by_secrethash,
+)
+from raiden_common.storage.sqlite import (
+    HIGH_STATECHANGE_ULID,
+    LOW_STATECHANGE_ULID,
+    EventRecord,
+    StateChangeID,
+    StateChangeRecord,
+)
+from raiden_common.storage.wal import WriteAheadLog
+from raiden_common.transfer import views
+from raiden_common.transfer.identifiers import CanonicalIdentifier
+from raiden_common.transfer.state import ChainState
+from raiden_common.utils.typing import (
+    Address,
+    BalanceHash,
+    Dict,
+    List,
+    Locksroot,
+    Optional,
+    SecretHash,
+    Tuple,
+    Union,
+)
+
+log = structlog.get_logger(__name__)
+
+# Number of state changes deleted per transaction, and number of free pages
+# returned to the file system per vacuum step.
+COMPACTION_BATCH_SIZE = 1000
+COMPACTION_VACUUM_PAGES = 1024
+
+_BalanceProofKey = Tuple[CanonicalIdentifier, BalanceHash, Address]
+# The address is the one of the channel end which has the locksroot on-chain
+_LocksrootKey = Tuple[CanonicalIdentifier, Locksroot, Address]
+
+
+def _state_change_identifier(
+    record: Optional[Union[StateChangeRecord, EventRecord]]
+) -> Optional[StateChangeID]:
+    if record is None:
+        return None
+    return record.state_change_identifier
+
+
+class StateCompactor:
+    """Deletes the state changes and events older than the horizon.
+
+    The lookups of the pinned records are full scans of the tables, their
+    results are cached. A balance proof is only replaced by newer ones, so a
+    cached record stays valid until the balance proof of the channel changes.
+    The on-chain locksroots are only set once the channel is settled, when no
+    balance proofs are exchanged anymore.
+    """
+
+    def __init__(
+        self,
+        wal: WriteAheadLog,
+        batch_size: int = COMPACTION_BATCH_SIZE,
+        keep_payment_history: bool = True,
+        vacuum_pages: Optional[int] = COMPACTION_VACUUM_PAGES,
+    ) -> None:
+        self.wal = wal
+        self.batch_size = batch_size
+        self.keep_payment_history = keep_payment_history
+        self.vacuum_pages = vacuum_pages
+
+        self._balance_proof_pins: Dict[_BalanceProofKey, Optional[StateChangeID]] = {}
+        self._locksroot_pins: Dict[_LocksrootKey, Optional[StateChangeID]] = {}
+        self._transfer_pins: Dict[SecretHash, Optional[StateChangeID]] = {}
+
+    def _pinned_state_changes(self, chain_state: ChainState) -> List[StateChangeID]:
+        """Return the state changes the lookups of `storage.restore` can
+        return for the current state.
+        """
+        storage = self.wal.storage
+        balance_proof_pins: Dict[_BalanceProofKey, Optional[StateChangeID]] = {}
+        locksroot_pins: Dict[_LocksrootKey, Optional[StateChangeID]] = {}
+        transfer_pins: Dict[SecretHash, Optional[StateChangeID]] = {}
+
+        for channel_state in views.list_all_channelstate(chain_state):
+            canonical_identifier = channel_state.canonical_identifier
+            partner_address = channel_state.partner_state.address
+
+            partner_balance_proof = channel_state.partner_state.balance_proof
+            if partner_balance_proof is not None:
+                key = (canonical_identifier, partner_balance_proof.balance_hash, partner_address)
+                if key not in self._balance_proof_pins:
+                    self._balance_proof_pins[key] = _state_change_identifier(
+                        get_state_change_with_balance_proof_by_balance_hash(
+                            storage=storage,
+                            canonical_identifier=canonical_identifier,
+                            balance_hash=partner_balance_proof.balance_hash,
+                            sender=partner_address,
+                        )
+                    )
+                balance_proof_pins[key] = self._balance_proof_pins[key]
+
+            our_balance_proof = channel_state.our_state.balance_proof
+            if our_balance_proof is not None:
+                key = (canonical_identifier, our_balance_proof.balance_hash, partner_address)
+                if key not in self._balance_proof_pins:
+                    self._balance_proof_pins[key] = _state_change_identifier(
+                        get_event_with_balance_proof_by_balance_hash(
+                            storage=storage,
+                            canonical_identifier=canonical_identifier,
+                            balance_hash=our_balance_proof.balance_hash,
+                            recipient=partner_address,
+                        )
+                    )
+                balance_proof_pins[key] = self._balance_proof_pins[key]
+
+            # The balance proofs needed to unlock a settled channel, which can
+            # be older than the current ones if the channel was closed with an
+            # older balance proof.
+            partner_locksroot = channel_state.partner_state.onchain_locksroot
+            if partner_locksroot != LOCKSROOT_OF_NO_LOCKS:
+                locksroot_key = (canonical_identifier, partner_locksroot, partner_address)
+                if locksroot_key not in self._locksroot_pins:
+                    self._locksroot_pins[locksroot_key] = _state_change_identifier(
+                        get_state_change_with_balance_proof_by_locksroot(
+                            storage=storage,
+                            canonical_identifier=canonical_identifier,
+                            locksroot=partner_locksroot,
+                            sender=partner_address,
+                        )
+                    )
+                locksroot_pins[locksroot_key] = self._locksroot_pins[locksroot_key]
+
+            our_locksroot = channel_state.our_state.onchain_locksroot
+            if our_locksroot != LOCKSROOT_OF_NO_LOCKS:
+                locksroot_key = (
+                    canonical_identifier,
+                    our_locksroot,
+                    channel_state.our_state.address,
+                )
+                if locksroot_key not in self._locksroot_pins:
+                    self._locksroot_pins[locksroot_key] = _state_change_identifier(
+                        get_event_with_balance_proof_by_locksroot(
+                            storage=storage,
+                            canonical_identifier=canonical_identifier,
+                            locksroot=our_locksroot,
+                            recipient=partner_address,
+                        )
+                    )
+                locksroot_pins[locksroot_key] = self._locksroot_pins[locksroot_key]
+
+        for secrethash in views.get_all_transfer_tasks(chain_state):
+            if secrethash not in self._transfer_pins:
+                self._transfer_pins[secrethash] = _state_change_identifier(
+                    get_state_change_with_transfer_by_secrethash(
+                        storage=storage, secrethash=secrethash
+                    )
+                )
+            transfer_pins[secrethash] = self._transfer_pins[secrethash]
+
+        # Only the records of the current state are kept, the cache does not
+        # grow with closed channels and finished payments.
+        self._balance_proof_pins = balance_proof_pins
+        self._locksroot_pins = locksroot_pins
+        self._transfer_pins = transfer_pins
+
+        pins = (
+            list(balance_proof_pins.values())
+            + list(locksroot_pins.values())
+            + list(transfer_pins.values())
+        )
+        return [pin for pin in pins if pin is not None]
+
+    def horizon(self, chain_state: ChainState) -> Optional[StateChangeID]:
+        """Return the state change of the oldest full snapshot which must be
+        kept, the state changes before it can be deleted. `None` if nothing
+        can be deleted.
+        """
+        pins = self._pinned_state_changes(chain_state)
+        oldest_needed = min(pins, default=HIGH_STATECHANGE_ULID)
+
+        return self.wal.storage.database.get_snapshot_state_change_before(oldest_needed)
+
+    def run(self) -> None:
+        """Compact the database, yielding to the other greenlets between the
+        transactions.
+        """
+        start = time.monotonic()
+        horizon = self.horizon(self.wal.get_current_state())
+        if horizon is None:
+            return
+
+        deleted_state_changes = 0
+        deleted_events = 0
+        after = LOW_STATECHANGE_ULID
+        while True:
+            with self.wal.maintenance() as database:
+                compacted = database.compact_state_changes(
+                    before=horizon,
+                    limit=self.batch_size,
+                    after=after,
+                    keep_payment_history=self.keep_payment_history,
+                )
+
+            if compacted is None:
+                break
+
+            deleted_state_changes += compacted.deleted_state_changes
+            deleted_events += compacted.deleted_events
+            after = compacted.last_identifier
+            gevent.idle()
+
+        freed_pages = 0
+        if self.vacuum_pages is not None:
+            while True:
+                with self.wal.maintenance() as database:
+                    freed = database.incremental_vacuum(self.vacuum_pages)
+
+                if freed == 0:
+                    break
+
+                freed_pages += freed
+                gevent.idle()
+
+        log.debug(
+            "Database compacted",
+            horizon=horizon,
+            deleted_state_changes=deleted_state_changes,
+            deleted_events=deleted_events,
+            freed_pages=freed_pages,
+            duration=time.monotonic() - start,
+        )
@@ -0,0 +1,152 @@
+"""Structural sharing for the `ChainState` clone done by the write-ahead log.
+
+Every batch of state changes is applied to a copy of the current state, if
+the batch fails the copy is discarded and the current state is left untouched.
+Copying the complete `ChainState` is proportional to the number of channels
+and payment tasks, even though a single state change usually touches only
+one of each.
+
+The clone produced here copies the "spine" of the state tree eagerly (the
+chain state, the registries and the token networks, without their channels),
+and shares the channels, payment tasks and message queues with the original
+state until they are accessed. Accessing one of these values through the clone
+creates a private copy of it, so the original state is never modified.
+
+After the batch is committed `materialize_clone` replaces the lazy containers
+with plain dictionaries, so that readers of the new state don't pay for the
+copy-on-access bookkeeping.
+"""
+from collections import defaultdict
+from copy import copy
+
+from raiden_common.transfer.state import (
+    ChainState,
+    ChannelDeadlinesState,
+    PaymentMappingState,
+    PendingTransactionsIndexState,
+    TokenNetworkRegistryState,
+    TokenNetworkState,
+)
+from raiden_common.utils.copy import CopyOnAccessDict, deepcopy
+from raiden_common.utils.typing import Any, Dict
+
+
+def _clone_token_network(
+    token_network: TokenNetworkState, memo: Dict[int, Any]
+) -> TokenNetworkState:
+    token_network_copy = copy(token_network)
+    token_network_copy.channelidentifiers_to_channels = CopyOnAccessDict(
+        token_network.channelidentifiers_to_channels, copy_function=deepcopy, memo=memo
+    )
+    token_network_copy.partneraddresses_to_channelidentifiers = defaultdict(
+        list,
+        {
+            partner: list(channel_identifiers)
+            for partner, channel_identifiers in (
+                token_network.partneraddresses_to_channelidentifiers.items()
+            )
+        },
+    )
+    return token_network_copy
+
+
+def _clone_token_network_registry(
+    registry: TokenNetworkRegistryState, memo: Dict[int, Any]
+) -> TokenNetworkRegistryState:
+    registry_copy = copy(registry)
+
+    # `token_network_list` and `tokennetworkaddresses_to_tokennetworks` hold
+    # the same objects, the copies must be shared as well.
+    def clone(token_network: TokenNetworkState) -> TokenNetworkState:
+        token_network_copy = memo.get(id(token_network))
+        if token_network_copy is None:
+            token_network_copy = _clone_token_network(token_network, memo)
+            memo[id(token_network)] = token_network_copy
+        return token_network_copy
+
+    registry_copy.token_network_list = [
+        clone(token_network) for token_network in registry.token_network_list
+    ]
+    registry_copy.tokennetworkaddresses_to_tokennetworks = {
+        address: clone(token_network)
+        for address, token_network in registry.tokennetworkaddresses_to_tokennetworks.items()
+    }
+    registry_copy.tokenaddresses_to_tokennetworkaddresses = dict(
+        registry.tokenaddresses_to_tokennetworkaddresses
+    )
+    return registry_copy
+
+
+def clone_chain_state(chain_state: ChainState) -> ChainState:
+    """Return a copy of `chain_state` which shares the channels, payment tasks
+    and message queues with the original until they are accessed.
+
+    The original `chain_state` must not be modified while the clone is in
+    use.
+    """
+    memo: Dict[int, Any] = {}
+
+    clone = copy(chain_state)
+    clone.pseudo_random_generator = deepcopy(chain_state.pseudo_random_generator)
+    clone.identifiers_to_tokennetworkregistries = {
+        address: _clone_token_network_registry(registry, memo)
+        for address, registry in chain_state.identifiers_to_tokennetworkregistries.items()
+    }
+    clone.payment_mapping = PaymentMappingState(
+        secrethashes_to_task=CopyOnAccessDict(
+            chain_state.payment_mapping.secrethashes_to_task, copy_function=deepcopy, memo=memo
+        )
+    )
+    clone.pending_transactions = list(chain_state.pending_transactions)
+    clone.pending_transactions_index = None
+    index = chain_state.pending_transactions_index
+    if index is not None and index.transactions is chain_state.pending_transactions:
+        clone.pending_transactions_index = PendingTransactionsIndexState(
+            transactions=clone.pending_transactions,
+            members=set(index.members),
+            by_channel={key: list(value) for key, value in index.by_channel.items()},
+            by_secret={key: list(value) for key, value in index.by_secret.items()},
+            batch_unlocks=list(index.batch_unlocks),
+            expirations=list(index.expirations),
+            sequence=index.sequence,
+        )
+    # Events are frozen, only the queues and their indexes must be copied
+    clone.queueids_to_queues = CopyOnAccessDict(
+        chain_state.queueids_to_queues, copy_function=copy, memo=memo
+    )
+    clone.tokennetworkaddresses_to_tokennetworkregistryaddresses = dict(
+        chain_state.tokennetworkaddresses_to_tokennetworkregistryaddresses
+    )
+    channel_deadlines = chain_state.channel_deadlines
+    if channel_deadlines is not None:
+        clone.channel_deadlines = ChannelDeadlinesState(
+            deadlines=dict(channel_deadlines.deadlines),
+            heap=list(channel_deadlines.heap),
+            dirty=set(channel_deadlines.dirty),
+        )
+
+    return clone
+
+
+def _materialize(container: Dict) -> Dict:
+    if isinstance(container, CopyOnAccessDict):
+        return container.to_dict()
+    return container
+
+
+def materialize_clone(chain_state: ChainState) -> None:
+    """Replace the copy-on-access containers of a clone with plain
+    dictionaries.
+
+    Must only be called after the state transitions applied to the clone are
+    done, values which were not accessed stay shared with the original state.
+    """
+    payment_mapping = chain_state.payment_mapping
+    payment_mapping.secrethashes_to_task = _materialize(payment_mapping.secrethashes_to_task)
+    chain_state.queueids_to_queues = _materialize(chain_state.queueids_to_queues)
+
+    for registry in chain_state.identifiers_to_tokennetworkregistries.values():
+        for token_network in registry.tokennetworkaddresses_to_tokennetworks.values():
+            token_network.channelidentifiers_to_channels = _materialize(
+                token_network.channelidentifiers_to_channels
+            )
@@ -0,0 +1,208 @@
+"""Delta snapshots of the `ChainState`.
+
+A full snapshot serializes the complete `ChainState`, which for nodes with
+many channels or pending payments is large, and writing it every
+`SNAPSHOT_STATE_CHANGES_COUNT` state changes makes the snapshot table grow
+quickly. Most of the channels and payment tasks don't change between two
+snapshots.
+
+A delta snapshot stores the `ChainState` without its channels and payment
+tasks, and only the channels and payment tasks that changed since the last
+full snapshot, the *base*. Deltas are cumulative, restoring the state needs
+the base and its newest delta only.
+"""
+import hashlib
+from copy import copy
+from dataclasses import dataclass, field
+
+from raiden_common.storage.serialization import SerializationBase
+from raiden_common.transfer.architecture import State, TransferTask
+from raiden_common.transfer.identifiers import CanonicalIdentifier
+from raiden_common.transfer.state import (
+    ChainState,
+    NettingChannelState,
+    PaymentMappingState,
+    TokenNetworkRegistryState,
+    TokenNetworkState,
+)
+from raiden_common.utils.typing import (
+    Any,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    SecretHash,
+    TokenNetworkAddress,
+)
+
+
+@dataclass
+class ChainStateDelta(State):
+    """The changes of a `ChainState` since its base snapshot.
+
+    `chain_state` has no channels and no payment tasks, these are restored
+    from the base snapshot and updated with the other fields.
+    """
+
+    chain_state: ChainState
+    channels: List[NettingChannelState] = field(default_factory=list)
+    removed_channels: List[CanonicalIdentifier] = field(default_factory=list)
+    payment_tasks: Dict[SecretHash, TransferTask] = field(default_factory=dict)
+    removed_payment_tasks: List[SecretHash] = field(default_factory=list)
+
+
+def _token_networks(chain_state: ChainState) -> Dict[TokenNetworkAddress, TokenNetworkState]:
+    return {
+        token_network_address: token_network
+        for registry in chain_state.identifiers_to_tokennetworkregistries.values()
+        for token_network_address, token_network in (
+            registry.tokennetworkaddresses_to_tokennetworks.items()
+        )
+    }
+
+
+def _strip_chain_state(chain_state: ChainState) -> ChainState:
+    """Return a shallow copy of `chain_state` without channels and payment
+    tasks. `chain_state` is not modified.
+    """
+    stripped = copy(chain_state)
+    stripped.payment_mapping = PaymentMappingState()
+    stripped.identifiers_to_tokennetworkregistries = {}
+
+    for address, registry in chain_state.identifiers_to_tokennetworkregistries.items():
+        token_networks = []
+        for token_network in registry.token_network_list:
+            stripped_token_network = copy(token_network)
+            stripped_token_network.channelidentifiers_to_channels = {}
+            token_networks.append(stripped_token_network)
+
+        stripped.identifiers_to_tokennetworkregistries[address] = TokenNetworkRegistryState(
+            address=registry.address, token_network_list=token_networks
+        )
+
+    return stripped
+
+
+def apply_chain_state_delta(base: ChainState, delta: ChainStateDelta) -> ChainState:
+    """Rebuild the state from the `base` snapshot and its `delta`.
+
+    `base` must not be used afterwards, its channels and payment tasks are
+    moved into the returned state.
+    """
+    chain_state = delta.chain_state
+    base_token_networks = _token_networks(base)
+    token_networks = _token_networks(chain_state)
+
+    for token_network_address, token_network in token_networks.items():
+        base_token_network = base_token_networks.get(token_network_address)
+        if base_token_network is not None:
+            token_network.channelidentifiers_to_channels = dict(
+                base_token_network.channelidentifiers_to_channels
+            )
+
+    for canonical_identifier in delta.removed_channels:
+        channel_token_network = token_networks.get(canonical_identifier.token_network_address)
+        if channel_token_network is not None:
+            channel_token_network.channelidentifiers_to_channels.pop(
+                canonical_identifier.channel_identifier, None
+            )
+
+    for channel_state in delta.channels:
+        token_network = token_networks[channel_state.canonical_identifier.token_network_address]
+        token_network.channelidentifiers_to_channels[channel_state.identifier] = channel_state
+
+    tasks = dict(base.payment_mapping.secrethashes_to_task)
+    for secrethash in delta.removed_payment_tasks:
+        tasks.pop(secrethash, None)
+    tasks.update(delta.payment_tasks)
+    chain_state.payment_mapping.secrethashes_to_task = tasks
+
+    return chain_state
+
+
+class _BaseEntry(NamedTuple):
+    value: Optional[State]
+    digest: bytes
+
+
+class DeltaSnapshotTracker:
+    """Computes the delta of a `ChainState` against the last full snapshot.
+
+    Changed values are detected by comparing the digest of their serialized
+    representation with the one of the base. With `track_identity` the base
+    values are kept in memory, and values which are the same object as in
+    the base are not serialized at all. This is only useful when the state is
+    cloned with copy-on-write, otherwise every value is a new object.
+    """
+
+    def __init__(self, serializer: SerializationBase, track_identity: bool = False) -> None:
+        self.serializer = serializer
+        self.track_identity = track_identity
+        self.base_snapshot_id: Optional[Any] = None
+        self.deltas_since_base = 0
+        self._channels: Dict[CanonicalIdentifier, _BaseEntry] = {}
+        self._tasks: Dict[SecretHash, _BaseEntry] = {}
+
+    def _digest(self, value: State) -> bytes:
+        data = self.serializer.serialize(value)
+        if isinstance(data, str):
+            data = data.encode()
+        return hashlib.sha256(data).digest()
+
+    def _entry(self, value: State) -> _BaseEntry:
+        return _BaseEntry(value if self.track_identity else None, self._digest(value))
+
+    def _is_unchanged(self, entry: Optional[_BaseEntry], value: State) -> bool:
+        if entry is None:
+            return False
+        if entry.value is value:
+            return True
+        return entry.digest == self._digest(value)
+
+    def rebase(self, chain_state: ChainState, snapshot_id: Any) -> None:
+        """Use `chain_state`, saved as the full snapshot `snapshot_id`, as
+        the base for the following deltas.
+        """
+        self.base_snapshot_id = snapshot_id
+        self.deltas_since_base = 0
+        self._channels = {
+            channel_state.canonical_identifier: self._entry(channel_state)
+            for token_network in _token_networks(chain_state).values()
+            for channel_state in token_network.channelidentifiers_to_channels.values()
+        }
+        self._tasks = {
+            secrethash: self._entry(task)
+            for secrethash, task in chain_state.payment_mapping.secrethashes_to_task.items()
+        }
+
+    def make_delta(self, chain_state: ChainState) -> ChainStateDelta:
+        assert self.base_snapshot_id is not None, "A delta requires a base snapshot"
+
+        delta = ChainStateDelta(chain_state=_strip_chain_state(chain_state))
+
+        seen_channels = set()
+        for token_network in _token_networks(chain_state).values():
+            for channel_state in token_network.channelidentifiers_to_channels.values():
+                canonical_identifier = channel_state.canonical_identifier
+                seen_channels.add(canonical_identifier)
+                entry = self._channels.get(canonical_identifier)
+                if not self._is_unchanged(entry, channel_state):
+                    delta.channels.append(channel_state)
+
+        delta.removed_channels = [
+            canonical_identifier
+            for canonical_identifier in self._channels
+            if canonical_identifier not in seen_channels
+        ]
+
+        tasks = chain_state.payment_mapping.secrethashes_to_task
+        for secrethash, task in tasks.items():
+            if not self._is_unchanged(self._tasks.get(secrethash), task):
+                delta.payment_tasks[secrethash] = task
+
+        delta.removed_payment_tasks = [
+            secrethash for secrethash in self._tasks if secrethash not in tasks
+        ]
+
+        self.deltas_since_base += 1
+        return delta
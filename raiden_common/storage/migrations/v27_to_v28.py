@@ -0,0 +1,46 @@
+from raiden_common.storage.sqlite import SQLiteStorage
+from raiden_common.utils.typing import Any
+
+SOURCE_VERSION = 27
+TARGET_VERSION = 28
+
+PAYMENT_HISTORY_EVENT_TYPES = (
+    "raiden_common.transfer.events.EventPaymentReceivedSuccess",
+    "raiden_common.transfer.events.EventPaymentSentFailed",
+    "raiden_common.transfer.events.EventPaymentSentSuccess",
+)
+
+
+def _backfill_payment_history(storage: SQLiteStorage) -> None:
+    """Populate the `payment_history` table from the existing payment events.
+
+    The table itself is created by `SQLiteStorage`, because it uses `CREATE
+    TABLE IF NOT EXISTS`.
+    """
+    sql_helper = ",".join("?" * len(PAYMENT_HISTORY_EVENT_TYPES))
+    storage.conn.execute(
+        f"""
+        INSERT OR IGNORE INTO payment_history(
+            identifier, event_type, token_network_address, partner_address
+        )
+        SELECT
+            identifier,
+            json_extract(data, '$._type'),
+            lower(json_extract(data, '$.token_network_address')),
+            lower(coalesce(json_extract(data, '$.target'), json_extract(data, '$.initiator')))
+        FROM
+            state_events
+        WHERE
+            json_extract(data, '$._type') IN ({sql_helper})
+        """,
+        PAYMENT_HISTORY_EVENT_TYPES,
+    )
+
+
+def upgrade_v27_to_v28(
+    storage: SQLiteStorage, old_version: int, **kwargs: Any  # pylint: disable=unused-argument
+) -> int:
+    if old_version == SOURCE_VERSION:
+        _backfill_payment_history(storage)
+
+    return TARGET_VERSION
@@ -1 +1 @@
-from .serializer import DictSerializer, JSONSerializer, SerializationBase  # noqa
+from .serializer import BinarySerializer, DictSerializer, JSONSerializer, SerializationBase  # noqa
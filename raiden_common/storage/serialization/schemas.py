@@ -201,14 +201,14 @@ def __init__(self, allowed_classes: Iterable[type], many: bool = False, **metada
     @staticmethod
     def serialization_schema_selector(obj: Any, parent: Any) -> Schema:
         # pylint: disable=unused-argument
-        return class_schema(obj.__class__, base_schema=BaseSchema)()
+        return schema_for(obj.__class__)
 
     def deserialization_schema_selector(
         self, deserializable_dict: Dict[str, Any], parent: Dict[str, Any]
     ) -> Schema:
         # pylint: disable=unused-argument
         type_ = deserializable_dict["_type"].split(".")[-1]
-        return class_schema(self._class_of_classname[type_], base_schema=BaseSchema)()
+        return schema_for(self._class_of_classname[type_])
 
     def __call__(self, **metadata: Any) -> "CallablePolyField":
         self.metadata = metadata
@@ -365,3 +365,20 @@ def remove_missing(self, data: Dict) -> Dict:
 
 def class_type(instance: Any) -> str:
     return f"{instance.__class__.__module__}.{instance.__class__.__name__}"
+
+
+_SCHEMAS: Dict[type, Schema] = {}
+
+
+def schema_for(klass: type) -> Schema:
+    """Return the schema of the dataclass `klass`.
+
+    Instantiating a schema copies all of its fields, which is more expensive
+    than most dumps and loads. `dump` and `load` don't modify the schema, so
+    a single instance per class is created and reused.
+    """
+    schema = _SCHEMAS.get(klass)
+    if schema is None:
+        schema = class_schema(klass, base_schema=BaseSchema)()
+        _SCHEMAS[klass] = schema
+    return schema
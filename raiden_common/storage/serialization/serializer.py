@@ -6,16 +6,19 @@
 """
 import importlib
 import json
+import re
+import zlib
 from dataclasses import is_dataclass
 from json import JSONDecodeError
 from typing import Optional
 
+import msgpack
 from marshmallow import ValidationError
 
 from raiden_common.exceptions import SerializationError
-from raiden_common.storage.serialization.schemas import MESSAGE_DATA_KEY, BaseSchema, class_schema
+from raiden_common.storage.serialization.schemas import MESSAGE_DATA_KEY, schema_for
 from raiden_common.utils.copy import deepcopy
-from raiden_common.utils.typing import Address, Any, Dict, List, Mapping
+from raiden_common.utils.typing import Address, Any, Dict, List, Mapping, Union
 
 MESSAGE_NAME_TO_QUALIFIED_NAME = {
     "AuthenticatedMessage": "raiden_common.messages.abstract.AuthenticatedMessage",
@@ -77,8 +80,7 @@ def serialize(obj: Any) -> Dict:
         data = obj
         if is_dataclass(obj):
             try:
-                schema = class_schema(obj.__class__, base_schema=BaseSchema)()
-                data = schema.dump(obj)
+                data = schema_for(obj.__class__).dump(obj)
             except (AttributeError, TypeError, ValidationError, ValueError) as ex:
                 raise SerializationError(f"Can't serialize: {data}") from ex
         elif not isinstance(obj, Mapping):
@@ -87,19 +89,23 @@ def serialize(obj: Any) -> Dict:
         return data
 
     @staticmethod
-    def deserialize(data: Dict) -> Any:
+    def deserialize(data: Dict, copy_data: bool = True) -> Any:
         """Deserialize a dict-like object.
 
         If the key ``_type`` is present, import the target and deserialize via Marshmallow.
         Raises ``SerializationError`` for invalid inputs.
+
+        Loading may modify ``data``, so it is copied first. Callers which own
+        ``data`` and don't use it afterwards can pass ``copy_data=False``.
         """
         if not isinstance(data, Mapping):
             raise SerializationError(f"Can't deserialize non dict-like objects: {data}")
         if "_type" in data:
             try:
                 klass = _import_type(data["_type"])
-                schema = class_schema(klass, base_schema=BaseSchema)()
-                return schema.load(deepcopy(data))
+                if copy_data:
+                    data = deepcopy(data)
+                return schema_for(klass).load(data)
             except (ValueError, TypeError, ValidationError) as ex:
                 raise SerializationError(f"Can't deserialize: {data}") from ex
         return data
@@ -112,17 +118,156 @@ def serialize(obj: Any) -> str:
         return json.dumps(data)
 
     @staticmethod
-    def deserialize(data: str) -> Any:
+    def deserialize(data: Union[str, bytes]) -> Any:
         """Deserialize a JSON object.
 
+        Data written by the ``BinarySerializer`` is accepted as well, so that
+        a database can be read independently of the encoding used to write it.
+
         Raises ``SerializationError`` for invalid inputs.
         """
+        if is_binary_encoded(data):
+            return BinarySerializer.deserialize(data)
+
         try:
             decoded_json = json.loads(data)
         except (UnicodeDecodeError, JSONDecodeError) as ex:
-            raise SerializationError(f"Can't decode invalid JSON: {data}") from ex
-        data = DictSerializer.deserialize(decoded_json)
-        return data
+            raise SerializationError(f"Can't decode invalid JSON: {data!r}") from ex
+        # The decoded JSON is not shared, it doesn't have to be copied
+        return DictSerializer.deserialize(decoded_json, copy_data=False)
+
+
+# The first byte of binary encoded data identifies its format. JSON text
+# never starts with these bytes.
+BINARY_FORMAT_MSGPACK = 0x01
+BINARY_FORMAT_MSGPACK_ZLIB = 0x02
+
+# Payloads larger than this are compressed. In practice this applies to the
+# snapshots only, the state changes and events are much smaller.
+BINARY_COMPRESSION_THRESHOLD = 4096
+
+# Integers which are not encoded as strings by the schemas, see `_pack`.
+_EXT_INT = 1
+# Integers encoded as strings which don't fit into a msgpack integer.
+_EXT_BIG_INT_STRING = 2
+
+_HEX_STRING = re.compile(r"0x(?:[0-9a-f]{2})*")
+_INT_STRING = re.compile(r"0|-?[1-9][0-9]*")
+_MSGPACK_INT_RANGE = range(-(2**63), 2**64)
+
+
+class _ExtInt(int):
+    pass
+
+
+def _int_to_bytes(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    value = int.from_bytes(data, "big", signed=True)
+    if code == _EXT_INT:
+        return _ExtInt(value)
+    if code == _EXT_BIG_INT_STRING:
+        return str(value)
+    return msgpack.ExtType(code, data)
+
+
+def _pack(value: Any) -> Any:
+    """Convert the JSON compatible `value` into its compact msgpack form.
+
+    The schemas encode bytes as lowercase hex strings and most integers as
+    decimal strings. These are converted to raw bytes and msgpack integers,
+    the other integers are wrapped in an extension type to tell them apart.
+    Only canonical representations are converted, so that `_unpack` restores
+    exactly the same data as `json.loads(json.dumps(value))`.
+    """
+    if isinstance(value, str):
+        if value.startswith("0x") and _HEX_STRING.fullmatch(value):
+            return bytes.fromhex(value[2:])
+        if _INT_STRING.fullmatch(value):
+            number = int(value)
+            if number in _MSGPACK_INT_RANGE:
+                return number
+            return msgpack.ExtType(_EXT_BIG_INT_STRING, _int_to_bytes(number))
+        return value
+    if isinstance(value, bool) or value is None or isinstance(value, float):
+        return value
+    if isinstance(value, int):
+        return msgpack.ExtType(_EXT_INT, _int_to_bytes(value))
+    if isinstance(value, Mapping):
+        # Like JSON, all keys are strings
+        return {
+            _pack(key if isinstance(key, str) else json.dumps(key)): _pack(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_pack(item) for item in value]
+
+    raise SerializationError(f"Can't encode value of type {type(value)}: {value}")
+
+
+def _unpack(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    if type(value) is int:  # pylint: disable=unidiomatic-typecheck
+        return str(value)
+    if isinstance(value, _ExtInt):
+        return int(value)
+    if isinstance(value, dict):
+        return {_unpack(key): _unpack(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_unpack(item) for item in value]
+    return value
+
+
+def is_binary_encoded(data: Any) -> bool:
+    return isinstance(data, bytes) and data[:1] in (
+        bytes([BINARY_FORMAT_MSGPACK]),
+        bytes([BINARY_FORMAT_MSGPACK_ZLIB]),
+    )
+
+
+class BinarySerializer(SerializationBase):
+    """Serialize to a compact binary format.
+
+    The data is encoded with msgpack, with hex strings as raw bytes and
+    integers as msgpack integers, and compressed with zlib when it is large.
+    The first byte identifies the format. JSON data is deserialized as well,
+    which keeps existing databases readable.
+    """
+
+    @staticmethod
+    def serialize(obj: Any) -> bytes:
+        data = msgpack.packb(_pack(DictSerializer.serialize(obj)), use_bin_type=True)
+        if len(data) > BINARY_COMPRESSION_THRESHOLD:
+            return bytes([BINARY_FORMAT_MSGPACK_ZLIB]) + zlib.compress(data)
+        return bytes([BINARY_FORMAT_MSGPACK]) + data
+
+    @staticmethod
+    def decode(data: bytes) -> Dict:
+        """Decode binary data into the dict produced by the schemas, as
+        `json.loads` does for JSON data.
+        """
+        if not is_binary_encoded(data):
+            raise SerializationError(f"Unknown binary format: {data[:1]!r}")
+
+        payload = data[1:]
+        try:
+            if data[0] == BINARY_FORMAT_MSGPACK_ZLIB:
+                payload = zlib.decompress(payload)
+            decoded = msgpack.unpackb(payload, raw=False, strict_map_key=False, ext_hook=_ext_hook)
+        except (ValueError, zlib.error, msgpack.UnpackException) as ex:
+            raise SerializationError(f"Can't decode invalid binary data: {data!r}") from ex
+
+        return _unpack(decoded)
+
+    @staticmethod
+    def deserialize(data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            return JSONSerializer.deserialize(data)
+
+        return DictSerializer.deserialize(BinarySerializer.decode(data), copy_data=False)
 
 
 def remove_type_inplace(data: Any) -> None:
@@ -186,4 +331,4 @@ def deserialize(data: str, address: Optional[Address] = None) -> Any:
         except KeyError as ex:
             raise SerializationError(f"Unknown message type: {msg_type}") from ex
 
-        return DictSerializer.deserialize(envelope)
+        return DictSerializer.deserialize(envelope, copy_data=False)
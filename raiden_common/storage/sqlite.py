@@ -1,4 +1,6 @@
+import json
 import sqlite3
+from collections import deque
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
@@ -7,20 +9,34 @@
 from typing import Generator, Iterable, cast
 
 import gevent
+import structlog
 import ulid
 from eth_utils import to_normalized_address
+from gevent.event import AsyncResult
 from ulid import MAX_ULID, MIN_ULID, ULID
 
-from raiden_common.constants import RAIDEN_DB_VERSION, SQLITE_MIN_REQUIRED_VERSION
+from raiden_common.constants import (
+    RAIDEN_DB_VERSION,
+    SQLITE_MIN_REQUIRED_VERSION,
+    SQLiteJournalMode,
+    SQLiteSynchronous,
+)
 from raiden_common.exceptions import InvalidDBData, InvalidNumberInput
-from raiden_common.storage.serialization import SerializationBase
+from raiden_common.storage.delta_snapshot import ChainStateDelta, apply_chain_state_delta
+from raiden_common.storage.serialization import BinarySerializer, SerializationBase
 from raiden_common.storage.utils import DB_SCRIPT_CREATE_TABLES, TimestampedEvent
 from raiden_common.transfer.architecture import Event, State, StateChange
+from raiden_common.transfer.events import (
+    EventPaymentReceivedSuccess,
+    EventPaymentSentFailed,
+    EventPaymentSentSuccess,
+)
 from raiden_common.utils.system import get_system_spec
 from raiden_common.utils.typing import (
     Address,
     Any,
     DatabasePath,
+    Deque,
     Dict,
     Generic,
     Iterator,
@@ -36,10 +52,15 @@
     Union,
 )
 
+log = structlog.get_logger(__name__)
+
 StateChangeID = NewType("StateChangeID", ULID)
 SnapshotID = NewType("SnapshotID", ULID)
+SnapshotDeltaID = NewType("SnapshotDeltaID", ULID)
 EventID = NewType("EventID", ULID)
-ID = TypeVar("ID", StateChangeID, SnapshotID, EventID)
+# JSON text, or the output of the `BinarySerializer`
+SerializedData = Union[str, bytes]
+ID = TypeVar("ID", StateChangeID, SnapshotID, SnapshotDeltaID, EventID)
 
 
 @dataclass
@@ -85,19 +106,38 @@ class FilteredDBQuery(NamedTuple):
 class EventEncodedRecord(NamedTuple):
     event_identifier: EventID
     state_change_identifier: StateChangeID
-    data: str
+    data: SerializedData
 
 
 class StateChangeEncodedRecord(NamedTuple):
     state_change_identifier: StateChangeID
-    data: str
+    data: SerializedData
 
 
 class SnapshotEncodedRecord(NamedTuple):
     identifier: SnapshotID
     state_change_qty: int
     state_change_identifier: StateChangeID
-    data: str
+    data: SerializedData
+
+
+class CompactedRange(NamedTuple):
+    """Result of a `SQLiteStorage.compact_state_changes` call."""
+
+    last_identifier: StateChangeID
+    deleted_state_changes: int
+    deleted_events: int
+
+
+class PaymentHistoryRecord(NamedTuple):
+    """Columns of the `payment_history` table for a payment event.
+
+    The addresses are stored in their normalized hex representation.
+    """
+
+    event_type: str
+    token_network_address: str
+    partner_address: str
 
 
 class EventRecord(NamedTuple):
@@ -124,6 +164,18 @@ def assert_sqlite_version() -> bool:  # pragma: no unittest
     return True
 
 
+def binary_to_json(data: bytes) -> str:
+    """SQL function to query the rows written by the `BinarySerializer`
+    with the JSON functions, see `JSON_DATA`.
+    """
+    return json.dumps(BinarySerializer.decode(data))
+
+
+# The `data` column as JSON text, for the rows in either encoding. The JSON
+# rows are not passed to Python.
+JSON_DATA = "(CASE WHEN typeof(data) = 'blob' THEN binary_to_json(data) ELSE data END)"
+
+
 def adapt_ulid_identifier(ulid: ULID) -> bytes:
     return ulid.bytes
 
@@ -203,7 +255,7 @@ def _query_to_string(query: FilteredDBQuery) -> Tuple[str, List[str]]:
         where_clauses = []
         filters = _filter_from_dict(filter_set)
         for field, value in filters.items():
-            where_clauses.append("json_extract(data, ?)=?")
+            where_clauses.append(f"json_extract({JSON_DATA}, ?)=?")
             args.append(f"$.{field}")
             args.append(value)
 
@@ -213,6 +265,24 @@ def _query_to_string(query: FilteredDBQuery) -> Tuple[str, List[str]]:
     return query_where_str, args
 
 
+def payment_history_record(event: Event) -> Optional[PaymentHistoryRecord]:
+    """Return the `payment_history` columns for `event`, or `None` if the
+    event is not part of the payment history.
+    """
+    if isinstance(event, (EventPaymentSentSuccess, EventPaymentSentFailed)):
+        partner_address = to_normalized_address(event.target)
+    elif isinstance(event, EventPaymentReceivedSuccess):
+        partner_address = to_normalized_address(event.initiator)
+    else:
+        return None
+
+    return PaymentHistoryRecord(
+        event_type=f"{event.__class__.__module__}.{event.__class__.__name__}",
+        token_network_address=to_normalized_address(event.token_network_address),
+        partner_address=partner_address,
+    )
+
+
 def _prepend_and_save_ids(
     ulid_factory: ulid.api.api.Api, ids: List[ID], items: Iterable[Tuple[Any, ...]]
 ) -> Iterator:
@@ -224,7 +294,7 @@ def _prepend_and_save_ids(
 
 
 def write_state_change(
-    ulid_factory: ulid.api.api.Api, cursor: sqlite3.Cursor, state_change: str
+    ulid_factory: ulid.api.api.Api, cursor: sqlite3.Cursor, state_change: SerializedData
 ) -> StateChangeID:
     """Write `state_change` to the database and returns the corresponding ID."""
 
@@ -239,8 +309,14 @@ def write_state_change(
 def write_events(
     ulid_factory: ulid.api.api.Api,
     cursor: sqlite3.Cursor,
-    events: List[Tuple[StateChangeID, str]],
+    events: List[Tuple[StateChangeID, SerializedData]],
+    payment_history: List[Optional[PaymentHistoryRecord]] = None,
 ) -> List[EventID]:
+    """Write `events` to the database and returns the corresponding IDs.
+
+    `payment_history` must be either `None` or have one entry per event, the
+    entries which are not `None` are added to the `payment_history` table.
+    """
     events_ids: List[EventID] = []
 
     query = (
@@ -250,40 +326,86 @@ def write_events(
     )
     cursor.executemany(query, _prepend_and_save_ids(ulid_factory, events_ids, events))
 
+    if payment_history is not None:
+        assert len(payment_history) == len(events_ids), "One record per event is required"
+        write_payment_history(cursor, zip(events_ids, payment_history))
+
     return events_ids
 
 
+def write_payment_history(
+    cursor: sqlite3.Cursor,
+    records: Iterable[Tuple[EventID, Optional[PaymentHistoryRecord]]],
+) -> None:
+    query = (
+        "INSERT INTO payment_history("
+        "   identifier, event_type, token_network_address, partner_address"
+        ") VALUES(?, ?, ?, ?)"
+    )
+    cursor.executemany(
+        query, ((event_id, *record) for event_id, record in records if record is not None)
+    )
+
+
 class SQLiteStorage:
-    def __init__(self, database_path: DatabasePath):
+    def __init__(
+        self,
+        database_path: DatabasePath,
+        journal_mode: SQLiteJournalMode = SQLiteJournalMode.PERSIST,
+        synchronous: Optional[SQLiteSynchronous] = None,
+        wal_autocheckpoint: Optional[int] = None,
+    ):
         sqlite3.register_adapter(ULID, adapt_ulid_identifier)
         sqlite3.register_converter("ULID", convert_ulid_identifier)
 
         conn = sqlite3.connect(database_path, detect_types=sqlite3.PARSE_DECLTYPES)
         conn.text_factory = str
         conn.execute("PRAGMA foreign_keys=ON")
-
-        # Skip the acquire/release cycle for the exclusive write lock.
-        # References:
-        # https://sqlite.org/atomiccommit.html#_exclusive_access_mode
-        # https://sqlite.org/pragma.html#pragma_locking_mode
-        conn.execute("PRAGMA locking_mode=EXCLUSIVE")
-
-        # Keep the journal around and skip inode updates.
+        conn.create_function("binary_to_json", 1, binary_to_json, deterministic=True)
+
+        if journal_mode is SQLiteJournalMode.PERSIST:
+            # Skip the acquire/release cycle for the exclusive write lock.
+            # References:
+            # https://sqlite.org/atomiccommit.html#_exclusive_access_mode
+            # https://sqlite.org/pragma.html#pragma_locking_mode
+            conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+
+        # PERSIST: Keep the journal around and skip inode updates.
+        # WAL: Append the changes to a separate log, readers in other processes
+        # are not blocked by the writer.
         # References:
         # https://sqlite.org/atomiccommit.html#_persistent_rollback_journals
+        # https://sqlite.org/wal.html
         # https://sqlite.org/pragma.html#pragma_journal_mode
         try:
-            conn.execute("PRAGMA journal_mode=PERSIST")
+            conn.execute(f"PRAGMA journal_mode={journal_mode.value}")
         except sqlite3.DatabaseError:
             raise InvalidDBData(
                 f"Existing DB {database_path} was found to be corrupt at Raiden startup. "
                 f"Manual user intervention required. Bailing."
             )
 
+        # References:
+        # https://sqlite.org/pragma.html#pragma_synchronous
+        # https://sqlite.org/pragma.html#pragma_wal_autocheckpoint
+        if synchronous is not None:
+            conn.execute(f"PRAGMA synchronous={synchronous.value}")
+        if wal_autocheckpoint is not None:
+            # PRAGMAs don't support parameters
+            conn.execute(f"PRAGMA wal_autocheckpoint={int(wal_autocheckpoint)}")
+
+        # Allow `incremental_vacuum` to return the pages freed by the
+        # compaction to the file system. This only has an effect on new
+        # databases, it must be set before the tables are created.
+        # References:
+        # https://sqlite.org/pragma.html#pragma_auto_vacuum
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
         with conn:
             conn.executescript(DB_SCRIPT_CREATE_TABLES)
 
         self.conn = conn
+        self.journal_mode = journal_mode
         self.in_transaction = False
 
         # Dict[Type[ID], ULIDMonotonicFactory[ID]] is not supported yet.
@@ -305,6 +427,7 @@ def _ulid_factory(self, id_type: Type[ID]) -> ulid.api.api.Api:
             StateChangeID: "state_changes",
             EventID: "state_events",
             SnapshotID: "state_snapshot",
+            SnapshotDeltaID: "state_snapshot_delta",
         }
         table_name = expected_types.get(id_type)
 
@@ -381,7 +504,7 @@ def has_snapshot(self) -> bool:
 
         return bool(result[0])
 
-    def write_state_changes(self, state_changes: List[str]) -> List[StateChangeID]:
+    def write_state_changes(self, state_changes: List[SerializedData]) -> List[StateChangeID]:
         """Write `state_changes` to the database and returns the corresponding IDs."""
         ulid_factory = self._ulid_factory(StateChangeID)
 
@@ -398,7 +521,7 @@ def write_state_changes(self, state_changes: List[str]) -> List[StateChangeID]:
 
         return state_change_ids
 
-    def write_first_state_snapshot(self, snapshot: str) -> SnapshotID:
+    def write_first_state_snapshot(self, snapshot: SerializedData) -> SnapshotID:
         if self.has_snapshot():
             raise RuntimeError(
                 "write_first_state_snapshot can only be used for an unitialized node."
@@ -416,7 +539,7 @@ def write_first_state_snapshot(self, snapshot: str) -> SnapshotID:
         return snapshot_id
 
     def write_state_snapshot(
-        self, snapshot: str, statechange_id: StateChangeID, statechange_qty: int
+        self, snapshot: SerializedData, statechange_id: StateChangeID, statechange_qty: int
     ) -> SnapshotID:
         snapshot_id = SnapshotID(self._ulid_factory(SnapshotID).new())
 
@@ -429,16 +552,57 @@ def write_state_snapshot(
 
         return snapshot_id
 
-    def write_events(self, events: List[Tuple[StateChangeID, str]]) -> List[EventID]:
-        ulid_factory = self._ulid_factory(EventID)
-        events_ids: List[EventID] = []
+    def write_state_snapshot_delta(
+        self,
+        snapshot: SerializedData,
+        base_snapshot_id: SnapshotID,
+        statechange_id: StateChangeID,
+        statechange_qty: int,
+    ) -> SnapshotDeltaID:
+        delta_id = SnapshotDeltaID(self._ulid_factory(SnapshotDeltaID).new())
 
         query = (
-            "INSERT INTO state_events("
-            "   identifier, source_statechange_id, data"
-            ") VALUES(?, ?, ?)"
+            "INSERT INTO state_snapshot_delta ("
+            "   identifier, base_snapshot_id, statechange_id, statechange_qty, data"
+            ") VALUES(?, ?, ?, ?, ?)"
+        )
+        self.conn.execute(
+            query, (delta_id, base_snapshot_id, statechange_id, statechange_qty, snapshot)
+        )
+        self.maybe_commit()
+
+        return delta_id
+
+    def prune_snapshots(self, keep: int) -> None:
+        """Delete all but the `keep` newest full snapshots, together with
+        their deltas.
+
+        The first snapshot is never deleted, it contains the initial state of
+        the node and is necessary to replay all the state changes.
+        """
+        if keep < 1:
+            raise ValueError("At least one snapshot must be kept")
+
+        self.conn.execute(
+            "DELETE FROM state_snapshot WHERE statechange_id IS NOT NULL AND identifier < ("
+            "   SELECT identifier FROM state_snapshot WHERE statechange_id IS NOT NULL "
+            "   ORDER BY identifier DESC LIMIT 1 OFFSET ?"
+            ")",
+            (keep - 1,),
+        )
+        self.maybe_commit()
+
+    def write_events(
+        self,
+        events: List[Tuple[StateChangeID, SerializedData]],
+        payment_history: List[Optional[PaymentHistoryRecord]] = None,
+    ) -> List[EventID]:
+        events_ids = write_events(
+            ulid_factory=self._ulid_factory(EventID),
+            cursor=self.conn.cursor(),
+            events=events,
+            payment_history=payment_history,
         )
-        self.conn.executemany(query, _prepend_and_save_ids(ulid_factory, events_ids, events))
         self.maybe_commit()
 
         return events_ids
@@ -449,6 +613,124 @@ def delete_state_changes(self, state_changes_to_delete: List[Tuple[StateChangeID
         )
         self.maybe_commit()
 
+    def compact_state_changes(
+        self,
+        before: StateChangeID,
+        limit: int,
+        after: StateChangeID = LOW_STATECHANGE_ULID,
+        keep_payment_history: bool = True,
+    ) -> Optional[CompactedRange]:
+        """Delete up to `limit` of the oldest state changes between `after`
+        and `before`, both exclusive, together with their events and the
+        snapshots which can not be restored without them.
+
+        `before` must be the state change of a full snapshot, otherwise the
+        state can not be restored anymore. With `keep_payment_history` the
+        events of the payment history, and their state changes, are kept.
+
+        Every call is a transaction of its own, so that the compaction of a
+        large database can be interleaved with the writes of the node. Returns
+        `None` once there are no state changes left to visit, otherwise the
+        result's `last_identifier` is the `after` of the next call.
+        """
+        if limit < 1:
+            raise InvalidNumberInput("limit must be a positive integer")
+
+        rows = self.conn.execute(
+            "SELECT identifier FROM state_changes WHERE identifier > ? AND identifier < ? "
+            "ORDER BY identifier ASC LIMIT ?",
+            (after, before, limit),
+        ).fetchall()
+
+        if not rows:
+            return None
+
+        batch = (rows[0][0], rows[-1][0])
+        with self.transaction():
+            cursor = self.conn.cursor()
+
+            # Once a state change is deleted the initial snapshot, which has
+            # no state change, can not be restored either.
+            cursor.execute(
+                "DELETE FROM state_snapshot "
+                "WHERE statechange_id IS NULL OR statechange_id BETWEEN ? AND ?",
+                batch,
+            )
+            cursor.execute(
+                "DELETE FROM state_snapshot_delta WHERE statechange_id BETWEEN ? AND ?", batch
+            )
+
+            if keep_payment_history:
+                cursor.execute(
+                    "DELETE FROM state_events WHERE source_statechange_id BETWEEN ? AND ? "
+                    "AND NOT EXISTS ("
+                    "   SELECT 1 FROM payment_history "
+                    "   WHERE payment_history.identifier = state_events.identifier"
+                    ")",
+                    batch,
+                )
+            else:
+                cursor.execute(
+                    "DELETE FROM state_events WHERE source_statechange_id BETWEEN ? AND ?", batch
+                )
+            deleted_events = cursor.rowcount
+
+            cursor.execute(
+                "DELETE FROM state_changes WHERE identifier BETWEEN ? AND ? "
+                "AND NOT EXISTS ("
+                "   SELECT 1 FROM state_events "
+                "   WHERE state_events.source_statechange_id = state_changes.identifier"
+                ")",
+                batch,
+            )
+            deleted_state_changes = cursor.rowcount
+
+        return CompactedRange(
+            last_identifier=batch[1],
+            deleted_state_changes=deleted_state_changes,
+            deleted_events=deleted_events,
+        )
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Return up to `pages` free pages of the database file to the file
+        system, and return the number of pages freed.
+
+        This is a noop for databases created before incremental auto-vacuum
+        was enabled, these have to be converted once with a full `VACUUM`
+        while the node is not running.
+        """
+        assert not self.in_transaction, "Vacuum can not be done inside a transaction"
+
+        free_pages_before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # PRAGMAs don't support parameters. The pages are freed while the
+        # statement is stepped, which `fetchall` does.
+        self.conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        free_pages_after = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return free_pages_before - free_pages_after
+
+    def get_snapshot_state_change_before(
+        self, state_change_identifier: StateChangeID
+    ) -> Optional[StateChangeID]:
+        """Return the state change of the full snapshot which is used to
+        restore the state at `state_change_identifier`, see
+        `get_snapshot_before_state_change`.
+
+        `None` is returned if there is no snapshot or it is the initial one,
+        which has no state change.
+        """
+        row = self.conn.execute(
+            "SELECT statechange_id FROM state_snapshot "
+            "WHERE statechange_id <= ? OR statechange_id IS NULL "
+            "ORDER BY identifier DESC LIMIT 1",
+            (state_change_identifier,),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return row[0]
+
     def get_snapshot_before_state_change(
         self, state_change_identifier: StateChangeID
     ) -> Optional[SnapshotEncodedRecord]:
@@ -495,6 +777,28 @@ def get_snapshot_before_state_change(
 
         return result
 
+    def get_snapshot_delta_before_state_change(
+        self, base_snapshot_id: SnapshotID, state_change_identifier: StateChangeID
+    ) -> Optional[SnapshotEncodedRecord]:
+        """Returns the newest delta of the snapshot `base_snapshot_id` which
+        can be used to restore the State with the StateChange
+        `state_change_identifier` applied.
+        """
+        cursor = self.conn.execute(
+            "SELECT identifier, statechange_qty, statechange_id, data FROM state_snapshot_delta "
+            "WHERE base_snapshot_id = ? AND statechange_id <= ? "
+            "ORDER BY identifier DESC LIMIT 1",
+            (base_snapshot_id, state_change_identifier),
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return SnapshotEncodedRecord(
+            identifier=row[0], state_change_qty=row[1], state_change_identifier=row[2], data=row[3]
+        )
+
     def get_latest_event_by_data_field(
         self, query: FilteredDBQuery
     ) -> Optional[EventEncodedRecord]:
@@ -539,7 +843,7 @@ def _form_and_execute_json_query(
         args: List[Union[str, int]] = []
         if filters:
             for field, value in filters:
-                where_clauses.append("json_extract(data, ?) LIKE ?")
+                where_clauses.append(f"json_extract({JSON_DATA}, ?) LIKE ?")
                 args.append(f"$.{field}")
                 args.append(value)
 
@@ -659,13 +963,56 @@ def get_statechanges_records_by_range(
             for entry in cursor
         ]
 
+    def count_state_changes_in_range(self, db_range: Range[StateChangeID]) -> int:
+        cursor = self.conn.execute(
+            "SELECT COUNT(1) FROM state_changes WHERE identifier BETWEEN ? AND ?",
+            (db_range.first, db_range.last),
+        )
+        return int(cursor.fetchone()[0])
+
+    def batch_query_statechanges_records_by_range(
+        self, db_range: Range[StateChangeID], batch_size: int
+    ) -> Iterator[List[StateChangeEncodedRecord]]:
+        """Batch query the state change records in `db_range`, in order.
+
+        The batches are queried with keyset pagination, so only one batch is
+        in memory at a time and the cost of a query does not grow with the
+        number of state changes already returned.
+        """
+        if batch_size < 1:
+            raise InvalidNumberInput("batch_size must be a positive integer")
+
+        query = (
+            "SELECT identifier, data "
+            "FROM state_changes "
+            "WHERE identifier {} ? AND identifier <= ? "
+            "ORDER BY identifier ASC "
+            "LIMIT ?"
+        )
+        result = self.conn.execute(
+            query.format(">="), (db_range.first, db_range.last, batch_size)
+        ).fetchall()
+
+        while result:
+            yield [
+                StateChangeEncodedRecord(state_change_identifier=entry[0], data=entry[1])
+                for entry in result
+            ]
+            if len(result) < batch_size:
+                return
+
+            last_identifier = result[-1][0]
+            result = self.conn.execute(
+                query.format(">"), (last_identifier, db_range.last, batch_size)
+            ).fetchall()
+
     def _query_events(
         self,
         limit: int = None,
         offset: int = None,
         filters: List[Tuple[str, Any]] = None,
         logical_and: bool = True,
-    ) -> List[Tuple[str, datetime]]:
+    ) -> List[Tuple[SerializedData, datetime]]:
         cursor = self._form_and_execute_json_query(
             query="SELECT data, timestamp FROM state_events ",
             limit=limit,
@@ -738,89 +1085,46 @@ def get_raiden_events_payment_history_with_timestamps(
         offset: int = None,
         token_network_address: TokenNetworkAddress = None,
         partner_address: Address = None,
-    ) -> List[Tuple[str, datetime]]:
+        after: EventID = None,
+    ) -> List[Tuple[EventID, SerializedData, datetime]]:
+        """Return the payment events, filtered by the `payment_history` table.
 
+        `after` is used for keyset pagination, only events with an identifier
+        larger than it are returned. Contrary to `offset`, the cost of a query
+        with `after` does not grow with the number of skipped events.
+        """
         limit, offset = _sanitize_limit_and_offset(limit, offset)
         cursor = self.conn.cursor()
         args: List = list(event_types)
         sql_helper = ",".join("?" * len(event_types))
 
-        if token_network_address and partner_address:
-            query = """
-                SELECT
-                    data, timestamp
-                FROM
-                    state_events
-                WHERE
-                    json_extract(data, '$._type') IN ({})
-                AND
-                    json_extract(data, '$.token_network_address') LIKE ?
-                AND
-                    (
-                    json_extract(data, '$.target') LIKE ?
-                    OR
-                    json_extract(data, '$.initiator') LIKE ?
-                    )
-                ORDER BY identifier
-                ASC LIMIT ? OFFSET ?
-                """
+        where_clauses = [f"payment_history.event_type IN ({sql_helper})"]
+        if token_network_address:
+            where_clauses.append("payment_history.token_network_address = ?")
             args.append(to_normalized_address(token_network_address))
-            # We need to append partner_address two times
-            # since it is used in the OR statement
-            args.append(to_normalized_address(partner_address))
-            args.append(to_normalized_address(partner_address))
-        elif token_network_address and not partner_address:
-            query = """
-                SELECT
-                    data, timestamp
-                FROM
-                    state_events
-                WHERE
-                    json_extract(data, '$._type') IN ({})
-                AND
-                    json_extract(data, '$.token_network_address') LIKE ?
-                ORDER BY identifier
-                ASC LIMIT ? OFFSET ?
-                """
-            args.append(to_normalized_address(token_network_address))
-        elif partner_address and not token_network_address:
-            query = """
-                SELECT
-                    data, timestamp
-                FROM
-                    state_events
-                WHERE
-                    json_extract(data, '$._type') IN ({})
-                AND
-                    (
-                    json_extract(data, '$.target') LIKE ?
-                    OR
-                    json_extract(data, '$.initiator') LIKE ?
-                    )
-                ORDER BY identifier
-                ASC LIMIT ? OFFSET ?
-                """
-            # We need to append partner_address two times
-            # since it is used in the OR statement
-            args.append(to_normalized_address(partner_address))
+        if partner_address:
+            where_clauses.append("payment_history.partner_address = ?")
             args.append(to_normalized_address(partner_address))
-        else:
-            query = """
-                SELECT
-                    data, timestamp
-                FROM
-                    state_events
-                WHERE
-                    json_extract(data, '$._type') IN ({})
-                ORDER BY identifier
-                ASC LIMIT ? OFFSET ?
-                """
-
-        query = query.format(sql_helper)
+        if after:
+            where_clauses.append("payment_history.identifier > ?")
+            args.append(after)
+
+        query = f"""
+            SELECT
+                state_events.identifier, state_events.data, state_events.timestamp
+            FROM
+                payment_history
+            JOIN
+                state_events ON state_events.identifier = payment_history.identifier
+            WHERE
+                {" AND ".join(where_clauses)}
+            ORDER BY payment_history.identifier
+            ASC LIMIT ? OFFSET ?
+            """
         args.append(limit)
         args.append(offset)
         cursor.execute(query, args)
-        return [(entry[0], entry[1]) for entry in cursor]
+        return [(entry[0], entry[1], entry[2]) for entry in cursor]
 
     def get_events_with_timestamps(
         self,
@@ -828,18 +1132,18 @@ def get_events_with_timestamps(
         offset: int = None,
         filters: List[Tuple[str, Any]] = None,
         logical_and: bool = True,
-    ) -> List[Tuple[str, datetime]]:
+    ) -> List[Tuple[SerializedData, datetime]]:
         entries = self._query_events(
             limit=limit, offset=offset, filters=filters, logical_and=logical_and
         )
 
         return [(entry[0], entry[1]) for entry in entries]
 
-    def get_events(self, limit: int = None, offset: int = None) -> List[str]:
+    def get_events(self, limit: int = None, offset: int = None) -> List[SerializedData]:
         entries = self._query_events(limit, offset)
         return [entry[0] for entry in entries]
 
-    def get_state_changes(self, limit: int = None, offset: int = None) -> List[str]:
+    def get_state_changes(self, limit: int = None, offset: int = None) -> List[SerializedData]:
         entries = self._get_state_changes(limit, offset)
         return [entry.data for entry in entries]
 
@@ -854,7 +1158,7 @@ def get_snapshots(self) -> List[SnapshotEncodedRecord]:
             for snapshot in cursor
         ]
 
-    def update_snapshot(self, identifier: SnapshotID, new_snapshot: str) -> None:
+    def update_snapshot(self, identifier: SnapshotID, new_snapshot: SerializedData) -> None:
         cursor = self.conn.cursor()
         cursor.execute(
             "UPDATE state_snapshot SET data=? WHERE identifier=?", (new_snapshot, identifier)
@@ -889,6 +1193,67 @@ def transaction(self) -> Generator[None, None, None]:
         finally:
             self.in_transaction = False
 
+    def checkpoint(self) -> None:
+        """Copy the content of the write-ahead log back into the database and
+        truncate it. This is a noop for the other journal modes.
+
+        The checkpoint does not wait for readers, if there are any it may be
+        incomplete, and the remainder is copied by a later checkpoint.
+        """
+        if self.journal_mode is not SQLiteJournalMode.WAL:
+            return
+
+        assert not self.in_transaction, "A checkpoint can not be done inside a transaction"
+        busy, log_frames, checkpointed_frames = self.conn.execute(
+            "PRAGMA wal_checkpoint(TRUNCATE)"
+        ).fetchone()
+        log.debug(
+            "SQLite checkpoint",
+            busy=bool(busy),
+            log_frames=log_frames,
+            checkpointed_frames=checkpointed_frames,
+        )
+
+    def begin(self) -> None:
+        """Start a transaction which is kept open until `commit` is called.
+
+        Used to group multiple writes in a single commit, when the writes are
+        not lexically scoped and `transaction` can not be used.
+        """
+        self.conn.execute("BEGIN")
+        self.in_transaction = True
+
+    def commit(self) -> None:
+        """Commit the transaction started with `begin`, rolling it back on
+        failure.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("COMMIT")
+        except:  # noqa
+            if self.conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        finally:
+            self.in_transaction = False
+
+    @contextmanager
+    def savepoint(self, name: str) -> Generator[None, None, None]:
+        """Nested transaction, the changes done inside it are rolled back on
+        errors without affecting the enclosing transaction.
+        """
+        assert self.in_transaction, "A savepoint must be nested in a transaction"
+        cursor = self.conn.cursor()
+        cursor.execute(f"SAVEPOINT {name}")
+        try:
+            yield
+        except:  # noqa
+            cursor.execute(f"ROLLBACK TO {name}")
+            cursor.execute(f"RELEASE {name}")
+            raise
+        else:
+            cursor.execute(f"RELEASE {name}")
+
     def close(self) -> None:
         if not hasattr(self, "conn"):
             raise RuntimeError("The database connection was closed already.")
@@ -917,8 +1282,20 @@ class SerializedSQLiteStorage:
     applied the automatic encoding/deconding will not work.
     """
 
-    def __init__(self, database_path: DatabasePath, serializer: SerializationBase) -> None:
-        self.database = SQLiteStorage(database_path)
+    def __init__(
+        self,
+        database_path: DatabasePath,
+        serializer: SerializationBase,
+        journal_mode: SQLiteJournalMode = SQLiteJournalMode.PERSIST,
+        synchronous: Optional[SQLiteSynchronous] = None,
+        wal_autocheckpoint: Optional[int] = None,
+    ) -> None:
+        self.database = SQLiteStorage(
+            database_path,
+            journal_mode=journal_mode,
+            synchronous=synchronous,
+            wal_autocheckpoint=wal_autocheckpoint,
+        )
         self.serializer = serializer
 
     def update_version(self) -> None:  # pragma: no unittest
@@ -951,6 +1328,22 @@ def write_state_snapshot(
 
         return self.database.write_state_snapshot(serialized_data, statechange_id, statechange_qty)
 
+    def write_state_snapshot_delta(
+        self,
+        delta: ChainStateDelta,
+        base_snapshot_id: SnapshotID,
+        statechange_id: StateChangeID,
+        statechange_qty: int,
+    ) -> SnapshotDeltaID:
+        serialized_data = self.serializer.serialize(delta)
+
+        return self.database.write_state_snapshot_delta(
+            serialized_data, base_snapshot_id, statechange_id, statechange_qty
+        )
+
+    def prune_snapshots(self, keep: int) -> None:
+        self.database.prune_snapshots(keep)
+
     def write_events(self, events: List[Tuple[StateChangeID, Event]]) -> List[EventID]:
         """Save events.
 
@@ -961,7 +1354,8 @@ def write_events(self, events: List[Tuple[StateChangeID, Event]]) -> List[EventI
             (state_change_id, self.serializer.serialize(event))
             for state_change_id, event in events
         ]
-        return self.database.write_events(events_data)
+        payment_history = [payment_history_record(event) for _, event in events]
+        return self.database.write_events(events_data, payment_history)
 
     def get_snapshot_before_state_change(
         self, state_change_identifier: StateChangeID
@@ -973,11 +1367,23 @@ def get_snapshot_before_state_change(
 
         if row is not None:
             deserialized_data = self.serializer.deserialize(row.data)
+            state_change_qty = row.state_change_qty
+            last_applied_state_change_id = row.state_change_identifier or LOW_STATECHANGE_ULID
+
+            delta_row = self.database.get_snapshot_delta_before_state_change(
+                row.identifier, state_change_identifier
+            )
+            if delta_row is not None:
+                deserialized_data = apply_chain_state_delta(
+                    deserialized_data, self.serializer.deserialize(delta_row.data)
+                )
+                state_change_qty = delta_row.state_change_qty
+                last_applied_state_change_id = delta_row.state_change_identifier
 
             result = SnapshotRecord(
                 row.identifier,
-                row.state_change_qty,
-                row.state_change_identifier or LOW_STATECHANGE_ULID,
+                state_change_qty,
+                last_applied_state_change_id,
                 deserialized_data,
             )
         else:
@@ -1033,6 +1439,41 @@ def get_statechanges_by_range(self, db_range: Range[StateChangeID]) -> List[Stat
             for state_change_record in self.get_statechanges_records_by_range(db_range=db_range)
         ]
 
+    def count_state_changes_in_range(self, db_range: Range[StateChangeID]) -> int:
+        return self.database.count_state_changes_in_range(db_range)
+
+    def _deserialize_state_changes(
+        self, records: List[StateChangeEncodedRecord]
+    ) -> List[StateChange]:
+        return [self.serializer.deserialize(record.data) for record in records]
+
+    def get_statechanges_by_range_in_batches(
+        self, db_range: Range[StateChangeID], batch_size: int, prefetch_batches: int = 0
+    ) -> Iterator[List[StateChange]]:
+        """Yield the state changes in `db_range` in batches of `batch_size`.
+
+        With `prefetch_batches` up to that many of the following batches are
+        read and deserialized by the hub's threadpool while the caller works
+        on the current one, at most `prefetch_batches + 1` batches are in
+        memory.
+        """
+        batches = self.database.batch_query_statechanges_records_by_range(db_range, batch_size)
+
+        if prefetch_batches < 1:
+            for records in batches:
+                yield self._deserialize_state_changes(records)
+            return
+
+        threadpool = gevent.get_hub().threadpool
+        pending: Deque[AsyncResult] = deque()
+        for records in batches:
+            pending.append(threadpool.spawn(self._deserialize_state_changes, records))
+            if len(pending) > prefetch_batches:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
     def get_raiden_events_payment_history_with_timestamps(
         self,
         event_types: List[str],
@@ -1040,6 +1481,7 @@ def get_raiden_events_payment_history_with_timestamps(
         offset: int = None,
         token_network_address: TokenNetworkAddress = None,
         partner_address: Address = None,
+        after: EventID = None,
     ) -> List[TimestampedEvent]:
 
         events = self.database.get_raiden_events_payment_history_with_timestamps(
@@ -1048,10 +1490,11 @@ def get_raiden_events_payment_history_with_timestamps(
             offset=offset,
             token_network_address=token_network_address,
             partner_address=partner_address,
+            after=after,
         )
         return [
-            TimestampedEvent(self.serializer.deserialize(data), timestamp)
-            for data, timestamp in events
+            TimestampedEvent(self.serializer.deserialize(data), timestamp, event_identifier)
+            for event_identifier, data, timestamp in events
         ]
 
     def get_events_with_timestamps(
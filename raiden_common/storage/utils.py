@@ -42,13 +42,19 @@
 from dataclasses import dataclass
 from datetime import datetime
 
+from ulid import ULID
+
 from raiden_common.transfer.architecture import Event
+from raiden_common.utils.typing import Optional
 
 
 @dataclass
 class TimestampedEvent:
     event: Event
     log_time: datetime
+    # Only set for queries which support keyset pagination, the value is the
+    # `EventID` of the row, which is a `ULID`.
+    event_identifier: Optional[ULID] = None
 
     def __getattr__(self, item: str) -> Event:
         return getattr(self.event, item)
@@ -80,6 +86,23 @@ def __getattr__(self, item: str) -> Event:
 );
 """
 
+# Snapshot which contains only the parts of the state that changed since
+# `base_snapshot_id`, see `raiden_common.storage.delta_snapshot`.
+DB_CREATE_SNAPSHOT_DELTA = """
+CREATE TABLE IF NOT EXISTS state_snapshot_delta (
+    identifier ULID PRIMARY KEY NOT NULL,
+    base_snapshot_id ULID NOT NULL,
+    statechange_id ULID UNIQUE NOT NULL,
+    statechange_qty INTEGER,
+    data JSON,
+    timestamp TIMESTAMP DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')) NOT NULL,
+    FOREIGN KEY(base_snapshot_id) REFERENCES state_snapshot(identifier) ON DELETE CASCADE,
+    FOREIGN KEY(statechange_id) REFERENCES state_changes(identifier)
+);
+CREATE INDEX IF NOT EXISTS state_snapshot_delta_base
+    ON state_snapshot_delta(base_snapshot_id, identifier);
+"""
+
 DB_CREATE_STATE_EVENTS = """
 CREATE TABLE IF NOT EXISTS state_events (
     identifier ULID PRIMARY KEY NOT NULL,
@@ -88,6 +111,24 @@ def __getattr__(self, item: str) -> Event:
     timestamp TIMESTAMP DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')) NOT NULL,
     FOREIGN KEY(source_statechange_id) REFERENCES state_changes(identifier)
 );
+CREATE INDEX IF NOT EXISTS state_events_source_statechange_id
+    ON state_events(source_statechange_id);
+"""
+
+# Denormalized copy of the fields used to filter the payment history. Filtering
+# `state_events` directly requires `json_extract` on every row of the table.
+DB_CREATE_PAYMENT_HISTORY = """
+CREATE TABLE IF NOT EXISTS payment_history (
+    identifier ULID PRIMARY KEY NOT NULL,
+    event_type TEXT NOT NULL,
+    token_network_address TEXT NOT NULL,
+    partner_address TEXT NOT NULL,
+    FOREIGN KEY(identifier) REFERENCES state_events(identifier) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS payment_history_token_network_address
+    ON payment_history(token_network_address, identifier);
+CREATE INDEX IF NOT EXISTS payment_history_partner_address
+    ON payment_history(partner_address, identifier);
 """
 
 DB_CREATE_RUNS = """
@@ -100,13 +141,15 @@ def __getattr__(self, item: str) -> Event:
 DB_SCRIPT_CREATE_TABLES = """
 PRAGMA foreign_keys=off;
 BEGIN TRANSACTION;
-{}{}{}{}{}
+{}{}{}{}{}{}{}
 COMMIT;
 PRAGMA foreign_keys=on;
 """.format(
     DB_CREATE_SETTINGS,
     DB_CREATE_STATE_CHANGES,
     DB_CREATE_SNAPSHOT,
+    DB_CREATE_SNAPSHOT_DELTA,
     DB_CREATE_STATE_EVENTS,
+    DB_CREATE_PAYMENT_HISTORY,
     DB_CREATE_RUNS,
 )
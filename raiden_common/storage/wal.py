@@ -1,28 +1,38 @@
 import time
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
+import gevent
 import gevent.lock
 import structlog
+from gevent import Greenlet
+from gevent.event import AsyncResult
 
-from raiden_common.storage.serialization import DictSerializer
+from raiden_common.storage.copy_on_write import clone_chain_state, materialize_clone
+from raiden_common.storage.delta_snapshot import DeltaSnapshotTracker
 from raiden_common.storage.sqlite import (
     HIGH_STATECHANGE_ULID,
     LOW_STATECHANGE_ULID,
     EventID,
     Range,
+    SerializedData,
     SerializedSQLiteStorage,
+    SnapshotID,
+    SQLiteStorage,
     StateChangeID,
+    payment_history_record,
     write_events,
     write_state_change,
 )
 from raiden_common.transfer.architecture import Event, State, StateChange, TransitionResult
+from raiden_common.transfer.state import ChainState
 from raiden_common.utils.copy import deepcopy
 from raiden_common.utils.formatting import to_checksum_address
-from raiden_common.utils.logging import redact_secret
+from raiden_common.utils.logging import LazyField, serialize_redacted
 from raiden_common.utils.typing import (
     Address,
+    Any,
     Callable,
     Generator,
     Generic,
@@ -31,6 +41,7 @@
     RaidenDBVersion,
     Tuple,
     TypeVar,
+    cast,
     typecheck,
 )
 
@@ -40,6 +51,11 @@
 ST = TypeVar("ST", bound=State)
 ST2 = TypeVar("ST2", bound=State)
 
+# Number of state changes read from the database at once when restoring the
+# state, and number of batches deserialized ahead of the replay.
+REPLAY_BATCH_SIZE = 1000
+REPLAY_PREFETCH_BATCHES = 2
+
 
 def restore_or_init_snapshot(
     storage: SerializedSQLiteStorage, node_address: Address, initial_state: State
@@ -80,6 +96,9 @@ def restore_state(
     storage: SerializedSQLiteStorage,
     state_change_identifier: StateChangeID,
     node_address: Address,
+    batch_size: int = REPLAY_BATCH_SIZE,
+    prefetch_batches: int = REPLAY_PREFETCH_BATCHES,
+    progress: Callable[["ReplayProgress"], None] = None,
 ) -> Optional[State]:
     snapshot = storage.get_snapshot_before_state_change(
         state_change_identifier=state_change_identifier
@@ -100,31 +119,68 @@ def restore_state(
         state_change_range=Range(snapshot.state_change_identifier, state_change_identifier),
         storage=storage,
         transition_function=transition_function,
+        batch_size=batch_size,
+        prefetch_batches=prefetch_batches,
+        progress=progress,
     )
     return state
 
 
+@dataclass(frozen=True)
+class ReplayProgress:
+    """Progress of the replay of the state changes during a restore."""
+
+    replayed: int
+    total: int
+    elapsed: float
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds until all the state changes are replayed, `None`
+        until the first batch is replayed.
+        """
+        if self.replayed == 0:
+            return None
+        return self.elapsed / self.replayed * (self.total - self.replayed)
+
+
 def replay_state_changes(
     node_address: Address,
     state: State,
     state_change_range: Range[StateChangeID],
     storage: SerializedSQLiteStorage,
     transition_function: Callable[[State, StateChange], TransitionResult[State]],
+    batch_size: int = REPLAY_BATCH_SIZE,
+    prefetch_batches: int = REPLAY_PREFETCH_BATCHES,
+    progress: Callable[[ReplayProgress], None] = None,
 ) -> Tuple[State, int]:
-    unapplied_state_changes = storage.get_statechanges_by_range(state_change_range)
+    """Apply the state changes in `state_change_range` to `state`.
 
-    log.debug(
-        "Replaying state changes",
-        replayed_state_changes=[
-            redact_secret(DictSerializer.serialize(state_change))
-            for state_change in unapplied_state_changes
-        ],
-        node=to_checksum_address(node_address),
+    The state changes are streamed in batches of `batch_size`, the next
+    `prefetch_batches` batches are deserialized in the background while the
+    current one is replayed. `progress` is called after every batch.
+    """
+    total = storage.count_state_changes_in_range(state_change_range)
+    start = time.monotonic()
+    replayed = 0
+
+    batches = storage.get_statechanges_by_range_in_batches(
+        state_change_range, batch_size=batch_size, prefetch_batches=prefetch_batches
     )
-    for state_change in unapplied_state_changes:
-        state, _ = dispatch(state, transition_function, state_change)
+    for unapplied_state_changes in batches:
+        log.debug(
+            "Replaying state changes",
+            replayed_state_changes=LazyField(serialize_redacted, unapplied_state_changes),
+            node=to_checksum_address(node_address),
+        )
+        for state_change in unapplied_state_changes:
+            state, _ = dispatch(state, transition_function, state_change)
+
+        replayed += len(unapplied_state_changes)
+        if progress is not None:
+            progress(ReplayProgress(replayed, total, time.monotonic() - start))
 
-    return state, len(unapplied_state_changes)
+    return state, replayed
 
 
 @dataclass(frozen=True)
@@ -139,6 +195,30 @@ class SavedState(Generic[ST]):
     state: ST
 
 
+@dataclass
+class CommitStats:
+    """Number of database commits done by the write-ahead log.
+
+    With group commit a single commit is shared by multiple batches of state
+    changes, `batches / commits` is the average group size.
+    """
+
+    started_at: float = field(default_factory=time.monotonic)
+    commits: int = 0
+    batches: int = 0
+
+    def record(self, batches: int) -> None:
+        self.commits += 1
+        self.batches += batches
+
+    @property
+    def commits_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        if elapsed <= 0:
+            return 0.0
+        return self.commits / elapsed
+
+
 class AtomicStateChangeDispatcher(ABC, Generic[ST]):
     @abstractmethod
     def dispatch(self, state_change: StateChange) -> List[Event]:
@@ -152,12 +232,23 @@ def latest_state(self) -> ST:
 T = TypeVar("T")
 
 
-def clone_state(state: T) -> T:
+def clone_state(state: T, copy_on_write: bool = False) -> T:
     # The state objects must be treated as immutable, so make a copy of the
     # current state and pass the copy to the state machine to be modified.
+    #
+    # With `copy_on_write` the channels, payment tasks and queues of a
+    # `ChainState` are only copied once the state machine accesses them.
     before_copy = time.time()
-    copy_state = deepcopy(state)
-    log.debug("Copied state before applying state changes", duration=time.time() - before_copy)
+    copy_state: Any
+    if copy_on_write and isinstance(state, ChainState):
+        copy_state = clone_chain_state(state)
+    else:
+        copy_state = deepcopy(state)
+    log.debug(
+        "Copied state before applying state changes",
+        duration=time.time() - before_copy,
+        copy_on_write=copy_on_write,
+    )
     return copy_state
 
 
@@ -185,6 +276,14 @@ def __init__(
         state: ST,
         storage: SerializedSQLiteStorage,
         state_transition: Callable[[ST, StateChange], TransitionResult[ST]],
+        copy_on_write: bool = False,
+        group_commit_window: Optional[float] = None,
+        group_commit_max_batches: int = 64,
+        checkpoint_on_snapshot: bool = False,
+        delta_snapshots: bool = False,
+        snapshot_rebase_interval: int = 10,
+        snapshot_keep_bases: Optional[int] = None,
+        background_snapshots: bool = False,
     ) -> None:
         self.storage = storage
         self.state = state
@@ -192,6 +291,37 @@ def __init__(
             raise ValueError("state_transition must be a callable")
 
         self.state_transition = state_transition
+        self.copy_on_write = copy_on_write
+        self.checkpoint_on_snapshot = checkpoint_on_snapshot
+
+        # With delta snapshots only every `snapshot_rebase_interval`-th
+        # snapshot is a full one, the others store the changes since it. Full
+        # snapshots older than the last `snapshot_keep_bases` are deleted.
+        self.snapshot_rebase_interval = snapshot_rebase_interval
+        self.snapshot_keep_bases = snapshot_keep_bases
+        self._delta_tracker: Optional[DeltaSnapshotTracker] = None
+        if delta_snapshots:
+            self._delta_tracker = DeltaSnapshotTracker(
+                storage.serializer, track_identity=copy_on_write
+            )
+
+        # With background snapshots the serialization and the insert do not
+        # block the dispatch of state changes.
+        self.background_snapshots = background_snapshots
+        self._snapshot_worker: Optional[Greenlet] = None
+        self._pending_snapshot: Optional[Tuple[ST, StateChangeID, int]] = None
+
+        # With group commit the batches of state changes dispatched within
+        # `group_commit_window` seconds share a single database transaction,
+        # every batch is written in its own savepoint. `None` disables it.
+        self.group_commit_window = group_commit_window
+        self.group_commit_max_batches = group_commit_max_batches
+        self.commit_stats = CommitStats()
+        self._group_commit: Optional[AsyncResult] = None
+        self._group_commit_batches = 0
+        # The states before the open group, restored if its commit fails so
+        # that the state in memory never gets ahead of the database.
+        self._group_restore_point: Optional[Tuple[ST, Optional[SavedState[ST]]]] = None
 
         # The state changes must be applied in the same order as they are saved
         # to the WAL. Because writing to the database context switches, and the
@@ -199,6 +329,114 @@ def __init__(
         # execution order.
         self._lock = gevent.lock.Semaphore()
 
+    @contextmanager
+    def _batch_transaction(self) -> Generator[Optional[AsyncResult], None, None]:
+        """Transaction for a batch of state changes.
+
+        Without group commit every batch is committed on its own. Otherwise
+        the batch joins the open group and the returned `AsyncResult` is set
+        once the group is committed. Must be called with the lock held.
+        """
+        database = self.storage.database
+
+        if self.group_commit_window is None:
+            with database.transaction():
+                yield None
+            self.commit_stats.record(batches=1)
+            return
+
+        if self._group_commit is None:
+            database.begin()
+            self._group_commit = AsyncResult()
+            self._group_restore_point = (self.state, getattr(self, "saved_state", None))
+            gevent.spawn_later(
+                self.group_commit_window, self._commit_group_after_window, self._group_commit
+            )
+
+        group = self._group_commit
+        with database.savepoint("state_change_batch"):
+            yield group
+        self._group_commit_batches += 1
+
+        if self._group_commit_batches >= self.group_commit_max_batches:
+            self._commit_group()
+
+    def _commit_group(self) -> Optional[AsyncResult]:
+        """Commit the open group, if any. Must be called with the lock held.
+
+        Errors are not raised, they are set in the returned `AsyncResult`,
+        which is also used by the batches waiting for the commit. On errors
+        the state is restored to the one before the group.
+        """
+        group = self._group_commit
+        if group is None:
+            return None
+
+        batches = self._group_commit_batches
+        restore_point = self._group_restore_point
+        self._group_commit = None
+        self._group_commit_batches = 0
+        self._group_restore_point = None
+
+        try:
+            self.storage.database.commit()
+        except Exception as e:  # pylint: disable=broad-except
+            assert restore_point is not None, "The group must have a restore point"
+            state, saved_state = restore_point
+            self.state = state
+            if saved_state is not None:
+                self.saved_state = saved_state
+            else:
+                # No state change was saved before the group
+                vars(self).pop("saved_state", None)
+
+            log.error("Group commit failed, state restored", batches=batches, error=str(e))
+            group.set_exception(e)
+        else:
+            self.commit_stats.record(batches=batches)
+            group.set(batches)
+            log.debug(
+                "Group commit",
+                batches=batches,
+                commits_per_second=self.commit_stats.commits_per_second,
+            )
+
+        return group
+
+    def _commit_group_after_window(self, group: AsyncResult) -> None:
+        with self._lock:
+            # The group may have been committed already because it was full
+            if self._group_commit is group:
+                self._commit_group()
+
+    def flush(self) -> None:
+        """Wait for the background snapshot and commit the batches of state
+        changes waiting for a group commit.
+        """
+        worker = self._snapshot_worker
+        if worker is not None:
+            self._snapshot_worker = None
+            worker.get()
+
+        with self._lock:
+            group = self._commit_group()
+
+        if group is not None:
+            group.get()
+
+    @contextmanager
+    def maintenance(self) -> Generator[SQLiteStorage, None, None]:
+        """Exclusive access to the database, with no batch of state changes
+        waiting for a group commit. Used for maintenance tasks, like the
+        compaction, which must not interleave with the writes of the node.
+        """
+        with self._lock:
+            group = self._commit_group()
+            if group is not None:
+                group.get()
+
+            yield self.storage.database
+
     @contextmanager
     def process_state_change_atomically(
         self,
@@ -240,21 +478,24 @@ def write_state_change_and_events(
                 )
 
                 event_data = []
+                payment_history = []
                 for event in events:
                     event_data.append((state_change_id, self.storage.serializer.serialize(event)))
+                    payment_history.append(payment_history_record(event))
 
                 write_events(
                     ulid_factory=self.storage.database._ulid_factory(EventID),
                     cursor=cursor,
                     events=event_data,
+                    payment_history=payment_history,
                 )
 
                 return state_change_id
 
         with self._lock:
-            cloned_state = clone_state(self.state)
+            cloned_state = clone_state(self.state, copy_on_write=self.copy_on_write)
 
-            with self.storage.database.transaction():
+            with self._batch_transaction() as group_commit:
                 dispatcher = _AtomicStateChangeDispatcher(
                     state=cloned_state,
                     storage=self.storage,
@@ -262,6 +503,9 @@ def write_state_change_and_events(
                 )
                 yield dispatcher
 
+            if self.copy_on_write and isinstance(cloned_state, ChainState):
+                materialize_clone(cloned_state)
+
             self.state = cloned_state
 
             # When no state change was applied, do not update saved state
@@ -270,18 +514,132 @@ def write_state_change_and_events(
                 # that readers will have a consistent view of it.
                 self.saved_state = SavedState(dispatcher.last_state_change_id, self.state)
 
+        # The effects of the state changes must only be triggered once they
+        # are durable, so wait for the group commit outside of the lock, to
+        # allow other batches to join the group.
+        if group_commit is not None:
+            group_commit.get()
+
     def snapshot(self, statechange_qty: int) -> None:
         """Snapshot the application state.
 
         Snapshots are used to restore the application state, either after a
         restart or a crash.
+
+        With background snapshots only a reference to the current state is
+        taken here, the state is serialized and written by a worker greenlet
+        without holding the lock. Use `flush` to wait for it.
         """
+        worker = self._snapshot_worker
+        if worker is not None and worker.ready():
+            # Re-raise the error of the last background snapshot, if any
+            self._snapshot_worker = None
+            worker.get()
+
         with self._lock:
             state_change_id = self.saved_state.state_change_id
 
             # otherwise no state change was dispatched
-            if state_change_id and self.state is not None:
-                self.storage.write_state_snapshot(self.state, state_change_id, statechange_qty)
+            if not state_change_id or self.state is None:
+                return
+
+            if self.background_snapshots:
+                # The dispatched states are never modified, the state machine
+                # works on a clone. If the worker falls behind, only the
+                # newest pending snapshot is written.
+                self._pending_snapshot = (self.state, state_change_id, statechange_qty)
+                if self._snapshot_worker is None:
+                    self._snapshot_worker = gevent.spawn(self._write_pending_snapshots)
+                return
+
+            data, base_snapshot_id = self._serialize_snapshot(self.state)
+            snapshot_id = self._store_snapshot(
+                data, base_snapshot_id, state_change_id, statechange_qty
+            )
+            tracker = self._delta_tracker_for(self.state)
+            if snapshot_id is not None and tracker is not None:
+                tracker.rebase(cast(ChainState, self.state), snapshot_id)
+
+    def _write_pending_snapshots(self) -> None:
+        threadpool = gevent.get_hub().threadpool
+
+        while self._pending_snapshot is not None:
+            state, state_change_id, statechange_qty = self._pending_snapshot
+            self._pending_snapshot = None
+
+            before_serialize = time.time()
+            data, base_snapshot_id = threadpool.apply(self._serialize_snapshot, (state,))
+            log.debug(
+                "Serialized snapshot in the background",
+                duration=time.time() - before_serialize,
+                delta=base_snapshot_id is not None,
+            )
+
+            with self._lock:
+                snapshot_id = self._store_snapshot(
+                    data, base_snapshot_id, state_change_id, statechange_qty
+                )
+
+            tracker = self._delta_tracker_for(state)
+            if snapshot_id is not None and tracker is not None:
+                threadpool.apply(tracker.rebase, (state, snapshot_id))
+
+    def _delta_tracker_for(self, state: ST) -> Optional[DeltaSnapshotTracker]:
+        if isinstance(state, ChainState):
+            return self._delta_tracker
+        return None
+
+    def _serialize_snapshot(self, state: ST) -> Tuple[SerializedData, Optional[SnapshotID]]:
+        """Serialize `state`, as a delta if one is due, and return the data
+        with the identifier of the delta's base snapshot.
+
+        This does not use the database, background snapshots run it in a
+        worker thread.
+        """
+        tracker = self._delta_tracker_for(state)
+        if (
+            tracker is not None
+            and tracker.base_snapshot_id is not None
+            and tracker.deltas_since_base < self.snapshot_rebase_interval
+        ):
+            delta = tracker.make_delta(cast(ChainState, state))
+            base_snapshot_id = cast(SnapshotID, tracker.base_snapshot_id)
+            return self.storage.serializer.serialize(delta), base_snapshot_id
+
+        return self.storage.serializer.serialize(state), None
+
+    def _store_snapshot(
+        self,
+        data: SerializedData,
+        base_snapshot_id: Optional[SnapshotID],
+        state_change_id: StateChangeID,
+        statechange_qty: int,
+    ) -> Optional[SnapshotID]:
+        """Write a serialized snapshot, returns the identifier of full
+        snapshots. Must be called with the lock held.
+        """
+        group = self._commit_group()
+        if group is not None:
+            group.get()
+
+        database = self.storage.database
+        snapshot_id: Optional[SnapshotID] = None
+        if base_snapshot_id is not None:
+            database.write_state_snapshot_delta(
+                data, base_snapshot_id, state_change_id, statechange_qty
+            )
+        else:
+            snapshot_id = database.write_state_snapshot(data, state_change_id, statechange_qty)
+            if self.snapshot_keep_bases is not None:
+                database.prune_snapshots(self.snapshot_keep_bases)
+
+        # Snapshots are rare and the write-ahead log contains at least the
+        # state changes since the last one, which makes this a good moment
+        # to bound its size.
+        if self.checkpoint_on_snapshot:
+            database.checkpoint()
+
+        return snapshot_id
 
     def get_current_state(self) -> ST:
         """Returns the current node state."""
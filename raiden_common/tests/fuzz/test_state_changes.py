@@ -225,6 +225,18 @@ def assert_channel_state_invariants(self):
             partner_amount_locked = channel.get_amount_locked(partner_state)
             partner_balance = channel.get_balance(partner_state, our_state)
 
+            # The locked amounts are kept up to date with the locks
+            for end_state, amount_locked in (
+                (our_state, our_amount_locked),
+                (partner_state, partner_amount_locked),
+            ):
+                locks = (
+                    list(end_state.secrethashes_to_lockedlocks.values())
+                    + list(end_state.secrethashes_to_unlockedlocks.values())
+                    + list(end_state.secrethashes_to_onchain_unlockedlocks.values())
+                )
+                assert amount_locked == sum(lock.amount for lock in locks)
+
             # invariant (5.1R), add withdrawn amounts when implemented
             assert 0 <= our_amount_locked <= our_balance
             assert 0 <= partner_amount_locked <= partner_balance
@@ -3,16 +3,16 @@
 import gevent
 import pytest
 from eth_utils import encode_hex
-from gevent import Timeout
 from gevent.event import Event
 from matrix_client.errors import MatrixRequestError
 from matrix_client.user import User
 
-from raiden_common.constants import Environment, MatrixMessageType
+from raiden_common.constants import EMPTY_SIGNATURE, Environment, MatrixMessageType
+from raiden_common.messages.synchronization import Delivered
 from raiden_common.messages.transfers import SecretRequest
 from raiden_common.network.transport import MatrixTransport
 from raiden_common.network.transport.matrix.client import GMatrixHttpApi
-from raiden_common.network.transport.matrix.transport import RETRY_QUEUE_IDLE_AFTER, _RetryQueue
+from raiden_common.network.transport.matrix.transport import _RetryQueue
 from raiden_common.settings import MatrixTransportConfig
 from raiden_common.storage.serialization.serializer import MessageSerializer
 from raiden_common.tests.utils import factories
@@ -440,34 +440,111 @@ def test_retry_queue_does_not_resend_removed_messages(
     assert len(mock_matrix.sent_messages) == 1  # type: ignore
 
 
-@pytest.mark.parametrize("retry_interval_initial", [0.05])
-def test_retryqueue_idle_terminate(mock_matrix: MatrixTransport, retry_interval_initial: float):
-    """Ensure ``RetryQueue``s exit if they are idle for too long."""
+@pytest.mark.usefixtures("record_sent_messages")
+def test_retry_queue_ignores_duplicates(mock_matrix: MatrixTransport) -> None:
+    """
+    Ensure the ``RetryQueue`` ignores messages which are already queued, keeps
+    the messages in order and removes the ones which are only sent once.
+    """
+    # Pretend the Transport greenlet is running
+    mock_matrix.greenlet = True
+
+    receiver_address = Address(factories.HOP1)
+    retry_queue = _RetryQueue(transport=mock_matrix, receiver=receiver_address)
+
+    message_event1 = make_message_event(receiver_address)
+    message1 = make_message(message_event=message_event1)
+    message_event2 = make_message_event(receiver_address)
+    message2 = make_message(message_event=message_event2)
+    queue_identifier = message_event1.queue_identifier
+    mock_matrix._queueids_to_queues[queue_identifier] = [message_event1, message_event2]
+
+    retry_queue.enqueue(queue_identifier, [(message1, None), (message2, None)])
+    # The same message, and an equivalent message with the same identifier
+    retry_queue.enqueue(queue_identifier, [(message1, None)])
+    retry_queue.enqueue(queue_identifier, [(make_message(message_event=message_event1), None)])
+    assert len(retry_queue._message_queue) == 2
+
+    # Messages which are not retried are compared by their content
+    delivered1 = Delivered(
+        delivered_message_identifier=make_message_identifier(), signature=EMPTY_SIGNATURE
+    )
+    delivered2 = Delivered(
+        delivered_message_identifier=make_message_identifier(), signature=EMPTY_SIGNATURE
+    )
+    retry_queue.enqueue_unordered(delivered1)
+    retry_queue.enqueue_unordered(
+        Delivered(
+            delivered_message_identifier=delivered1.delivered_message_identifier,
+            signature=EMPTY_SIGNATURE,
+        )
+    )
+    retry_queue.enqueue_unordered(delivered2)
+    assert len(retry_queue._message_queue) == 4
+
+    retry_queue._check_and_send()
+
+    assert [message for _, message in mock_matrix.sent_messages] == [  # type: ignore
+        MessageSerializer.serialize(message1),
+        MessageSerializer.serialize(message2),
+        MessageSerializer.serialize(delivered1),
+        MessageSerializer.serialize(delivered2),
+    ]
+    assert [data.message for data in retry_queue._message_queue.values()] == [message1, message2]
+
+    mock_matrix._queueids_to_queues[queue_identifier].clear()
+
+
+@pytest.mark.parametrize("retry_interval_initial", [0.1])
+@pytest.mark.usefixtures("record_sent_messages")
+def test_retry_scheduler_wakes_up_when_due(
+    mock_matrix: MatrixTransport, retry_interval_initial: float, monkeypatch
+) -> None:
+    """Ensure the ``RetryQueue``s are only checked when a message is due."""
+    # Pretend the Transport greenlet is running
+    mock_matrix.greenlet = True
+
     retry_queue = mock_matrix._get_retrier(Address(factories.HOP1))
-    idle_after = RETRY_QUEUE_IDLE_AFTER * retry_interval_initial
+    check_count = 0
+    original_check_and_send = retry_queue._check_and_send
 
-    with Timeout(idle_after + (retry_interval_initial * 5)):
-        # Retry
-        while not gevent.joinall({retry_queue.greenlet}, idle_after / 2, raise_error=True):
-            pass
+    def check_and_send():
+        nonlocal check_count
+        check_count += 1
+        return original_check_and_send()
 
-    assert retry_queue.greenlet.ready()
-    assert retry_queue._idle_since == RETRY_QUEUE_IDLE_AFTER
-    assert retry_queue.is_idle
+    monkeypatch.setattr(retry_queue, "_check_and_send", check_and_send)
 
-    retry_queue_2 = mock_matrix._get_retrier(Address(factories.HOP1))
+    message_event = make_message_event(recipient=Address(factories.HOP1))
+    message = make_message(message_event=message_event)
+    mock_matrix._queueids_to_queues[message_event.queue_identifier] = [message_event]
+    retry_queue.enqueue(message_event.queue_identifier, [(message, None)])
+
+    gevent.sleep(retry_interval_initial / 2)
+    assert check_count == 1
+    assert len(mock_matrix.sent_messages) == 1  # type: ignore
+
+    gevent.sleep(retry_interval_initial)
+    assert check_count == 2
+    assert len(mock_matrix.sent_messages) == 2  # type: ignore
 
-    # Since the initial RetryQueue has exited `get_retrier()` must return a new instance
-    assert retry_queue_2 is not retry_queue
+    mock_matrix._queueids_to_queues[message_event.queue_identifier].clear()
+    gevent.sleep(retry_interval_initial)
+    assert check_count == 3
+    assert len(mock_matrix.sent_messages) == 2  # type: ignore
+
+    # The queue is empty and not scheduled anymore
+    gevent.sleep(retry_interval_initial * 2)
+    assert check_count == 3
+    assert retry_queue.scheduled_at is None
+    assert not retry_queue._message_queue
 
 
 @pytest.mark.parametrize("retry_interval_initial", [0.05])
-def test_retryqueue_not_idle_with_messages(
-    mock_matrix: MatrixTransport, retry_interval_initial: float
-) -> None:
-    """Ensure ``RetryQueue``s don't become idle while messages remain in the internal queue."""
+def test_retryqueue_is_reused(mock_matrix: MatrixTransport, retry_interval_initial: float) -> None:
+    """Ensure there is a single ``RetryQueue`` per receiver and a single scheduler."""
     retry_queue = mock_matrix._get_retrier(Address(factories.HOP1))
-    idle_after = RETRY_QUEUE_IDLE_AFTER * retry_interval_initial
+    retry_scheduler = mock_matrix._retry_scheduler
 
     queue_identifier = QueueIdentifier(
         recipient=Address(factories.HOP1),
@@ -475,16 +552,16 @@ def test_retryqueue_not_idle_with_messages(
     )
     retry_queue.enqueue(queue_identifier, [(make_message(), None)])
 
-    # Wait for the idle timeout to expire
-    gevent.sleep(idle_after + (retry_interval_initial * 5))
+    gevent.sleep(retry_interval_initial * 5)
 
-    assert not retry_queue.greenlet.ready()
-    assert retry_queue._idle_since == 0
-    assert not retry_queue.is_idle
+    # The transport is not started, the message is kept to be retried later
+    assert retry_scheduler.is_running()
+    assert retry_queue.scheduled_at is not None
+    assert len(retry_queue._message_queue) == 1
 
     retry_queue_2 = mock_matrix._get_retrier(Address(factories.HOP1))
-    # The first queue has never become idle, therefore the same object must be returned
     assert retry_queue is retry_queue_2
+    assert mock_matrix._retry_scheduler is retry_scheduler
 
 
 def test_retryqueue_enqueue_not_blocking(mock_matrix: MatrixTransport, monkeypatch) -> None:
@@ -536,3 +613,49 @@ def send_raw_blocking(
 
     assert call_count == 2
     assert len(retry_queue._message_queue) == 1
+
+
+def test_to_device_messages_are_coalesced(mock_matrix: MatrixTransport, monkeypatch) -> None:
+    """Ensure to-device messages to different receivers share a single request.
+
+    Messages to the same (user, device) pair must still be sent in order, with
+    separate requests, and the request size limit must be respected.
+    """
+    requests = []
+
+    def send_to_device(event_type, messages):  # pylint: disable=unused-argument
+        requests.append(messages)
+
+    monkeypatch.setattr(mock_matrix._client.api, "send_to_device", send_to_device)
+    mock_matrix._config.send_max_request_size = 10
+
+    mock_matrix._send_to_device_raw({USERID0}, "first", "DEVICE")
+    mock_matrix._send_to_device_raw({USERID1}, "second", "DEVICE")
+    mock_matrix._send_to_device_raw({USERID0}, "third", "DEVICE")
+    assert requests == [], "Messages must be collected for the flush latency"
+
+    gevent.joinall({mock_matrix._to_device_batcher.greenlet}, raise_error=True)
+
+    def bodies(request):
+        return {user_id: devices["DEVICE"]["body"] for user_id, devices in request.items()}
+
+    assert [bodies(request) for request in requests] == [
+        {USERID0: "first"},
+        {USERID1: "second"},
+        {USERID0: "third"},
+    ]
+
+    requests.clear()
+    mock_matrix._config.send_max_request_size = 1000
+    mock_matrix._send_to_device_raw({USERID0}, "first", "DEVICE")
+    mock_matrix._send_to_device_raw({USERID1}, "second", "DEVICE")
+    mock_matrix._send_to_device_raw({USERID0}, "third", "DEVICE")
+    gevent.joinall({mock_matrix._to_device_batcher.greenlet}, raise_error=True)
+
+    assert [bodies(request) for request in requests] == [
+        {USERID0: "first", USERID1: "second"},
+        {USERID0: "third"},
+    ]
+    assert mock_matrix._to_device_batcher.submitted == 6
+    assert mock_matrix._to_device_batcher.requests == 5
+    assert mock_matrix._to_device_batcher.requests_saved == 1
@@ -20,6 +20,7 @@
     SendWithdrawRequest,
 )
 from raiden_common.transfer.identifiers import CanonicalIdentifier, QueueIdentifier
+from raiden_common.transfer.state import MessageQueue
 from raiden_common.transfer.state_change import Block
 from raiden_common.utils.typing import (
     BlockExpiration,
@@ -152,6 +153,9 @@ def test_restore_queueids_to_queues(chain_state, netting_channel_state):
     deserialized_chain_state = JSONSerializer.deserialize(serialized_chain_state)
 
     assert chain_state == deserialized_chain_state
+    deserialized_queue = deserialized_chain_state.queueids_to_queues[queue_identifier]
+    assert isinstance(deserialized_queue, MessageQueue)
+    assert deserialized_queue.get_messages(msg_args["message_identifier"]) == tuple(messages)
 
 
 def test_serialize_contract_send_subclass(chain_state):
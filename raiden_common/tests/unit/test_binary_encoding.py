@@ -7,6 +7,7 @@
 from raiden_common.messages.healthcheck import Ping
 from raiden_common.messages.synchronization import Processed
 from raiden_common.tests.utils import factories
+from raiden_common.utils import signer as signer_module
 from raiden_common.utils.signer import LocalSigner, recover
 
 PRIVKEY, ADDRESS = factories.make_privkey_address()
@@ -43,6 +44,28 @@ def test_signature():
         recover(message_data, signature)
 
 
+@pytest.mark.parametrize("coincurve", [True, False])
+def test_recover(monkeypatch, coincurve):
+    if not coincurve:
+        monkeypatch.setattr(signer_module, "CoincurvePublicKey", None)
+    signer_module._recover_address.cache_clear()
+
+    message_data = bytes(random.getrandbits(8) for _ in range(100))
+    for v in (0, 27):
+        signature = signer.sign(data=message_data, v=v)
+        assert ADDRESS == recover(message_data, signature)
+        assert ADDRESS == recover(message_data, signature)
+
+    # pylint: disable-next=no-value-for-parameter
+    assert signer_module._recover_address.cache_info().hits == 2
+
+    for v in (2, 29):
+        with pytest.raises(InvalidSignature):
+            recover(message_data, signature[:-1] + bytes([v]))
+    with pytest.raises(InvalidSignature):
+        recover(message_data, constants.EMPTY_SIGNATURE)
+
+
 def test_encoding():
     ping = Ping(
         nonce=0,
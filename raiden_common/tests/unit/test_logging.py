@@ -6,6 +6,7 @@
 
 from raiden_common.exceptions import ConfigurationError
 from raiden_common.log_config import LogFilter, configure_logging
+from raiden_common.utils.logging import LazyField, redact_secret
 
 
 def test_log_filter():
@@ -157,3 +158,28 @@ def test_that_secret_is_redacted(capsys, tmpdir):
 
     assert secret not in captured.err
     assert '"secret": "<redacted>"' in captured.err
+
+
+def test_lazy_fields_are_only_resolved_when_emitted(capsys, tmpdir):
+    configure_logging(
+        {"": "INFO"}, debug_log_file_path=str(tmpdir / "raiden-debug.log"), colorize=False
+    )
+    log = structlog.get_logger("test")
+    calls = []
+
+    def serialize(value):
+        calls.append(value)
+        return {"secret": value, "value": value}
+
+    log.debug("filtered event", data=LazyField(serialize, "first"))
+    assert calls == []
+    assert "filtered event" not in capsys.readouterr().err
+
+    log.info("emitted event", data=LazyField(redact_secret, {"secret": "hidden", "value": 2}))
+    log.info("emitted event", data=LazyField(serialize, "second"))
+    assert calls == ["second"]
+
+    captured = capsys.readouterr()
+    assert "hidden" not in captured.err
+    assert "'value': 2" in captured.err
+    assert "'value': 'second'" in captured.err
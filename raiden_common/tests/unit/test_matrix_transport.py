@@ -9,6 +9,7 @@
 import responses
 from eth_utils import decode_hex, encode_hex, to_canonical_address, to_normalized_address
 from flask_restful.representations import json
+from gevent.event import Event
 from matrix_client.errors import MatrixRequestError
 from matrix_client.user import User
 
@@ -18,6 +19,7 @@
 from raiden_common.exceptions import TransportError
 from raiden_common.messages.synchronization import Processed
 from raiden_common.messages.transfers import RevealSecret
+from raiden_common.network.transport.matrix.client import GMatrixClient
 from raiden_common.network.transport.matrix.utils import (
     MessageAckTimingKeeper,
     login,
@@ -25,8 +27,10 @@
     make_message_batches,
     my_place_or_yours,
     sort_servers_closest,
+    validate_and_parse_message,
     validate_userid_signature,
 )
+from raiden_common.storage.serialization.serializer import MessageSerializer
 from raiden_common.tests.utils.factories import make_secret, make_signature, make_signer
 from raiden_common.tests.utils.transport import ignore_messages
 from raiden_common.utils.cli import get_matrix_servers
@@ -255,6 +259,74 @@ def test_make_message_batches(message_list, expected_batch_count, should_raise,
         assert sum(len(batch.split("\n")) for batch in batches) == len(message_list)
 
 
+@pytest.mark.parametrize("message_count", [1, 100])
+def test_validate_and_parse_message(message_count):
+    """The senders of large batches are recovered by the threadpool, in chunks."""
+    signer = make_signer()
+    other_signer = make_signer()
+
+    messages = []
+    for message_identifier in range(message_count):
+        message = Processed(
+            message_identifier=MessageID(message_identifier), signature=make_signature()
+        )
+        message.sign(signer if message_identifier % 3 else other_signer)
+        messages.append(message)
+    data = "\n".join(MessageSerializer.serialize(message) for message in messages)
+
+    parsed_messages = validate_and_parse_message(data, signer.address)
+
+    assert [message.message_identifier for message in parsed_messages] == [
+        message.message_identifier for message in messages if message.sender == signer.address
+    ]
+
+
+def test_sync_is_throttled_by_queued_responses():
+    """The sync overlaps with processing, but stops once too many responses are queued."""
+    max_queued_responses = 3
+    processing_done = Event()
+    sync_calls = 0
+
+    def handle_messages(messages):  # pylint: disable=unused-argument
+        processing_done.wait()
+        return True
+
+    def sync(since, timeout_ms, filter):  # pylint: disable=unused-argument,redefined-builtin
+        nonlocal sync_calls
+        sync_calls += 1
+        gevent.sleep(0.001)
+        return {
+            "next_batch": str(sync_calls),
+            "presence": {"events": []},
+            "to_device": {"events": [{"type": "m.room.message"}]},
+        }
+
+    client = GMatrixClient(
+        handle_messages, base_url="http://none", max_queued_responses=max_queued_responses
+    )
+    client.user_id = f"@{to_normalized_address(make_signer().address)}:none"
+    client.api.sync = sync
+    client.start_listener_thread(timeout_ms=20_000, latency_ms=5_000)
+
+    gevent.sleep(0.1)
+    # One response is being processed while the following ones are queued
+    assert sync_calls == max_queued_responses
+    assert len(client.response_queue) == max_queued_responses
+    assert client.sync_progress.metrics.processing.count == 0
+
+    processing_done.set()
+    gevent.sleep(0.1)
+    client.stop_listener_thread()
+
+    metrics = client.sync_progress.metrics
+    assert sync_calls > max_queued_responses
+    # The request interrupted by the stop is not recorded
+    assert sync_calls - 1 <= metrics.request.count <= sync_calls
+    assert metrics.backpressure.count > 0
+    assert metrics.processing.count > 0
+    assert metrics.queue.count >= metrics.processing.count
+
+
 def test_message_ack_timing_keeper_edge_cases():
     matk = MessageAckTimingKeeper()
 
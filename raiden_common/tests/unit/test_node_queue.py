@@ -1,16 +1,26 @@
 import random
+from copy import copy
 
 from raiden_common.constants import EMPTY_HASH
+from raiden_common.storage.wal import clone_state
 from raiden_common.tests.utils import factories
 from raiden_common.transfer import node, state, state_change
-from raiden_common.transfer.events import SendWithdrawRequest
+from raiden_common.transfer.architecture import TransitionResult
+from raiden_common.transfer.events import (
+    ContractSendChannelClose,
+    ContractSendChannelWithdraw,
+    ContractSendSecretReveal,
+    SendWithdrawRequest,
+)
 from raiden_common.transfer.identifiers import (
     CANONICAL_IDENTIFIER_UNORDERED_QUEUE,
     CanonicalIdentifier,
     QueueIdentifier,
 )
 from raiden_common.transfer.mediated_transfer.events import SendSecretReveal
-from raiden_common.transfer.state_change import ReceiveWithdrawConfirmation
+from raiden_common.transfer.state_change import Block, ReceiveWithdrawConfirmation
+from raiden_common.utils.copy import deepcopy
+from raiden_common.utils.typing import BlockExpiration, BlockNumber, WithdrawAmount
 
 
 def test_delivered_message_must_clean_unordered_messages(chain_id):
@@ -223,3 +233,116 @@ def test_channel_closed_must_clear_ordered_messages(
 
     iteration = node.handle_state_change(chain_state, closed)
     assert queue_identifier not in iteration.new_state.queueids_to_queues
+
+
+def test_message_queue_keeps_index_of_message_identifiers():
+    recipient = factories.make_address()
+    canonical_identifier = factories.make_canonical_identifier()
+    messages = [
+        SendSecretReveal(
+            recipient=recipient,
+            recipient_metadata=None,
+            message_identifier=message_identifier,
+            secret=factories.random_secret(),
+            canonical_identifier=canonical_identifier,
+        )
+        for message_identifier in (1, 2, 2, 3)
+    ]
+
+    queue = state.MessageQueue(messages[:2])
+    queue.extend(messages[2:])
+    assert queue == messages
+    assert queue.get_messages(2) == (messages[1], messages[2])
+
+    copied_queue = copy(queue)
+    queue.remove(messages[1])
+    queue.pop(0)
+    assert queue == [messages[2], messages[3]]
+    assert queue.get_messages(1) == ()
+    assert queue.get_messages(2) == (messages[2],)
+    assert copied_queue.get_messages(2) == (messages[1], messages[2])
+
+    del queue[:1]
+    assert set(queue.message_identifiers) == {3}
+    assert set(deepcopy(copied_queue).message_identifiers) == {1, 2, 3}
+
+    copied_queue.clear()
+    assert copied_queue.message_identifiers == {}
+
+
+def test_update_queues_clears_only_affected_transactions(chain_state):
+    first_channel = factories.make_canonical_identifier()
+    second_channel = factories.make_canonical_identifier()
+    block_hash = factories.make_block_hash()
+
+    first_close = ContractSendChannelClose(
+        canonical_identifier=first_channel, balance_proof=None, triggered_by_block_hash=block_hash
+    )
+    first_withdraw = ContractSendChannelWithdraw(
+        canonical_identifier=first_channel,
+        total_withdraw=WithdrawAmount(1),
+        expiration=BlockExpiration(100),
+        partner_signature=factories.make_signature(),
+        triggered_by_block_hash=block_hash,
+    )
+    second_close = ContractSendChannelClose(
+        canonical_identifier=second_channel, balance_proof=None, triggered_by_block_hash=block_hash
+    )
+    secret_reveal = ContractSendSecretReveal(
+        expiration=BlockExpiration(chain_state.block_number + 5),
+        secret=factories.random_secret(),
+        triggered_by_block_hash=block_hash,
+    )
+    transactions = [first_close, first_withdraw, second_close, secret_reveal]
+    node.update_queues(TransitionResult(chain_state, transactions), Block(1, 1, block_hash))
+    assert chain_state.pending_transactions == transactions
+
+    def channel_closed(canonical_identifier):
+        return state_change.ContractReceiveChannelClosed(
+            transaction_hash=EMPTY_HASH,
+            transaction_from=factories.make_address(),
+            canonical_identifier=canonical_identifier,
+            block_number=chain_state.block_number,
+            block_hash=block_hash,
+        )
+
+    node.update_queues(TransitionResult(chain_state, []), channel_closed(first_channel))
+    assert chain_state.pending_transactions == [second_close, secret_reveal]
+
+    # The secret registration expires, it is cleared by any contract event
+    chain_state.block_number = BlockNumber(secret_reveal.expiration + 1)
+    node.update_queues(TransitionResult(chain_state, []), channel_closed(first_channel))
+    assert chain_state.pending_transactions == [second_close]
+
+    # A replaced list is indexed again
+    chain_state.pending_transactions = [first_close, second_close]
+    node.update_queues(TransitionResult(chain_state, []), channel_closed(second_channel))
+    assert chain_state.pending_transactions == [first_close]
+
+
+def test_update_queues_clears_expired_transactions_of_cloned_state(chain_state):
+    block_hash = factories.make_block_hash()
+    secret_reveal = ContractSendSecretReveal(
+        expiration=BlockExpiration(chain_state.block_number + 5),
+        secret=factories.random_secret(),
+        triggered_by_block_hash=block_hash,
+    )
+    node.update_queues(TransitionResult(chain_state, [secret_reveal]), Block(1, 1, block_hash))
+
+    # The pickled copy keeps the index together with the copied list
+    cloned_state = clone_state(chain_state)
+    index = cloned_state.pending_transactions_index
+    assert index is not None
+    assert index.transactions is cloned_state.pending_transactions
+    assert index.members == {id(cloned_state.pending_transactions[0])}
+
+    cloned_state.block_number = BlockNumber(secret_reveal.expiration + 1)
+    channel_closed = state_change.ContractReceiveChannelClosed(
+        transaction_hash=EMPTY_HASH,
+        transaction_from=factories.make_address(),
+        canonical_identifier=factories.make_canonical_identifier(),
+        block_number=cloned_state.block_number,
+        block_hash=block_hash,
+    )
+    node.update_queues(TransitionResult(cloned_state, []), channel_closed)
+    assert cloned_state.pending_transactions == []
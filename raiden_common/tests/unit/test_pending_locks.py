@@ -1,8 +1,38 @@
+from eth_utils import keccak
+
 from raiden_common.constants import LOCKSROOT_OF_NO_LOCKS
-from raiden_common.transfer.channel import compute_locksroot
+from raiden_common.tests.utils import factories
+from raiden_common.transfer.channel import (
+    compute_locks_with,
+    compute_locks_without,
+    compute_locksroot,
+)
 from raiden_common.transfer.state import PendingLocksState
 
 
 def test_empty():
     locks = PendingLocksState([])
     assert compute_locksroot(locks) == LOCKSROOT_OF_NO_LOCKS
+
+
+def test_locks_keep_insertion_order():
+    first, second, third = [factories.make_lock() for _ in range(3)]
+
+    locks = PendingLocksState([])
+    for lock in (first, second, third):
+        locks = compute_locks_with(locks, lock)
+    assert compute_locks_with(locks, second) is None
+
+    encoded = [bytes(lock.encoded) for lock in (first, second, third)]
+    assert locks.locks == encoded
+    assert compute_locksroot(locks) == keccak(b"".join(encoded))
+
+    locks_without = compute_locks_without(locks, second.encoded)
+    assert compute_locks_without(locks_without, second.encoded) is None
+    assert locks_without.locks == [encoded[0], encoded[2]]
+    assert compute_locksroot(locks_without) == keccak(encoded[0] + encoded[2])
+
+    # The previous instances are not changed
+    assert locks.locks == encoded
+    assert compute_locks_with(locks, second) is None
+    assert compute_locksroot(locks) == keccak(b"".join(encoded))
@@ -5,6 +5,7 @@
 from dataclasses import dataclass, field
 from datetime import datetime
 
+import msgpack
 import pytest
 
 from raiden_common.exceptions import SerializationError
@@ -14,9 +15,16 @@
 from raiden_common.messages.synchronization import Delivered, Processed
 from raiden_common.messages.transfers import RevealSecret, SecretRequest
 from raiden_common.messages.withdraw import WithdrawConfirmation, WithdrawExpired, WithdrawRequest
-from raiden_common.storage.serialization import JSONSerializer
-from raiden_common.storage.serialization.schemas import BaseSchema, class_schema
-from raiden_common.storage.serialization.serializer import MessageSerializer
+from raiden_common.storage.serialization import BinarySerializer, DictSerializer, JSONSerializer
+from raiden_common.storage.serialization.schemas import BaseSchema, class_schema, schema_for
+from raiden_common.storage.serialization.serializer import (
+    BINARY_FORMAT_MSGPACK,
+    BINARY_FORMAT_MSGPACK_ZLIB,
+    MessageSerializer,
+    _ext_hook,
+    _pack,
+    _unpack,
+)
 from raiden_common.tests.utils import factories
 from raiden_common.transfer import state
 from raiden_common.utils.signer import LocalSigner
@@ -189,6 +197,97 @@ def test_serialize_missing_attribute():
         JSONSerializer.serialize(instance)
 
 
+def test_schemas_are_reused():
+    assert schema_for(ClassWithInt) is schema_for(ClassWithInt)
+
+    for message in messages:
+        serialized = MessageSerializer.serialize(message)
+        assert MessageSerializer.deserialize(serialized) == message
+        assert MessageSerializer.serialize(message) == serialized
+
+
+def test_dict_deserialize_copies_data_by_default():
+    data = DictSerializer.serialize(messages[0])
+    original_data = deepcopy(data)
+
+    assert DictSerializer.deserialize(data) == messages[0]
+    assert data == original_data
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "0x",
+        "0xabcdef",
+        "0xABCDEF",
+        "0xabc",
+        "0xDeAdBeEf00000000000000000000000000000000",
+        "0",
+        "-12",
+        "007",
+        "-0",
+        "+1",
+        str(2**256 - 1),
+        str(-(2**70)),
+        2**256 - 1,
+        -1,
+        0,
+        1.5,
+        True,
+        None,
+        "text",
+        {"1": [1, "1", {"0xab": "0xab"}]},
+    ],
+)
+def test_binary_encoding_preserves_json_data(value):
+    data = {"_type": "raiden_common.tests.Unknown", "value": value, 3: value}
+    expected = json.loads(json.dumps(data))
+
+    encoded = msgpack.packb(_pack(data), use_bin_type=True)
+    decoded = msgpack.unpackb(encoded, raw=False, strict_map_key=False, ext_hook=_ext_hook)
+    assert _unpack(decoded) == expected
+
+
+def test_binary_serializer_roundtrip():
+    for message in messages:
+        binary = BinarySerializer.serialize(message)
+        assert BinarySerializer.deserialize(binary) == message
+
+        json_data = JSONSerializer.serialize(message)
+        assert len(binary) < len(json_data)
+        assert BinarySerializer.decode(binary) == json.loads(json_data)
+
+        # Both serializers read both encodings
+        assert BinarySerializer.deserialize(json_data) == message
+        assert JSONSerializer.deserialize(binary) == message
+
+
+def test_binary_serializer_compresses_large_data():
+    registry_address = factories.make_token_network_registry_address()
+    chain_state = factories.make_chain_state(
+        number_of_channels=10,
+        properties=[
+            factories.NettingChannelStateProperties(
+                token_network_registry_address=registry_address
+            )
+            for _ in range(10)
+        ],
+    ).chain_state
+
+    binary = BinarySerializer.serialize(chain_state)
+    assert binary[0] == BINARY_FORMAT_MSGPACK_ZLIB
+    assert BinarySerializer.deserialize(binary) == chain_state
+
+    balance_proof = factories.create(factories.BalanceProofSignedStateProperties())
+    assert BinarySerializer.serialize(balance_proof)[0] == BINARY_FORMAT_MSGPACK
+
+
+@pytest.mark.parametrize("input_value", [b"\x01\xc1", b"\x02invalid"])
+def test_binary_deserialize_invalid_data(input_value):
+    with pytest.raises(SerializationError):
+        BinarySerializer.deserialize(input_value)
+
+
 def test_chainstate_restore():
     """ChainState *must* restore the previous pseudo random generator
     state.
@@ -1,5 +1,6 @@
 import itertools
 import json
+import sqlite3
 from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import patch
@@ -7,7 +8,9 @@
 import pytest
 from eth_utils import keccak
 
+from raiden_common.constants import SQLiteJournalMode, SQLiteSynchronous
 from raiden_common.messages.transfers import Lock
+from raiden_common.storage.migrations.v27_to_v28 import upgrade_v27_to_v28
 from raiden_common.storage.restore import (
     get_event_with_balance_proof_by_balance_hash,
     get_event_with_balance_proof_by_locksroot,
@@ -15,14 +18,21 @@
     get_state_change_with_balance_proof_by_locksroot,
     get_state_change_with_transfer_by_secrethash,
 )
-from raiden_common.storage.serialization import JSONSerializer
+from raiden_common.storage.serialization import BinarySerializer, JSONSerializer
 from raiden_common.storage.sqlite import (
+    HIGH_STATECHANGE_ULID,
+    LOW_STATECHANGE_ULID,
     RANGE_ALL_STATE_CHANGES,
     Range,
     SerializedSQLiteStorage,
     SQLiteStorage,
 )
 from raiden_common.tests.utils import factories
+from raiden_common.transfer.events import (
+    EventPaymentReceivedSuccess,
+    EventPaymentSentFailed,
+    EventPaymentSentSuccess,
+)
 from raiden_common.transfer.mediated_transfer.events import (
     SendLockedTransfer,
     SendLockExpired,
@@ -42,8 +52,11 @@
     BlockExpiration,
     BlockGasLimit,
     BlockNumber,
+    InitiatorAddress,
     Locksroot,
     MessageID,
+    PaymentAmount,
+    TargetAddress,
     TokenAmount,
 )
 
@@ -281,6 +294,56 @@ def test_get_state_change_with_balance_proof():
     storage.close()
 
 
+def test_query_rows_in_both_encodings():
+    storage = SerializedSQLiteStorage(":memory:", JSONSerializer())
+    counter = itertools.count()
+
+    def make_unlock():
+        balance_proof = make_signed_balance_proof_from_counter(counter)
+        return ReceiveUnlock(
+            sender=balance_proof.sender,
+            message_identifier=MessageID(next(counter)),
+            secret=factories.make_secret(next(counter)),
+            balance_proof=balance_proof,
+        )
+
+    json_unlock = make_unlock()
+    storage.write_state_changes([json_unlock])
+
+    # Switching the encoding of an existing database is supported
+    storage.serializer = BinarySerializer()
+    binary_unlock = make_unlock()
+    storage.write_state_changes([binary_unlock])
+
+    encodings = storage.database.conn.execute(
+        "SELECT typeof(data) FROM state_changes ORDER BY identifier"
+    ).fetchall()
+    assert encodings == [("text",), ("blob",)]
+    assert storage.get_statechanges_by_range(RANGE_ALL_STATE_CHANGES) == [
+        json_unlock,
+        binary_unlock,
+    ]
+
+    for state_change in (json_unlock, binary_unlock):
+        balance_proof = state_change.balance_proof
+        record = get_state_change_with_balance_proof_by_balance_hash(
+            storage=storage,
+            canonical_identifier=balance_proof.canonical_identifier,
+            sender=balance_proof.sender,
+            balance_hash=balance_proof.balance_hash,
+        )
+        assert record and record.data == state_change
+
+    state_changes = [
+        record
+        for batch in storage.database.batch_query_state_changes(
+            batch_size=10, filters=[("_type", "%ReceiveUnlock")]
+        )
+        for record in batch
+    ]
+    assert len(state_changes) == 2
+
+
 def test_get_event_with_balance_proof():
     """All events which contain a balance proof must be found by when
     querying the database.
@@ -488,6 +551,41 @@ def test_batch_query_state_changes():
     storage.close()
 
 
+def test_batch_query_statechanges_records_by_range():
+    state_changes_file = Path(__file__).parent / "test_data" / "db_statechanges.json"
+    state_changes_data = json.loads(state_changes_file.read_text())
+
+    storage = SQLiteStorage(":memory:")
+    state_change_identifiers = storage.write_state_changes(
+        state_changes=[
+            json.dumps(state_change_record[1]) for state_change_record in state_changes_data
+        ]
+    )
+
+    batches = list(storage.batch_query_statechanges_records_by_range(RANGE_ALL_STATE_CHANGES, 10))
+    assert [len(batch) for batch in batches] == [10] * 8 + [6]
+    assert [
+        record.state_change_identifier for batch in batches for record in batch
+    ] == state_change_identifiers
+    assert storage.count_state_changes_in_range(RANGE_ALL_STATE_CHANGES) == 86
+
+    # The range is inclusive on both ends
+    db_range = Range(state_change_identifiers[5], state_change_identifiers[25])
+    batches = list(storage.batch_query_statechanges_records_by_range(db_range, 10))
+    assert [len(batch) for batch in batches] == [10, 10, 1]
+    assert [
+        record.state_change_identifier for batch in batches for record in batch
+    ] == state_change_identifiers[5:26]
+    assert storage.count_state_changes_in_range(db_range) == 21
+
+    # A full last batch is followed by an empty query, not an empty batch
+    db_range = Range(state_change_identifiers[0], state_change_identifiers[19])
+    batches = list(storage.batch_query_statechanges_records_by_range(db_range, 10))
+    assert [len(batch) for batch in batches] == [10, 10]
+
+    storage.close()
+
+
 def test_batch_query_event_records():
     storage = SQLiteStorage(":memory:")
 
@@ -554,3 +652,225 @@ def test_storage_close():
     storage.close()
     with pytest.raises(RuntimeError):  # attempt to close an already closed database
         storage.close()
+
+
+def make_payment_history_events(token_network_address, partner_address):
+    return [
+        EventPaymentSentSuccess(
+            token_network_registry_address=factories.make_token_network_registry_address(),
+            token_network_address=token_network_address,
+            identifier=factories.make_payment_id(),
+            amount=PaymentAmount(1),
+            target=TargetAddress(partner_address),
+            secret=factories.make_secret(),
+            route=[],
+        ),
+        EventPaymentSentFailed(
+            token_network_registry_address=factories.make_token_network_registry_address(),
+            token_network_address=token_network_address,
+            identifier=factories.make_payment_id(),
+            target=TargetAddress(partner_address),
+            reason="no route",
+        ),
+        EventPaymentReceivedSuccess(
+            token_network_registry_address=factories.make_token_network_registry_address(),
+            token_network_address=token_network_address,
+            identifier=factories.make_payment_id(),
+            amount=PaymentAmount(1),
+            initiator=InitiatorAddress(partner_address),
+        ),
+    ]
+
+
+PAYMENT_HISTORY_EVENT_TYPES = [
+    "raiden_common.transfer.events.EventPaymentReceivedSuccess",
+    "raiden_common.transfer.events.EventPaymentSentFailed",
+    "raiden_common.transfer.events.EventPaymentSentSuccess",
+]
+
+
+def test_payment_history_filters_and_keyset_pagination():
+    storage = SerializedSQLiteStorage(":memory:", JSONSerializer())
+    token_network_address = factories.make_token_network_address()
+    partner_address = factories.make_address()
+
+    state_change = Block(BlockNumber(1), BlockGasLimit(1), factories.make_block_hash())
+    state_change_id = storage.write_state_changes([state_change])[0]
+
+    matching_events = make_payment_history_events(token_network_address, partner_address)
+    other_events = make_payment_history_events(
+        factories.make_token_network_address(), factories.make_address()
+    )
+    unrelated_event = SendUnlock(
+        recipient=partner_address,
+        recipient_metadata=None,
+        message_identifier=MessageID(1),
+        payment_identifier=factories.make_payment_id(),
+        token_address=factories.make_token_address(),
+        secret=factories.make_secret(),
+        balance_proof=factories.create(factories.BalanceProofSignedStateProperties()),
+        canonical_identifier=factories.make_canonical_identifier(),
+    )
+    all_events = [*matching_events, *other_events, unrelated_event]
+    storage.write_events([(state_change_id, event) for event in all_events])
+
+    def query(**kwargs):
+        return [
+            timestamped.event
+            for timestamped in storage.get_raiden_events_payment_history_with_timestamps(
+                event_types=PAYMENT_HISTORY_EVENT_TYPES, **kwargs
+            )
+        ]
+
+    assert query() == [*matching_events, *other_events]
+    assert query(token_network_address=token_network_address) == matching_events
+    assert query(partner_address=partner_address) == matching_events
+    assert (
+        query(token_network_address=token_network_address, partner_address=partner_address)
+        == matching_events
+    )
+    assert query(limit=2, offset=1) == [matching_events[1], matching_events[2]]
+
+    # Keyset pagination returns the same pages as LIMIT/OFFSET
+    pages = []
+    after = None
+    while True:
+        page = storage.get_raiden_events_payment_history_with_timestamps(
+            event_types=PAYMENT_HISTORY_EVENT_TYPES, limit=2, after=after
+        )
+        if not page:
+            break
+        pages.append([timestamped.event for timestamped in page])
+        after = page[-1].event_identifier
+
+    assert pages == [matching_events[:2], [matching_events[2], other_events[0]], other_events[1:]]
+
+    storage.close()
+
+
+def test_upgrade_v27_to_v28_backfills_payment_history():
+    storage = SerializedSQLiteStorage(":memory:", JSONSerializer())
+    token_network_address = factories.make_token_network_address()
+    partner_address = factories.make_address()
+
+    state_change = Block(BlockNumber(1), BlockGasLimit(1), factories.make_block_hash())
+    state_change_id = storage.write_state_changes([state_change])[0]
+
+    events = make_payment_history_events(token_network_address, partner_address)
+    # Write the events without the index, like a node before the migration did
+    storage.database.write_events(
+        [(state_change_id, storage.serializer.serialize(event)) for event in events]
+    )
+    assert (
+        storage.get_raiden_events_payment_history_with_timestamps(PAYMENT_HISTORY_EVENT_TYPES)
+        == []
+    )
+
+    with storage.database.transaction():
+        upgrade_v27_to_v28(storage=storage.database, old_version=27, current_version=28)
+
+    timestamped_events = storage.get_raiden_events_payment_history_with_timestamps(
+        PAYMENT_HISTORY_EVENT_TYPES,
+        token_network_address=token_network_address,
+        partner_address=partner_address,
+    )
+    assert [timestamped.event for timestamped in timestamped_events] == events
+
+    storage.close()
+
+
+def test_wal_journal_mode_allows_concurrent_readers(tmp_path):
+    database_path = tmp_path / "v1_log.db"
+    storage = SQLiteStorage(
+        database_path,
+        journal_mode=SQLiteJournalMode.WAL,
+        synchronous=SQLiteSynchronous.NORMAL,
+        wal_autocheckpoint=100,
+    )
+    assert storage.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert storage.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert storage.conn.execute("PRAGMA wal_autocheckpoint").fetchone()[0] == 100
+
+    storage.write_state_changes(["{}"])
+
+    reader = sqlite3.connect(str(database_path), timeout=0)
+    assert reader.execute("SELECT COUNT(1) FROM state_changes").fetchone()[0] == 1
+    reader.close()
+
+    assert Path(f"{database_path}-wal").stat().st_size > 0
+    storage.checkpoint()
+    assert Path(f"{database_path}-wal").stat().st_size == 0
+
+    storage.close()
+
+
+@pytest.mark.parametrize("keep_payment_history", [True, False])
+def test_compact_state_changes(keep_payment_history):
+    storage = SerializedSQLiteStorage(":memory:", JSONSerializer())
+    storage.database.write_first_state_snapshot("{}")
+    token_network_address = factories.make_token_network_address()
+    partner_address = factories.make_address()
+
+    blocks = [
+        Block(BlockNumber(number), BlockGasLimit(1), factories.make_block_hash())
+        for number in range(10)
+    ]
+    state_change_ids = storage.write_state_changes(blocks)
+    payment_events = make_payment_history_events(token_network_address, partner_address)
+    storage.write_events([(state_change_ids[2], event) for event in payment_events])
+    # Events which are not part of the payment history
+    storage.database.write_events(
+        [(state_change_id, json.dumps({})) for state_change_id in state_change_ids[3:7]]
+    )
+    database = storage.database
+    database.write_state_snapshot("{}", state_change_ids[3], 4)
+    horizon = state_change_ids[6]
+    database.write_state_snapshot("{}", horizon, 7)
+
+    after = LOW_STATECHANGE_ULID
+    while True:
+        compacted = database.compact_state_changes(
+            before=horizon, limit=2, after=after, keep_payment_history=keep_payment_history
+        )
+        if compacted is None:
+            break
+        assert compacted.last_identifier > after
+        after = compacted.last_identifier
+
+    remaining = storage.get_statechanges_records_by_range(RANGE_ALL_STATE_CHANGES)
+    expected_blocks = blocks[6:]
+    if keep_payment_history:
+        expected_blocks = [blocks[2], *expected_blocks]
+    assert [record.data for record in remaining] == expected_blocks
+
+    # Only the snapshot at the horizon is left, the older ones can't be restored
+    assert database.get_snapshot_state_change_before(HIGH_STATECHANGE_ULID) == horizon
+    assert database.conn.execute("SELECT COUNT(1) FROM state_snapshot").fetchone()[0] == 1
+
+    history = storage.get_raiden_events_payment_history_with_timestamps(
+        PAYMENT_HISTORY_EVENT_TYPES
+    )
+    expected_history = payment_events if keep_payment_history else []
+    assert [timestamped.event for timestamped in history] == expected_history
+    # The event of the horizon is kept
+    assert (
+        database.conn.execute("SELECT COUNT(1) FROM state_events").fetchone()[0]
+        == len(expected_history) + 1
+    )
+
+
+def test_incremental_vacuum(tmp_path):
+    storage = SQLiteStorage(tmp_path / "v1_log.db")
+    assert storage.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    state_change_ids = storage.write_state_changes([json.dumps("x" * 4096)] * 100)
+    storage.write_first_state_snapshot("{}")
+    storage.write_state_snapshot("{}", state_change_ids[-1], 100)
+    storage.compact_state_changes(before=state_change_ids[-1], limit=100)
+    free_pages = storage.conn.execute("PRAGMA freelist_count").fetchone()[0]
+    assert free_pages > 0
+
+    assert storage.incremental_vacuum(pages=10) == 10
+    assert storage.incremental_vacuum(pages=free_pages) == free_pages - 10
+    assert storage.incremental_vacuum(pages=free_pages) == 0
+    storage.close()
@@ -1,4 +1,10 @@
-from raiden_common.transfer.state import TransactionChannelDeposit
+from dataclasses import replace
+
+from raiden_common.tests.utils import factories
+from raiden_common.transfer import node
+from raiden_common.transfer.state import LocksDict, TransactionChannelDeposit
+from raiden_common.transfer.state_change import ContractReceiveChannelNew
+from raiden_common.utils.copy import deepcopy
 
 
 def test_transaction_channel_new_balance_ordering():
@@ -19,3 +25,70 @@ def test_transaction_channel_new_balance_ordering():
     assert a == b
     assert not a > b
     assert not b > a
+
+
+def test_addresses_to_channel_uses_newest_channel_with_partner():
+    container = factories.make_chain_state(number_of_channels=3)
+    chain_state = container.chain_state
+    token_network_address = container.token_network_address
+
+    addresses_to_channel = chain_state.addresses_to_channel
+    assert dict(addresses_to_channel) == {
+        (token_network_address, channel_state.partner_state.address): channel_state
+        for channel_state in container.channels
+    }
+    assert addresses_to_channel.get((token_network_address, factories.make_address())) is None
+    assert addresses_to_channel.get((factories.make_address(), factories.make_address())) is None
+
+    # A channel reopened with the same partner replaces the old one
+    old_channel = container.channels[0]
+    new_channel = factories.create(
+        factories.NettingChannelStateProperties(
+            canonical_identifier=factories.make_canonical_identifier(
+                token_network_address=token_network_address
+            ),
+            our_state=factories.NettingChannelEndStateProperties(address=container.our_address),
+            partner_state=factories.NettingChannelEndStateProperties(
+                address=old_channel.partner_state.address
+            ),
+        )
+    )
+    channel_new = ContractReceiveChannelNew(
+        transaction_hash=factories.make_transaction_hash(),
+        channel_state=new_channel,
+        block_number=2,
+        block_hash=factories.make_block_hash(),
+    )
+    node.state_transition(chain_state, channel_new)
+
+    key = (token_network_address, old_channel.partner_state.address)
+    assert len(addresses_to_channel) == 3
+    assert addresses_to_channel[key] is new_channel
+
+
+def test_locks_dict_keeps_total_amount():
+    locks = [factories.make_lock() for _ in range(3)]
+    locks_dict = LocksDict({lock.secrethash: lock for lock in locks[:2]})
+    assert locks_dict.total_amount == locks[0].amount + locks[1].amount
+
+    locks_dict[locks[2].secrethash] = locks[2]
+    assert locks_dict.total_amount == sum(lock.amount for lock in locks)
+
+    replacement = replace(locks[2], amount=locks[2].amount + 1)
+    locks_dict[replacement.secrethash] = replacement
+    assert locks_dict.total_amount == locks[0].amount + locks[1].amount + replacement.amount
+
+    del locks_dict[locks[0].secrethash]
+    assert locks_dict.pop(locks[1].secrethash) == locks[1]
+    assert locks_dict.pop(locks[1].secrethash, None) is None
+    assert locks_dict.total_amount == replacement.amount
+
+    copied = deepcopy(locks_dict)
+    assert isinstance(copied, LocksDict)
+    assert copied.total_amount == replacement.amount
+
+    locks_dict.update({lock.secrethash: lock for lock in locks[:2]})
+    assert locks_dict.total_amount == locks[0].amount + locks[1].amount + replacement.amount
+
+    locks_dict.clear()
+    assert locks_dict.total_amount == 0
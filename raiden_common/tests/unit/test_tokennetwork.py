@@ -7,17 +7,25 @@
 from raiden_common.constants import LOCKSROOT_OF_NO_LOCKS
 from raiden_common.tests.utils import factories
 from raiden_common.tests.utils.transfer import make_receive_transfer_mediated
-from raiden_common.transfer import node, token_network, views
+from raiden_common.transfer import channel, node, token_network, views
 from raiden_common.transfer.channel import compute_locksroot
+from raiden_common.transfer.events import ContractSendChannelSettle, SendWithdrawExpired
+from raiden_common.transfer.mediated_transfer.state import (
+    MediatorTransferState,
+    WaitingTransferState,
+)
 from raiden_common.transfer.mediated_transfer.state_change import (
     ActionInitMediator,
     ActionInitTarget,
 )
+from raiden_common.transfer.mediated_transfer.tasks import MediatorTask
 from raiden_common.transfer.state import (
     HashTimeLockState,
     PendingLocksState,
+    PendingWithdrawState,
     RouteState,
     TokenNetworkState,
+    TransactionExecutionStatus,
 )
 from raiden_common.transfer.state_change import (
     Block,
@@ -543,3 +551,149 @@ def test_multiple_channel_states(chain_state, token_network_state, channel_prope
 
     assert len(ids_to_channels) == 2
     assert channel_state.identifier in ids_to_channels
+
+
+def test_block_is_only_dispatched_to_channels_with_a_deadline(monkeypatch):
+    container = factories.make_chain_state(number_of_channels=3)
+    chain_state = container.chain_state
+    closed_channel, withdraw_channel, idle_channel = container.channels
+
+    closed_channel.close_transaction = TransactionExecutionStatus(
+        None, 1, TransactionExecutionStatus.SUCCESS
+    )
+    withdraw_channel.our_state.withdraws_pending[10] = PendingWithdrawState(
+        total_withdraw=10, expiration=20, nonce=1
+    )
+    settle_block_number = 1 + closed_channel.settle_timeout + 1
+    expired_block_number = channel.get_sender_expiration_threshold(20)
+
+    dispatched = []
+    state_transition = channel.state_transition
+
+    def recording_state_transition(channel_state, **kwargs):
+        dispatched.append(channel_state.identifier)
+        return state_transition(channel_state, **kwargs)
+
+    monkeypatch.setattr(channel, "state_transition", recording_state_transition)
+
+    def dispatch_block(block_number):
+        dispatched.clear()
+        block = Block(
+            block_number=block_number, gas_limit=1, block_hash=factories.make_block_hash()
+        )
+        return node.state_transition(chain_state, block).events
+
+    assert dispatch_block(2) == []
+    assert dispatched == []
+    assert chain_state.channel_deadlines.deadlines == {
+        (container.token_network_address, closed_channel.identifier): settle_block_number,
+        (container.token_network_address, withdraw_channel.identifier): expired_block_number,
+    }
+
+    # The deadline of a channel changed by a state change is recomputed
+    channel_closed = ContractReceiveChannelClosed(
+        transaction_hash=factories.make_transaction_hash(),
+        transaction_from=idle_channel.partner_state.address,
+        canonical_identifier=idle_channel.canonical_identifier,
+        block_number=2,
+        block_hash=factories.make_block_hash(),
+    )
+    node.state_transition(chain_state, channel_closed)
+
+    events = dispatch_block(expired_block_number)
+    assert dispatched == [withdraw_channel.identifier]
+    assert [type(event) for event in events] == [SendWithdrawExpired]
+
+    events = dispatch_block(settle_block_number)
+    assert dispatched == [closed_channel.identifier]
+    assert [type(event) for event in events] == [ContractSendChannelSettle]
+
+    events = dispatch_block(settle_block_number + 1)
+    assert dispatched == [idle_channel.identifier]
+    assert [type(event) for event in events] == [ContractSendChannelSettle]
+    assert chain_state.channel_deadlines.deadlines == {}
+
+    assert dispatch_block(settle_block_number + 2) == []
+    assert dispatched == []
+
+
+@pytest.mark.parametrize("last_block_number", [15, 25, 40, 60])
+def test_block_catch_up_matches_block_by_block_replay(last_block_number):
+    """A single `Block` for a run of blocks without contract events must have
+    the same effects as one `Block` per block, see
+    `RaidenService._best_effort_synchronize_with_confirmed_head`.
+    """
+    payer_properties = factories.NettingChannelStateProperties(
+        partner_state=factories.NettingChannelEndStateProperties(
+            address=factories.UNIT_TRANSFER_SENDER, balance=100
+        )
+    )
+    container = factories.make_chain_state(number_of_channels=4, properties=[payer_properties])
+    payer_channel, closed_channel, withdraw_channel, late_withdraw_channel = container.channels
+
+    closed_channel.close_transaction = TransactionExecutionStatus(
+        None, 1, TransactionExecutionStatus.SUCCESS
+    )
+    withdraw_channel.our_state.withdraws_pending[10] = PendingWithdrawState(
+        total_withdraw=10, expiration=20, nonce=1
+    )
+    late_withdraw_channel.our_state.withdraws_pending[10] = PendingWithdrawState(
+        total_withdraw=10, expiration=35, nonce=1
+    )
+
+    # A mediated transfer whose lock expires while it waits for a route
+    route_state = RouteState(route=[container.our_address, factories.make_address()])
+    transfer = factories.create(
+        factories.LockedTransferSignedStateProperties(
+            amount=10,
+            expiration=30,
+            secret=factories.make_secret(),
+            canonical_identifier=payer_channel.canonical_identifier,
+            recipient=container.our_address,
+            route_states=[route_state],
+        )
+    )
+    secrethash = transfer.lock.secrethash
+    payer_channel.partner_state.secrethashes_to_lockedlocks[secrethash] = transfer.lock
+    container.chain_state.payment_mapping.secrethashes_to_task[secrethash] = MediatorTask(
+        token_network_address=container.token_network_address,
+        mediator_state=MediatorTransferState(
+            secrethash=secrethash,
+            routes=[route_state],
+            waiting_transfer=WaitingTransferState(transfer),
+        ),
+    )
+
+    def dispatch_blocks(block_numbers):
+        chain_state = deepcopy(container.chain_state)
+        for block_number in block_numbers:
+            block = Block(
+                block_number=block_number,
+                gas_limit=1,
+                block_hash=block_number.to_bytes(32, byteorder="big"),
+            )
+            node.state_transition(chain_state, block)
+        return chain_state
+
+    replayed = dispatch_blocks(range(2, last_block_number + 1))
+    caught_up = dispatch_blocks([last_block_number])
+
+    # Only the block which triggers the settlement differs
+    assert [
+        (type(transaction), transaction.canonical_identifier)
+        for transaction in replayed.pending_transactions
+    ] == [
+        (type(transaction), transaction.canonical_identifier)
+        for transaction in caught_up.pending_transactions
+    ]
+    replayed.pending_transactions = caught_up.pending_transactions
+    for channel_state in views.list_all_channelstate(replayed):
+        caught_up_channel = views.get_channelstate_by_canonical_identifier(
+            caught_up, channel_state.canonical_identifier
+        )
+        assert (channel_state.settle_transaction is None) == (
+            caught_up_channel.settle_transaction is None
+        )
+        channel_state.settle_transaction = caught_up_channel.settle_transaction
+
+    assert replayed == caught_up
@@ -4,11 +4,17 @@
 from dataclasses import dataclass, field
 from datetime import datetime
 
+import gevent
 import pytest
 import ulid
 
 from raiden_common.constants import RAIDEN_DB_VERSION
 from raiden_common.exceptions import InvalidDBData
+from raiden_common.storage.compaction import StateCompactor
+from raiden_common.storage.restore import (
+    get_event_with_balance_proof_by_locksroot,
+    get_state_change_with_balance_proof_by_locksroot,
+)
 from raiden_common.storage.serialization import JSONSerializer
 from raiden_common.storage.sqlite import (
     HIGH_STATECHANGE_ULID,
@@ -20,17 +26,41 @@
 from raiden_common.storage.utils import TimestampedEvent
 from raiden_common.storage.wal import WriteAheadLog, restore_state
 from raiden_common.tests.utils.factories import (
+    BalanceProofProperties,
+    BalanceProofSignedStateProperties,
+    ContainerForChainStateTests,
+    NettingChannelStateProperties,
+    create,
     make_address,
     make_block_hash,
     make_canonical_identifier,
+    make_chain_state,
     make_locksroot,
+    make_message_identifier,
+    make_secret_hash,
     make_token_network_registry_address,
     make_transaction_hash,
 )
+from raiden_common.transfer import node, views
 from raiden_common.transfer.architecture import State, StateChange, TransitionResult
 from raiden_common.transfer.events import EventPaymentSentFailed
-from raiden_common.transfer.state_change import Block, ContractReceiveChannelBatchUnlock
-from raiden_common.utils.typing import BlockGasLimit, BlockNumber, Callable, List, TokenAmount
+from raiden_common.transfer.mediated_transfer.events import SendLockExpired
+from raiden_common.transfer.mediated_transfer.state_change import ReceiveLockExpired
+from raiden_common.transfer.state_change import (
+    ActionChannelSetRevealTimeout,
+    Block,
+    ContractReceiveChannelBatchUnlock,
+)
+from raiden_common.utils.copy import deepcopy
+from raiden_common.utils.typing import (
+    Any,
+    BlockGasLimit,
+    BlockNumber,
+    BlockTimeout,
+    Callable,
+    List,
+    TokenAmount,
+)
 
 
 class Empty(State):
@@ -52,14 +82,14 @@ def state_transtion_acc(state, state_change):
     return TransitionResult(state, [])
 
 
-def new_wal(state_transition: Callable, state: State = None) -> WriteAheadLog:
+def new_wal(state_transition: Callable, state: State = None, **kwargs: Any) -> WriteAheadLog:
     serializer = JSONSerializer()
     state = state or Empty()
 
     storage = SerializedSQLiteStorage(":memory:", serializer)
     storage.write_first_state_snapshot(state)
 
-    return WriteAheadLog(state, storage, state_transition)
+    return WriteAheadLog(state, storage, state_transition, **kwargs)
 
 
 def dispatch(wal: WriteAheadLog, state_changes: List[StateChange]):
@@ -232,6 +262,29 @@ def test_restore_without_snapshot_in_batches():
     assert aggregate.state_changes == [block1, block2, block3]
 
 
+@pytest.mark.parametrize("prefetch_batches", [0, 1, 3])
+def test_restore_streams_state_changes_in_batches(prefetch_batches):
+    wal = new_wal(state_transition_noop, AccState())
+
+    blocks = [make_block(block_number) for block_number in range(1, 8)]
+    dispatch(wal, blocks)
+
+    progress = []
+    aggregate = restore_state(
+        transition_function=state_transtion_acc,
+        storage=wal.storage,
+        state_change_identifier=HIGH_STATECHANGE_ULID,
+        node_address=make_address(),
+        batch_size=3,
+        prefetch_batches=prefetch_batches,
+        progress=progress.append,
+    )
+
+    assert aggregate.state_changes == blocks
+    assert [(p.replayed, p.total) for p in progress] == [(3, 7), (6, 7), (7, 7)]
+    assert progress[-1].eta == 0
+
+
 def test_get_snapshot_before_state_change() -> None:
     wal = new_wal(state_transtion_acc, AccState())
 
@@ -255,3 +308,505 @@ def test_get_snapshot_before_state_change() -> None:
 
     snapshot = wal.storage.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
     assert snapshot and snapshot.data == AccState([block1, block2, block3])
+
+
+def test_copy_on_write_matches_full_copy() -> None:
+    container = make_chain_state(number_of_channels=4)
+    channel_state = container.channels[0]
+    set_reveal_timeout = ActionChannelSetRevealTimeout(
+        canonical_identifier=channel_state.canonical_identifier,
+        reveal_timeout=BlockTimeout(channel_state.reveal_timeout + 7),
+    )
+    block = Block(
+        block_number=BlockNumber(container.chain_state.block_number + 1),
+        gas_limit=BlockGasLimit(1),
+        block_hash=make_block_hash(),
+    )
+
+    full_copy_wal = new_wal(node.state_transition, deepcopy(container.chain_state))
+    cow_wal = new_wal(node.state_transition, deepcopy(container.chain_state), copy_on_write=True)
+
+    for wal in (full_copy_wal, cow_wal):
+        dispatch(wal, [set_reveal_timeout])
+        dispatch(wal, [block])
+
+    assert cow_wal.get_current_state() == full_copy_wal.get_current_state()
+    assert (
+        cow_wal.get_current_state().pseudo_random_generator.getstate()
+        == full_copy_wal.get_current_state().pseudo_random_generator.getstate()
+    )
+
+
+def test_copy_on_write_shares_untouched_channels() -> None:
+    container = make_chain_state(number_of_channels=2)
+    touched, untouched = container.channels
+    wal = new_wal(node.state_transition, container.chain_state, copy_on_write=True)
+    previous_state = wal.get_current_state()
+
+    dispatch(
+        wal,
+        [
+            ActionChannelSetRevealTimeout(
+                canonical_identifier=touched.canonical_identifier,
+                reveal_timeout=BlockTimeout(touched.reveal_timeout + 7),
+            )
+        ],
+    )
+
+    new_state = wal.get_current_state()
+    token_network = views.get_token_network_by_address(new_state, container.token_network_address)
+    assert token_network
+    channels = token_network.channelidentifiers_to_channels
+    assert type(channels) is dict  # pylint: disable=unidiomatic-typecheck
+    assert channels[untouched.identifier] is untouched
+    assert channels[touched.identifier] is not touched
+    assert channels[touched.identifier].reveal_timeout == touched.reveal_timeout + 7
+    assert previous_state.identifiers_to_tokennetworkregistries is not (
+        new_state.identifiers_to_tokennetworkregistries
+    )
+
+
+def test_copy_on_write_rollback_keeps_previous_state() -> None:
+    container = make_chain_state(number_of_channels=2)
+    chain_state = container.chain_state
+    expected_state = deepcopy(chain_state)
+
+    def state_transition_fail(state, state_change):
+        iteration = node.state_transition(state, state_change)
+        raise RuntimeError("state transition failed")
+        return iteration  # pylint: disable=unreachable
+
+    wal = new_wal(state_transition_fail, chain_state, copy_on_write=True)
+
+    with pytest.raises(RuntimeError):
+        dispatch(
+            wal,
+            [
+                Block(
+                    block_number=BlockNumber(chain_state.block_number + 1),
+                    gas_limit=BlockGasLimit(1),
+                    block_hash=make_block_hash(),
+                )
+            ],
+        )
+
+    assert wal.get_current_state() is chain_state
+    assert chain_state == expected_state
+    assert chain_state.block_number == expected_state.block_number
+
+
+def make_block(block_number: int) -> Block:
+    return Block(
+        block_number=BlockNumber(block_number),
+        gas_limit=BlockGasLimit(1),
+        block_hash=make_block_hash(),
+    )
+
+
+def test_group_commit_shares_commit_between_batches():
+    wal = new_wal(state_transtion_acc, AccState(), group_commit_window=0.05)
+    blocks = [make_block(block_number) for block_number in range(1, 6)]
+
+    def dispatch_and_check(block):
+        dispatch(wal, [block])
+        # The batch must only return once it is durable
+        assert not wal.storage.database.in_transaction
+        assert block in wal.storage.get_statechanges_by_range(RANGE_ALL_STATE_CHANGES)
+
+    greenlets = [gevent.spawn(dispatch_and_check, block) for block in blocks]
+    gevent.joinall(greenlets, raise_error=True)
+
+    assert wal.commit_stats.commits == 1
+    assert wal.commit_stats.batches == len(blocks)
+    assert wal.storage.get_statechanges_by_range(RANGE_ALL_STATE_CHANGES) == blocks
+    assert wal.get_current_state().state_changes == blocks
+
+
+def test_group_commit_max_batches():
+    wal = new_wal(
+        state_transtion_acc, AccState(), group_commit_window=60, group_commit_max_batches=2
+    )
+    blocks = [make_block(block_number) for block_number in range(1, 5)]
+
+    greenlets = [gevent.spawn(dispatch, wal, [block]) for block in blocks]
+    gevent.joinall(greenlets, raise_error=True, timeout=5)
+
+    assert all(greenlet.successful() for greenlet in greenlets)
+    assert wal.commit_stats.commits == 2
+    assert wal.storage.get_statechanges_by_range(RANGE_ALL_STATE_CHANGES) == blocks
+
+
+def test_group_commit_failed_batch_is_rolled_back():
+    failing_block = make_block(2)
+
+    def state_transition(state, state_change):
+        if state_change == failing_block:
+            raise RuntimeError("state transition failed")
+        return state_transtion_acc(state, state_change)
+
+    wal = new_wal(state_transition, AccState(), group_commit_window=0.05)
+    blocks = [make_block(1), failing_block, make_block(3)]
+
+    greenlets = [gevent.spawn(dispatch, wal, [block]) for block in blocks]
+    gevent.joinall(greenlets)  # pylint: disable=gevent-joinall-raise-error
+
+    assert [greenlet.successful() for greenlet in greenlets] == [True, False, True]
+    expected = [blocks[0], blocks[2]]
+    assert wal.storage.get_statechanges_by_range(RANGE_ALL_STATE_CHANGES) == expected
+    assert wal.get_current_state().state_changes == expected
+    assert wal.commit_stats.commits == 1
+
+
+def test_group_commit_failed_commit_restores_state(monkeypatch):
+    wal = new_wal(state_transtion_acc, AccState(), group_commit_window=0.05)
+    first_block = make_block(1)
+    dispatch(wal, [first_block])
+    state = wal.get_current_state()
+    saved_state = wal.saved_state
+
+    database = wal.storage.database
+    commit = database.commit
+
+    def failing_commit():
+        database.conn.execute("ROLLBACK")
+        database.in_transaction = False
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(database, "commit", failing_commit)
+    blocks = [make_block(2), make_block(3)]
+    greenlets = [gevent.spawn(dispatch, wal, [block]) for block in blocks]
+    gevent.joinall(greenlets)  # pylint: disable=gevent-joinall-raise-error
+
+    assert not any(greenlet.successful() for greenlet in greenlets)
+    assert wal.get_current_state() is state
+    assert wal.saved_state is saved_state
+    assert wal.get_current_state().state_changes == [first_block]
+    assert wal.storage.get_statechanges_by_range(RANGE_ALL_STATE_CHANGES) == [first_block]
+
+    # The next batches build on the restored state
+    monkeypatch.setattr(database, "commit", commit)
+    last_block = make_block(4)
+    dispatch(wal, [last_block])
+    assert wal.get_current_state().state_changes == [first_block, last_block]
+    assert wal.storage.get_statechanges_by_range(RANGE_ALL_STATE_CHANGES) == [
+        first_block,
+        last_block,
+    ]
+
+
+def test_group_commit_flush():
+    wal = new_wal(state_transtion_acc, AccState(), group_commit_window=60)
+    block = make_block(1)
+
+    greenlet = gevent.spawn(dispatch, wal, [block])
+    gevent.sleep(0)
+    assert not greenlet.ready()
+    assert wal.storage.database.in_transaction
+
+    wal.flush()
+    greenlet.get(timeout=5)
+    assert not wal.storage.database.in_transaction
+    assert wal.commit_stats.commits == 1
+
+
+def make_serializable_chain_state(number_of_channels: int) -> ContainerForChainStateTests:
+    registry_address = make_token_network_registry_address()
+    return make_chain_state(
+        number_of_channels=number_of_channels,
+        properties=[
+            NettingChannelStateProperties(token_network_registry_address=registry_address)
+            for _ in range(number_of_channels)
+        ],
+    )
+
+
+def set_reveal_timeout(channel_state, reveal_timeout):
+    return ActionChannelSetRevealTimeout(
+        canonical_identifier=channel_state.canonical_identifier,
+        reveal_timeout=BlockTimeout(reveal_timeout),
+    )
+
+
+@pytest.mark.parametrize("copy_on_write", [False, True])
+def test_delta_snapshots_restore_state(copy_on_write):
+    container = make_serializable_chain_state(number_of_channels=4)
+    wal = new_wal(
+        node.state_transition,
+        container.chain_state,
+        copy_on_write=copy_on_write,
+        delta_snapshots=True,
+        snapshot_rebase_interval=2,
+    )
+    storage = wal.storage
+    channels = container.channels
+
+    def snapshot_and_restore():
+        wal.snapshot(statechange_qty=storage.count_state_changes())
+        snapshot = storage.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
+        assert snapshot.state_change_identifier == wal.saved_state.state_change_id
+        assert snapshot.data == wal.get_current_state()
+
+    # The first snapshot is a full one
+    dispatch(wal, [set_reveal_timeout(channels[0], 10)])
+    snapshot_and_restore()
+    base_snapshot = storage.database.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
+
+    # The deltas only contain the channels changed since the base
+    dispatch(wal, [set_reveal_timeout(channels[1], 10)])
+    snapshot_and_restore()
+    dispatch(wal, [set_reveal_timeout(channels[2], 10)])
+    snapshot_and_restore()
+
+    delta_row = storage.database.get_snapshot_delta_before_state_change(
+        base_snapshot.identifier, HIGH_STATECHANGE_ULID
+    )
+    assert delta_row
+    delta = storage.serializer.deserialize(delta_row.data)
+    assert {channel_state.identifier for channel_state in delta.channels} == {
+        channels[1].identifier,
+        channels[2].identifier,
+    }
+
+    # A channel removed after the base must not be restored. The rebase
+    # interval is reached, the next snapshot is a full one.
+    token_network = views.get_token_network_by_address(
+        wal.get_current_state(), container.token_network_address
+    )
+    assert token_network
+    del token_network.channelidentifiers_to_channels[channels[3].identifier]
+    dispatch(wal, [set_reveal_timeout(channels[0], 11)])
+    snapshot_and_restore()
+    new_base = storage.database.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
+    assert new_base.identifier != base_snapshot.identifier
+
+
+def test_delta_snapshots_prune_old_bases():
+    container = make_serializable_chain_state(number_of_channels=1)
+    wal = new_wal(
+        node.state_transition,
+        container.chain_state,
+        delta_snapshots=True,
+        snapshot_rebase_interval=1,
+        snapshot_keep_bases=2,
+    )
+    storage = wal.storage
+
+    for reveal_timeout in range(10, 16):
+        dispatch(wal, [set_reveal_timeout(container.channels[0], reveal_timeout)])
+        wal.snapshot(statechange_qty=storage.count_state_changes())
+
+    conn = storage.database.conn
+    # The initial snapshot and the two newest bases
+    assert conn.execute("SELECT COUNT(1) FROM state_snapshot").fetchone()[0] == 3
+    # Only the deltas of the kept bases
+    assert conn.execute("SELECT COUNT(1) FROM state_snapshot_delta").fetchone()[0] == 2
+
+    snapshot = storage.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
+    assert snapshot.data == wal.get_current_state()
+
+
+def test_background_snapshot_does_not_block_dispatch():
+    container = make_serializable_chain_state(number_of_channels=2)
+    wal = new_wal(node.state_transition, container.chain_state, background_snapshots=True)
+    storage = wal.storage
+    channels = container.channels
+
+    dispatch(wal, [set_reveal_timeout(channels[0], 10)])
+    wal.snapshot(statechange_qty=1)
+    snapshot_state = wal.get_current_state()
+
+    # The snapshot is written by the worker, the state can change meanwhile
+    dispatch(wal, [set_reveal_timeout(channels[1], 10)])
+    snapshot = storage.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
+    assert snapshot.state_change_identifier == LOW_STATECHANGE_ULID
+
+    wal.flush()
+    snapshot = storage.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
+    assert snapshot.state_change_qty == 1
+    assert snapshot.data == snapshot_state
+    assert snapshot.data != wal.get_current_state()
+
+
+def test_background_snapshot_writes_newest_pending_state():
+    wal = new_wal(state_transtion_acc, AccState(), background_snapshots=True)
+
+    dispatch(wal, [make_block(1)])
+    wal.snapshot(statechange_qty=1)
+    dispatch(wal, [make_block(2)])
+    wal.snapshot(statechange_qty=2)
+    wal.flush()
+
+    conn = wal.storage.database.conn
+    # The initial snapshot and the newest one
+    assert conn.execute("SELECT COUNT(1) FROM state_snapshot").fetchone()[0] == 2
+    snapshot = wal.storage.get_snapshot_before_state_change(HIGH_STATECHANGE_ULID)
+    assert snapshot.state_change_qty == 2
+    assert snapshot.data == wal.get_current_state()
+
+
+def test_background_snapshot_error_is_raised(monkeypatch):
+    wal = new_wal(state_transtion_acc, AccState(), background_snapshots=True)
+
+    def write_state_snapshot(*args, **kwargs):  # pylint: disable=unused-argument
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(wal.storage.database, "write_state_snapshot", write_state_snapshot)
+
+    dispatch(wal, [make_block(1)])
+    wal.snapshot(statechange_qty=1)
+    with pytest.raises(sqlite3.OperationalError):
+        wal.flush()
+
+
+def test_compaction_keeps_state_changes_needed_by_restore():
+    container = make_serializable_chain_state(number_of_channels=1)
+    wal = new_wal(node.state_transition, container.chain_state)
+    storage = wal.storage
+    channel_state = container.channels[0]
+
+    def snapshot():
+        wal.snapshot(statechange_qty=storage.count_state_changes())
+        return storage.database.get_snapshot_state_change_before(HIGH_STATECHANGE_ULID)
+
+    dispatch(wal, [set_reveal_timeout(channel_state, 9)])
+    dispatch(wal, [set_reveal_timeout(channel_state, 10)])
+    first_horizon = snapshot()
+
+    # A balance proof of the partner, which is looked up to settle the channel
+    balance_proof = create(
+        BalanceProofSignedStateProperties(
+            canonical_identifier=channel_state.canonical_identifier,
+            sender=channel_state.partner_state.address,
+        )
+    )
+    pinned_state_change_id = storage.write_state_changes(
+        [
+            ReceiveLockExpired(
+                sender=balance_proof.sender,
+                balance_proof=balance_proof,
+                secrethash=make_secret_hash(),
+                message_identifier=make_message_identifier(),
+            )
+        ]
+    )[0]
+
+    dispatch(wal, [set_reveal_timeout(channel_state, 11)])
+    second_horizon = snapshot()
+    dispatch(wal, [set_reveal_timeout(channel_state, 12)])
+
+    assert StateCompactor(wal).horizon(wal.get_current_state()) == second_horizon
+
+    current_channel_state = views.get_channelstate_by_canonical_identifier(
+        wal.get_current_state(), channel_state.canonical_identifier
+    )
+    assert current_channel_state
+    current_channel_state.partner_state.balance_proof = balance_proof
+    compactor = StateCompactor(wal, batch_size=1)
+    assert compactor.horizon(wal.get_current_state()) == first_horizon
+
+    compactor.run()
+
+    remaining = storage.get_statechanges_records_by_range(RANGE_ALL_STATE_CHANGES)
+    assert remaining[0].state_change_identifier == first_horizon
+    assert len(remaining) == 4
+
+    restored_state = restore_state(
+        transition_function=node.state_transition,
+        storage=storage,
+        state_change_identifier=pinned_state_change_id,
+        node_address=container.chain_state.our_address,
+    )
+    restored_channel_state = views.get_channelstate_by_canonical_identifier(
+        restored_state, channel_state.canonical_identifier
+    )
+    assert restored_channel_state.reveal_timeout == 10
+
+
+def test_compaction_keeps_balance_proofs_needed_to_unlock():
+    container = make_serializable_chain_state(number_of_channels=1)
+    wal = new_wal(node.state_transition, container.chain_state)
+    storage = wal.storage
+    channel_state = container.channels[0]
+    canonical_identifier = channel_state.canonical_identifier
+    partner_address = channel_state.partner_state.address
+
+    def snapshot():
+        wal.snapshot(statechange_qty=storage.count_state_changes())
+        return storage.database.get_snapshot_state_change_before(HIGH_STATECHANGE_ULID)
+
+    dispatch(wal, [set_reveal_timeout(channel_state, 9)])
+    first_horizon = snapshot()
+
+    # The balance proofs the channel was closed with, which are older than the
+    # current ones
+    partner_balance_proof = create(
+        BalanceProofSignedStateProperties(
+            canonical_identifier=canonical_identifier,
+            sender=partner_address,
+            locksroot=make_locksroot(),
+        )
+    )
+    partner_state_change_id = storage.write_state_changes(
+        [
+            ReceiveLockExpired(
+                sender=partner_address,
+                balance_proof=partner_balance_proof,
+                secrethash=make_secret_hash(),
+                message_identifier=make_message_identifier(),
+            )
+        ]
+    )[0]
+    our_balance_proof = create(
+        BalanceProofProperties(
+            canonical_identifier=canonical_identifier, locksroot=make_locksroot()
+        )
+    )
+    our_state_change_id = storage.write_state_changes([make_block(1)])[0]
+    storage.write_events(
+        [
+            (
+                our_state_change_id,
+                SendLockExpired(
+                    recipient=partner_address,
+                    recipient_metadata=None,
+                    message_identifier=make_message_identifier(),
+                    balance_proof=our_balance_proof,
+                    secrethash=make_secret_hash(),
+                    canonical_identifier=canonical_identifier,
+                ),
+            )
+        ]
+    )
+
+    dispatch(wal, [set_reveal_timeout(channel_state, 10)])
+    snapshot()
+    dispatch(wal, [set_reveal_timeout(channel_state, 11)])
+
+    current_channel_state = views.get_channelstate_by_canonical_identifier(
+        wal.get_current_state(), canonical_identifier
+    )
+    assert current_channel_state
+    current_channel_state.partner_state.onchain_locksroot = partner_balance_proof.locksroot
+    current_channel_state.our_state.onchain_locksroot = our_balance_proof.locksroot
+
+    compactor = StateCompactor(wal, batch_size=1)
+    assert compactor.horizon(wal.get_current_state()) == first_horizon
+    compactor.run()
+
+    # The lookups of the unlock still find the balance proofs
+    state_change_record = get_state_change_with_balance_proof_by_locksroot(
+        storage=storage,
+        canonical_identifier=canonical_identifier,
+        locksroot=partner_balance_proof.locksroot,
+        sender=partner_address,
+    )
+    assert state_change_record
+    assert state_change_record.state_change_identifier == partner_state_change_id
+    event_record = get_event_with_balance_proof_by_locksroot(
+        storage=storage,
+        canonical_identifier=canonical_identifier,
+        locksroot=our_balance_proof.locksroot,
+        recipient=partner_address,
+    )
+    assert event_record
+    assert event_record.state_change_identifier == our_state_change_id
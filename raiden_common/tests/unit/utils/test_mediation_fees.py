@@ -1,7 +1,12 @@
+import operator
+from fractions import Fraction
 from math import isclose
 
 import pytest
+from hypothesis import assume, given, strategies as st
 
+from raiden_common.exceptions import UndefinedMediationFee
+from raiden_common.settings import MediationFeeConfig
 from raiden_common.tests.utils import factories
 from raiden_common.tests.utils.factories import (
     CanonicalIdentifierProperties,
@@ -10,12 +15,25 @@
     make_channel_set,
 )
 from raiden_common.tests.utils.mediation_fees import get_initial_amount_for_amount_after_fees
-from raiden_common.transfer.mediated_transfer.mediation_fee import FeeScheduleState
+from raiden_common.transfer.channel import update_fee_schedule_after_balance_change
+from raiden_common.transfer.mediated_transfer.mediation_fee import (
+    FeeFunctionCache,
+    FeeScheduleState,
+    Interpolate,
+    calculate_imbalance_fees,
+    fee_function_cache,
+)
+from raiden_common.transfer.mediated_transfer.mediator import (
+    find_intersection,
+    get_amount_without_fees,
+)
 from raiden_common.utils.mediation_fees import ppm_fee_per_channel, prepare_mediation_fee_config
 from raiden_common.utils.typing import (
+    Balance,
     ChannelID,
     FeeAmount,
     List,
+    Optional,
     PaymentAmount,
     PaymentWithFeeAmount,
     ProportionalFeeAmount,
@@ -112,3 +130,247 @@ def test_get_initial_payment_for_final_target_amount(
     assert calculation is not None
     assert calculation.total_amount == initial_amount
     assert calculation.mediation_fees == expected_fees
+
+
+def interpolate(fee_func: Interpolate, x: Fraction) -> Fraction:
+    """Evaluates `fee_func` with the arithmetic of `Fraction`"""
+    if x == fee_func.x_list[-1]:
+        return fee_func.y_list[-1]
+    i = max(i for i, x1 in enumerate(fee_func.x_list) if x1 <= x)
+    x1, x2 = fee_func.x_list[i : i + 2]
+    y1, y2 = fee_func.y_list[i : i + 2]
+    return y1 + (y2 - y1) / (x2 - x1) * (x - x1)
+
+
+def walk_intersection(fee_func: Interpolate, line) -> Optional[Fraction]:
+    """Searches the intersection by walking all the sections"""
+    i = 0
+    y = fee_func.y_list[i]
+    compare = operator.lt if y < line(i) else operator.gt
+    while compare(y, line(i)):
+        i += 1
+        if i == len(fee_func.x_list):
+            return None
+        y = fee_func.y_list[i]
+
+    x1, x2 = fee_func.x_list[i - 1], fee_func.x_list[i]
+    yf1, yf2 = fee_func.y_list[i - 1], fee_func.y_list[i]
+    yl1, yl2 = line(i - 1), line(i)
+    return (yl1 - yf1) * (x2 - x1) / ((yf2 - yf1) - (yl2 - yl1)) + x1
+
+
+fractions = st.builds(
+    Fraction,
+    st.integers(-(10**12), 10**12),
+    st.integers(1, 10**6),  # pylint: disable=no-member
+)
+capacities = st.integers(1, 10**22)
+proportional_imbalance_fees = st.integers(1, 50_000)
+
+
+@given(
+    x_list=st.lists(fractions, min_size=2, max_size=10, unique=True),
+    y_list=st.lists(fractions, min_size=10, max_size=10),
+    data=st.data(),
+)
+def test_interpolate_is_exact(x_list, y_list, data):
+    x_list.sort()
+    fee_func = Interpolate(x_list, y_list[: len(x_list)])
+    x = data.draw(
+        st.fractions(x_list[0], x_list[-1]) | st.sampled_from(x_list), label="x"
+    )  # pylint: disable=no-member
+
+    assert fee_func(x) == interpolate(fee_func, x)
+    assert isinstance(fee_func(x), Fraction)
+
+
+def test_interpolate_x_values():
+    fee_func = Interpolate([0, Fraction(1, 2), 2], [0, 1, 2])
+
+    assert fee_func.x_values == fee_func.x_list
+    assert [type(x) for x in fee_func.x_values] == [int, Fraction, int]
+
+
+@given(
+    capacity=capacities,
+    proportional_imbalance_fee=proportional_imbalance_fees,
+    flat=st.integers(0, 10**18),
+    proportional=st.integers(0, 1_000_000),
+    cap_fees=st.booleans(),
+    backwards=st.booleans(),
+    data=st.data(),
+)
+def test_mediation_fee_func_is_exact(  # pylint: disable=too-many-locals
+    capacity, proportional_imbalance_fee, flat, proportional, cap_fees, backwards, data
+):
+    schedule = FeeScheduleState(
+        flat=flat,
+        proportional=proportional,
+        imbalance_penalty=calculate_imbalance_fees(capacity, proportional_imbalance_fee),
+    )
+    balance_in = Balance(data.draw(st.integers(0, capacity), label="balance_in"))
+    balance_out = Balance(data.draw(st.integers(0, capacity), label="balance_out"))
+    receivable = TokenAmount(capacity - balance_in)
+    amount = PaymentWithFeeAmount(data.draw(st.integers(1, capacity), label="amount"))
+
+    try:
+        if backwards:
+            fee_func = FeeScheduleState.mediation_fee_backwards_func(
+                schedule, schedule, balance_in, balance_out, receivable, amount, cap_fees
+            )
+        else:
+            fee_func = FeeScheduleState.mediation_fee_func(
+                schedule, schedule, balance_in, balance_out, receivable, amount, cap_fees
+            )
+    except UndefinedMediationFee:
+        return
+
+    for x, y in zip(fee_func.x_list, fee_func.y_list):
+        if backwards:
+            fee = schedule.fee(balance_in, x) + schedule.fee(balance_out, -Fraction(amount))
+        else:
+            fee = schedule.fee(balance_in, Fraction(amount)) + schedule.fee(balance_out, -x)
+        assert y == (max(fee, Fraction(0)) if cap_fees else fee)
+
+    if backwards:
+        line = lambda i: fee_func.x_list[i] - amount  # noqa: E731
+    else:
+        line = lambda i: amount - fee_func.x_list[i]  # noqa: E731
+    assert find_intersection(fee_func, line) == walk_intersection(fee_func, line)
+
+
+@given(
+    y_start=fractions,
+    slope_offsets=st.lists(fractions, min_size=1, max_size=10),
+    line_start=fractions,
+    line_slope=fractions,
+    monotonic=st.booleans(),
+)
+def test_find_intersection_matches_walk(  # pylint: disable=too-many-arguments
+    y_start, slope_offsets, line_start, line_slope, monotonic
+):
+    if monotonic:
+        # All the sections are steeper than the line, or all are flatter
+        sign = 1 if slope_offsets[0] >= 0 else -1
+        slope_offsets = [sign * abs(offset) for offset in slope_offsets]
+    y_list = [y_start]
+    for offset in slope_offsets:
+        y_list.append(y_list[-1] + line_slope + offset)
+
+    fee_func = Interpolate(range(len(y_list)), y_list)
+    line = lambda i: line_start + line_slope * fee_func.x_list[i]  # noqa: E731
+
+    try:
+        expected = walk_intersection(fee_func, line)
+    except ZeroDivisionError:
+        assume(False)
+
+    assert find_intersection(fee_func, line) == expected
+
+
+@given(capacity=capacities, proportional_imbalance_fee=proportional_imbalance_fees)
+def test_calculate_imbalance_fees_is_cached(capacity, proportional_imbalance_fee):
+    imbalance_fees = calculate_imbalance_fees(capacity, proportional_imbalance_fee)
+    assert imbalance_fees is not None
+
+    imbalance_fees.clear()
+    assert calculate_imbalance_fees(capacity, proportional_imbalance_fee)
+    assert (
+        FeeScheduleState(
+            imbalance_penalty=calculate_imbalance_fees(capacity, ProportionalFeeAmount(1_000))
+        )._penalty_func
+        is FeeScheduleState(
+            imbalance_penalty=calculate_imbalance_fees(capacity, ProportionalFeeAmount(1_000))
+        )._penalty_func
+    )
+
+
+def test_fee_function_cache():
+    cache = FeeFunctionCache(maxsize=2)
+    schedule = FeeScheduleState(
+        flat=FeeAmount(100),
+        proportional=ProportionalFeeAmount(4_000),
+        imbalance_penalty=calculate_imbalance_fees(
+            TokenAmount(1_000), ProportionalFeeAmount(20_000)
+        ),
+    )
+    channel_in, channel_out, other_channel = (
+        factories.make_canonical_identifier(channel_identifier=ChannelID(identifier))
+        for identifier in (1, 2, 3)
+    )
+
+    def get_fee_func(canonical_identifier_out, balance_out, schedule_out=schedule):
+        return cache.get(
+            canonical_identifier_in=channel_in,
+            canonical_identifier_out=canonical_identifier_out,
+            schedule_in=schedule,
+            schedule_out=schedule_out,
+            balance_in=Balance(400),
+            balance_out=balance_out,
+            receivable=TokenAmount(600),
+            backwards=False,
+        )
+
+    compiled = get_fee_func(channel_out, Balance(500))
+    for amount in (1, 50, 300):
+        fee_func = compiled.interpolate(PaymentWithFeeAmount(amount), cap_fees=True)
+        expected = FeeScheduleState.mediation_fee_func(
+            schedule_in=schedule,
+            schedule_out=schedule,
+            balance_in=Balance(400),
+            balance_out=Balance(500),
+            receivable=TokenAmount(600),
+            amount_with_fees=PaymentWithFeeAmount(amount),
+            cap_fees=True,
+        )
+        assert fee_func.x_list == expected.x_list
+        assert fee_func.y_list == expected.y_list
+
+    # Equal schedules share the fee function, changed ones do not
+    assert schedule.imbalance_penalty
+    equal_schedule = FeeScheduleState(
+        flat=schedule.flat,
+        proportional=schedule.proportional,
+        imbalance_penalty=list(schedule.imbalance_penalty),
+    )
+    assert get_fee_func(channel_out, Balance(500), equal_schedule) is compiled
+    assert get_fee_func(channel_out, Balance(500), FeeScheduleState(flat=FeeAmount(1))) is not (
+        compiled
+    )
+    assert cache.cache_info() == (1, 2, 2, 2)
+
+    # The least recently used function is evicted
+    assert get_fee_func(channel_out, Balance(500)) is compiled
+    get_fee_func(other_channel, Balance(500))
+    assert get_fee_func(channel_out, Balance(500)) is compiled
+    assert cache.cache_info() == (3, 3, 2, 2)
+
+    cache.invalidate(channel_out)
+    assert cache.cache_info().currsize == 1
+    assert get_fee_func(channel_out, Balance(500)) is not compiled
+
+
+def test_balance_change_invalidates_fee_functions():
+    fee_function_cache.clear()
+    channel_set = make_channel_set(
+        [
+            NettingChannelStateProperties(
+                canonical_identifier=factories.create(
+                    CanonicalIdentifierProperties(channel_identifier=ChannelID(identifier))
+                ),
+                our_state=NettingChannelEndStateProperties(balance=TokenAmount(100)),
+                partner_state=NettingChannelEndStateProperties(balance=TokenAmount(100)),
+            )
+            for identifier in (1, 2)
+        ]
+    )
+    channel_in, channel_out = channel_set.channels
+
+    amount = get_amount_without_fees(PaymentWithFeeAmount(50), channel_in, channel_out)
+    assert get_amount_without_fees(PaymentWithFeeAmount(50), channel_in, channel_out) == amount
+    assert fee_function_cache.cache_info()[:2] == (1, 1)
+
+    update_fee_schedule_after_balance_change(channel_out, MediationFeeConfig())
+    assert fee_function_cache.cache_info().currsize == 0
+    assert get_amount_without_fees(PaymentWithFeeAmount(50), channel_in, channel_out) == amount
+    assert fee_function_cache.cache_info()[:2] == (1, 2)
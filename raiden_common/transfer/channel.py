@@ -48,6 +48,7 @@
 from raiden_common.transfer.mediated_transfer.mediation_fee import (
     FeeScheduleState,
     calculate_imbalance_fees,
+    fee_function_cache,
 )
 from raiden_common.transfer.mediated_transfer.state import (
     LockedTransferSignedState,
@@ -65,6 +66,7 @@
     CoopSettleState,
     ExpiredWithdrawState,
     HashTimeLockState,
+    LocksDict,
     NettingChannelEndState,
     NettingChannelState,
     PendingLocksState,
@@ -124,6 +126,7 @@
     PaymentWithFeeAmount,
     Secret,
     SecretHash,
+    Set,
     Signature,
     TargetAddress,
     TokenAmount,
@@ -131,6 +134,7 @@
     Tuple,
     Union,
     WithdrawAmount,
+    cast,
     typecheck,
 )
 
@@ -1135,22 +1139,18 @@ def is_valid_withdraw_expired(
         return SuccessOrError()
 
 
-def get_amount_unclaimed_onchain(end_state: NettingChannelEndState) -> TokenAmount:
-    return TokenAmount(
-        sum(
-            unlock.lock.amount
-            for unlock in end_state.secrethashes_to_onchain_unlockedlocks.values()
-        )
-    )
+def _get_total_amount(locks: Dict[SecretHash, Any]) -> int:
+    # The locks of a `NettingChannelEndState` are kept in a `LocksDict`
+    return cast(LocksDict, locks).total_amount
 
 
-def get_amount_locked(end_state: NettingChannelEndState) -> LockedAmount:
-    total_pending = sum(lock.amount for lock in end_state.secrethashes_to_lockedlocks.values())
+def get_amount_unclaimed_onchain(end_state: NettingChannelEndState) -> TokenAmount:
+    return TokenAmount(_get_total_amount(end_state.secrethashes_to_onchain_unlockedlocks))
 
-    total_unclaimed = sum(
-        unlock.lock.amount for unlock in end_state.secrethashes_to_unlockedlocks.values()
-    )
 
+def get_amount_locked(end_state: NettingChannelEndState) -> LockedAmount:
+    total_pending = _get_total_amount(end_state.secrethashes_to_lockedlocks)
+    total_unclaimed = _get_total_amount(end_state.secrethashes_to_unlockedlocks)
     total_unclaimed_onchain = get_amount_unclaimed_onchain(end_state)
 
     result = total_pending + total_unclaimed + total_unclaimed_onchain
@@ -1396,14 +1396,30 @@ def update_contract_balance(end_state: NettingChannelEndState, contract_balance:
         end_state.contract_balance = contract_balance
 
 
+def _get_lock_set(locks: PendingLocksState) -> Set[EncodedData]:
+    if locks.lock_set is None:
+        locks.lock_set = set(locks.locks)
+    return locks.lock_set
+
+
+def _move_lock_set(locks: PendingLocksState, new_locks: PendingLocksState) -> Set[EncodedData]:
+    # `locks` is usually replaced by `new_locks`, so its set is reused instead
+    # of copied. `locks` rebuilds it if it is used again.
+    lock_set = _get_lock_set(locks)
+    locks.lock_set = None
+    new_locks.lock_set = lock_set
+    return lock_set
+
+
 def compute_locks_with(
     locks: PendingLocksState, lock: Union[HashTimeLockState, UnlockPartialProofState]
 ) -> Optional[PendingLocksState]:
     """Register the given lock with as a pending locks."""
-    if bytes(lock.encoded) not in locks.locks:
-        locks = PendingLocksState(list(locks.locks))
-        locks.locks.append(EncodedData(bytes(lock.encoded)))  # pylint: disable=E1101
-        return locks
+    lock_encoded = EncodedData(bytes(lock.encoded))
+    if lock_encoded not in _get_lock_set(locks):
+        new_locks = PendingLocksState(locks.locks + [lock_encoded])
+        _move_lock_set(locks, new_locks).add(lock_encoded)
+        return new_locks
     else:
         return None
 
@@ -1412,10 +1428,11 @@ def compute_locks_without(
     locks: PendingLocksState, lock_encoded: EncodedData
 ) -> Optional[PendingLocksState]:
     # Use None to inform the caller the lock is unknown
-    if lock_encoded in locks.locks:
-        locks = PendingLocksState(list(locks.locks))
-        locks.locks.remove(lock_encoded)
-        return locks
+    if lock_encoded in _get_lock_set(locks):
+        new_locks = PendingLocksState(list(locks.locks))
+        new_locks.locks.remove(lock_encoded)
+        _move_lock_set(locks, new_locks).remove(lock_encoded)
+        return new_locks
     else:
         return None
 
@@ -1424,7 +1441,9 @@ def compute_locksroot(locks: PendingLocksState) -> Locksroot:
     """Compute the hash representing all pending locks
     The hash is submitted in TokenNetwork.settleChannel() call.
     """
-    return Locksroot(keccak(b"".join(locks.locks)))
+    if locks.locksroot is None:
+        locks.locksroot = Locksroot(keccak(b"".join(locks.locks)))
+    return locks.locksroot
 
 
 def create_sendlockedtransfer(
@@ -1858,6 +1877,31 @@ def events_for_expired_withdraws(
     return events
 
 
+def get_block_deadline(channel_state: NettingChannelState) -> Optional[BlockNumber]:
+    """Return the first block number at which a `Block` state change has an
+    effect on `channel_state`, or `None` if blocks have no effect on it.
+
+    The result only changes when a state change other than `Block` is applied
+    to the channel, see `_handle_block`.
+    """
+    status = get_status(channel_state)
+
+    if status == ChannelState.STATE_OPENED:
+        # Only the first pending withdraw is checked, see
+        # `events_for_expired_withdraws`.
+        for withdraw_state in channel_state.our_state.withdraws_pending.values():
+            return BlockNumber(get_sender_expiration_threshold(withdraw_state.expiration))
+
+    elif status == ChannelState.STATE_CLOSED:
+        assert channel_state.close_transaction, "Closed channel must have a close_transaction"
+        closed_block_number = channel_state.close_transaction.finished_block_number
+        assert closed_block_number, "Closed channel must have a finished_block_number"
+
+        return BlockNumber(closed_block_number + channel_state.settle_timeout + 1)
+
+    return None
+
+
 def register_secret_endstate(
     end_state: NettingChannelEndState, secret: Secret, secrethash: SecretHash
 ) -> None:
@@ -2706,6 +2750,7 @@ def update_fee_schedule_after_balance_change(
         proportional=channel_state.fee_schedule.proportional,
         imbalance_penalty=imbalance_penalty,
     )
+    fee_function_cache.invalidate(channel_state.canonical_identifier)
     return []
 
 
@@ -2861,23 +2906,25 @@ def sanity_check(channel_state: NettingChannelState) -> None:
     assert partner_locksroot == partner_bp_locksroot, msg
 
     msg = "The lock mappings and the pending locks must be synchronized, otherwise there is a bug"
+    partner_lock_set = _get_lock_set(partner_state.pending_locks)
+    our_lock_set = _get_lock_set(our_state.pending_locks)
     for lock in partner_state.secrethashes_to_lockedlocks.values():
-        assert lock.encoded in partner_state.pending_locks.locks, msg
+        assert lock.encoded in partner_lock_set, msg
 
     for partial_unlock in partner_state.secrethashes_to_unlockedlocks.values():
-        assert partial_unlock.encoded in partner_state.pending_locks.locks, msg
+        assert partial_unlock.encoded in partner_lock_set, msg
 
     for partial_unlock in partner_state.secrethashes_to_onchain_unlockedlocks.values():
-        assert partial_unlock.encoded in partner_state.pending_locks.locks, msg
+        assert partial_unlock.encoded in partner_lock_set, msg
 
     for lock in our_state.secrethashes_to_lockedlocks.values():
-        assert lock.encoded in our_state.pending_locks.locks, msg
+        assert lock.encoded in our_lock_set, msg
 
     for partial_unlock in our_state.secrethashes_to_unlockedlocks.values():
-        assert partial_unlock.encoded in our_state.pending_locks.locks, msg
+        assert partial_unlock.encoded in our_lock_set, msg
 
     for partial_unlock in our_state.secrethashes_to_onchain_unlockedlocks.values():
-        assert partial_unlock.encoded in our_state.pending_locks.locks, msg
+        assert partial_unlock.encoded in our_lock_set, msg
 
 
 def state_transition(
@@ -46,9 +46,9 @@
     Address,
     BlockExpiration,
     BlockNumber,
-    Dict,
     FeeAmount,
     List,
+    Mapping,
     MessageID,
     Optional,
     PaymentAmount,
@@ -229,7 +229,7 @@ def handle_block(
 
 
 def try_new_route(
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     candidate_route_states: List[RouteState],
     transfer_description: TransferDescriptionWithSecretState,
     pseudo_random_generator: random.Random,
@@ -36,6 +36,7 @@
     ChannelID,
     Dict,
     List,
+    Mapping,
     Optional,
     SecretHash,
     TokenNetworkAddress,
@@ -180,7 +181,7 @@ def handle_block(
 def handle_init(
     payment_state: Optional[InitiatorPaymentState],
     state_change: ActionInitInitiator,
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
     block_number: BlockNumber,
 ) -> TransitionResult[Optional[InitiatorPaymentState]]:
@@ -258,7 +259,7 @@ def handle_transferreroute(
     payment_state: InitiatorPaymentState,
     state_change: ActionTransferReroute,
     channelidentifiers_to_channels: Dict[ChannelID, NettingChannelState],
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
     block_number: BlockNumber,
 ) -> TransitionResult[InitiatorPaymentState]:
@@ -481,7 +482,7 @@ def state_transition(
     payment_state: Optional[InitiatorPaymentState],
     state_change: StateChange,
     channelidentifiers_to_channels: Dict[ChannelID, NettingChannelState],
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
     block_number: BlockNumber,
 ) -> TransitionResult[Optional[InitiatorPaymentState]]:
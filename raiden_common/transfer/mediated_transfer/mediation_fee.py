@@ -1,11 +1,14 @@
 from bisect import bisect, bisect_right
+from collections import OrderedDict
 from copy import copy
 from dataclasses import dataclass, field
 from fractions import Fraction
-from typing import List, Optional, Sequence, Tuple, TypeVar, Union
+from functools import lru_cache
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple, TypeVar, Union
 
 from raiden_common.exceptions import UndefinedMediationFee
 from raiden_common.transfer.architecture import State
+from raiden_common.transfer.identifiers import CanonicalIdentifier
 from raiden_common.utils.typing import (
     Balance,
     FeeAmount,
@@ -16,36 +19,94 @@
 )
 
 NUM_DISCRETISATION_POINTS = 21
+FEE_FUNCTION_CACHE_SIZE = 1024
 
 
 class Interpolate:  # pylint: disable=too-few-public-methods
     """Linear interpolation of a function with given points
 
     Based on https://stackoverflow.com/a/7345691/114926
+
+    The values are exact fractions. Token amounts do not fit into machine
+    integers, so the evaluation is done on the numerators and denominators,
+    which builds a single `Fraction` per call.
     """
 
     def __init__(
         self, x_list: Sequence[Union[Fraction, int]], y_list: Sequence[Union[Fraction, int]]
     ) -> None:
-        if any(y - x <= 0 for x, y in zip(x_list, x_list[1:])):
+        self.x_list: List[Fraction] = [_to_fraction(x) for x in x_list]
+        # Integral values are searched as `int`s, comparing them is much
+        # cheaper than comparing fractions.
+        self._keys: List[Any] = [_search_key(x) for x in self.x_list]
+        if any(y <= x for x, y in zip(self._keys, self._keys[1:])):
             raise ValueError("x_list must be in strictly ascending order!")
-        self.x_list: List[Fraction] = [Fraction(x) for x in x_list]
-        self.y_list: List[Fraction] = [Fraction(y) for y in y_list]
-        intervals = zip(self.x_list, self.x_list[1:], y_list, y_list[1:])
-        self.slopes: List[Fraction] = [(y2 - y1) / (x2 - x1) for x1, x2, y1, y2 in intervals]
+        self.y_list: List[Fraction] = [_to_fraction(y) for y in y_list]
+        self.slopes: List[Fraction] = [
+            _slope(x1, x2, y1, y2)
+            for x1, x2, y1, y2 in zip(self.x_list, self.x_list[1:], self.y_list, self.y_list[1:])
+        ]
 
     def __call__(self, x: Union[Fraction, int]) -> Fraction:
-        if not self.x_list[0] <= x <= self.x_list[-1]:
+        return Fraction(*self._evaluate(x.numerator, x.denominator))
+
+    def _evaluate(self, x_numerator: int, x_denominator: int) -> Tuple[int, int]:
+        """Returns the numerator and the denominator of the value at
+        `x_numerator / x_denominator`, the fraction is not reduced.
+        """
+        key = x_numerator if x_denominator == 1 else Fraction(x_numerator, x_denominator)
+        if not self._keys[0] <= key <= self._keys[-1]:
             raise ValueError("x out of bounds!")
-        if x == self.x_list[-1]:
-            return self.y_list[-1]
-        i = bisect_right(self.x_list, x) - 1
-        return self.y_list[i] + self.slopes[i] * (Fraction(x) - self.x_list[i])
+        if key == self._keys[-1]:
+            return self.y_list[-1].numerator, self.y_list[-1].denominator
+        i = bisect_right(self._keys, key) - 1
+
+        # y1 + slope * (x - x1), with all the terms on a common denominator
+        x1, y1, slope = self.x_list[i], self.y_list[i], self.slopes[i]
+        delta_denominator = x_denominator * x1.denominator
+        delta_numerator = x_numerator * x1.denominator - x1.numerator * x_denominator
+        return (
+            y1.numerator * slope.denominator * delta_denominator
+            + y1.denominator * slope.numerator * delta_numerator,
+            y1.denominator * slope.denominator * delta_denominator,
+        )
+
+    @property
+    def x_values(self) -> List[Union[Fraction, int]]:
+        """The values of `x_list`, the integral ones as `int`s, which are
+        cheaper to compute with. The list must not be modified.
+        """
+        return self._keys
+
+    def shifted(self, offset: Fraction) -> "Interpolate":
+        """Returns the function plus `offset`, which has the same slopes"""
+        function = copy(self)
+        function.y_list = [y + offset for y in self.y_list]
+        return function
 
     def __repr__(self) -> str:
         return f"Interpolate({self.x_list}, {self.y_list})"
 
 
+def _to_fraction(value: Union[Fraction, int]) -> Fraction:
+    if isinstance(value, Fraction):
+        return value
+    return Fraction(value)
+
+
+def _search_key(value: Union[Fraction, int]) -> Any:
+    return value.numerator if value.denominator == 1 else value
+
+
+def _slope(x1: Fraction, x2: Fraction, y1: Fraction, y2: Fraction) -> Fraction:
+    """(y2 - y1) / (x2 - x1), computed with a single `Fraction`"""
+    delta_y = y2.numerator * y1.denominator - y1.numerator * y2.denominator
+    delta_x = x2.numerator * x1.denominator - x1.numerator * x2.denominator
+    return Fraction(
+        delta_y * x1.denominator * x2.denominator, delta_x * y1.denominator * y2.denominator
+    )
+
+
 def sign(x: Union[float, Fraction]) -> int:
     """Sign of input, returns zero on zero input"""
     if x == 0:
@@ -79,11 +140,11 @@ def _collect_x_values(
 
     To find the penalty fee for the current transfer.
     """
-    all_x_vals = [x - balance_in for x in penalty_func_in.x_list] + [
-        balance_out - x for x in penalty_func_out.x_list
+    all_x_vals = [x - balance_in for x in penalty_func_in.x_values] + [
+        balance_out - x for x in penalty_func_out.x_values
     ]
-    limited_x_vals = (max(min(x, balance_out, max_x), 0) for x in all_x_vals)  # type: ignore
-    return sorted(set(Fraction(x) for x in limited_x_vals))
+    limited_x_vals = (max(min(x, balance_out, max_x), 0) for x in all_x_vals)
+    return [Fraction(x) for x in sorted(set(limited_x_vals))]
 
 
 def _cap_fees(
@@ -95,7 +156,7 @@ def _cap_fees(
 
     for i in range(len(x_list) - 1):
         y1, y2 = y_list[i : i + 2]
-        if sign(y1) * sign(y2) == -1:
+        if sign(y1.numerator) * sign(y2.numerator) == -1:
             x1, x2 = x_list[i : i + 2]
             new_x = x1 + abs(y1) / abs(y2 - y1) * (x2 - x1)
             new_index = bisect(x_list, new_x)
@@ -103,10 +164,121 @@ def _cap_fees(
             y_list.insert(new_index, Fraction(0))
 
     # Cap points that are below zero
-    y_list = [max(y, Fraction(0)) for y in y_list]
+    y_list = [y if y.numerator >= 0 else Fraction(0) for y in y_list]
     return x_list, y_list
 
 
+def _fees(
+    schedule: "FeeScheduleState", balance: Balance, amounts: List[Fraction]
+) -> List[Fraction]:
+    """Returns `schedule.fee(balance, amount)` for all the amounts
+
+    The terms which do not depend on the amount are summed up once, the others
+    are added on a common denominator. `schedule` must have a penalty function.
+    """
+    assert schedule._penalty_func, "schedule must have a penalty function"
+    penalty_func = schedule._penalty_func
+    proportional = Fraction(schedule.proportional, int(1e6))
+    constant = schedule.flat - penalty_func(balance)
+
+    fees = []
+    for amount in amounts:
+        numerator, denominator = amount.numerator, amount.denominator
+        penalty_numerator, penalty_denominator = penalty_func._evaluate(
+            balance * denominator + numerator, denominator
+        )
+        # constant + proportional * abs(amount) + penalty
+        proportional_denominator = proportional.denominator * denominator
+        fees.append(
+            Fraction(
+                (
+                    constant.numerator * proportional_denominator
+                    + proportional.numerator * abs(numerator) * constant.denominator
+                )
+                * penalty_denominator
+                + penalty_numerator * constant.denominator * proportional_denominator,
+                constant.denominator * proportional_denominator * penalty_denominator,
+            )
+        )
+    return fees
+
+
+class CompiledFeeFunction:
+    """The part of a mediation fee function which does not depend on the
+    fixed amount
+
+    The fee function is the sum of the fees of the incoming and the outgoing
+    channel, where the amount of one of the channels is fixed and the other
+    one is represented by `x`. Only the fee of the fixed amount changes with
+    that amount, it is the same for all the points. The fees of the other
+    channel are computed here, `interpolate` adds the fee of the fixed amount.
+    """
+
+    def __init__(
+        self,
+        schedule_in: "FeeScheduleState",
+        schedule_out: "FeeScheduleState",
+        balance_in: Balance,
+        balance_out: Balance,
+        receivable: TokenAmount,
+        backwards: bool,
+    ) -> None:
+        # If either channel can't transfer even a single token, there can be no mediation.
+        if balance_out == 0 or receivable == 0:
+            raise UndefinedMediationFee()
+
+        # Add dummy penalty funcs if none are set
+        if not schedule_in._penalty_func:
+            schedule_in = copy(schedule_in)
+            schedule_in._penalty_func = Interpolate([0, balance_in + receivable], [0, 0])
+        if not schedule_out._penalty_func:
+            schedule_out = copy(schedule_out)
+            schedule_out._penalty_func = Interpolate([0, balance_out], [0, 0])
+
+        self.schedule_in = schedule_in
+        self.schedule_out = schedule_out
+        self.balance_in = balance_in
+        self.balance_out = balance_out
+        self.backwards = backwards
+
+        self.x_list = _collect_x_values(
+            penalty_func_in=schedule_in._penalty_func,
+            penalty_func_out=schedule_out._penalty_func,
+            balance_in=balance_in,
+            balance_out=balance_out,
+            max_x=receivable if backwards else balance_out,
+        )
+        try:
+            if backwards:
+                fees = _fees(schedule_in, balance_in, self.x_list)
+            else:
+                fees = _fees(schedule_out, balance_out, [-x for x in self.x_list])
+        except ValueError:
+            raise UndefinedMediationFee()
+        self.variable_fee_func = Interpolate(self.x_list, fees)
+
+    def interpolate(self, amount: PaymentWithFeeAmount, cap_fees: bool) -> Interpolate:
+        """Returns a function which calculates total_mediation_fee(x)
+
+        `amount` is the fixed amount, `amount_without_fees` for backwards
+        functions and `amount_with_fees` otherwise.
+        """
+        try:
+            if self.backwards:
+                fixed_fee = self.schedule_out.fee(self.balance_out, -Fraction(amount))
+            else:
+                fixed_fee = self.schedule_in.fee(self.balance_in, Fraction(amount))
+        except ValueError:
+            raise UndefinedMediationFee()
+
+        fee_func = self.variable_fee_func.shifted(fixed_fee)
+        # Capping only changes functions with negative fees
+        if cap_fees and any(y.numerator < 0 for y in fee_func.y_list):
+            return Interpolate(*_cap_fees(fee_func.x_list, fee_func.y_list))
+
+        return fee_func
+
+
 def _mediation_fee_func(
     schedule_in: "FeeScheduleState",
     schedule_out: "FeeScheduleState",
@@ -127,50 +299,120 @@ def _mediation_fee_func(
         amount_with_fees is None or amount_without_fees is None
     ), "Must be called with either amount_with_fees or amount_without_fees as None"
 
-    # If either channel can't transfer even a single token, there can be no mediation.
-    if balance_out == 0 or receivable == 0:
-        raise UndefinedMediationFee()
-
-    # Add dummy penalty funcs if none are set
-    if not schedule_in._penalty_func:
-        schedule_in = copy(schedule_in)
-        schedule_in._penalty_func = Interpolate([0, balance_in + receivable], [0, 0])
-    if not schedule_out._penalty_func:
-        schedule_out = copy(schedule_out)
-        schedule_out._penalty_func = Interpolate([0, balance_out], [0, 0])
-
-    x_list = _collect_x_values(
-        penalty_func_in=schedule_in._penalty_func,
-        penalty_func_out=schedule_out._penalty_func,
+    compiled = CompiledFeeFunction(
+        schedule_in=schedule_in,
+        schedule_out=schedule_out,
         balance_in=balance_in,
         balance_out=balance_out,
-        max_x=receivable if amount_with_fees is None else balance_out,
+        receivable=receivable,
+        backwards=amount_with_fees is None,
     )
+    if amount_with_fees is None:
+        assert amount_without_fees is not None, "amount_without_fees must be given"
+        return compiled.interpolate(amount_without_fees, cap_fees)
+    return compiled.interpolate(amount_with_fees, cap_fees)
 
-    # Sum up fees where either `amount_with_fees` or `amount_without_fees` is
-    # fixed and the other one is represented by `x`.
-    try:
-        y_list = [
-            schedule_in.fee(
-                balance_in, x if amount_with_fees is None else Fraction(amount_with_fees)
-            )
-            + schedule_out.fee(
-                balance_out, -x if amount_without_fees is None else -Fraction(amount_without_fees)
-            )
-            for x in x_list
-        ]
-    except ValueError:
-        raise UndefinedMediationFee()
 
-    if cap_fees:
-        x_list, y_list = _cap_fees(x_list, y_list)
+class FeeFunctionCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
 
-    return Interpolate(x_list, y_list)
+
+class FeeFunctionCache:
+    """Bounded cache of the compiled fee functions of channel pairs
+
+    A mediator forwards many transfers over the same channel pairs between two
+    balance changes. The fee functions are keyed by the channels, their
+    balances and their fee schedules, the least recently used one is evicted
+    when the cache is full.
+    """
+
+    def __init__(self, maxsize: int = FEE_FUNCTION_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._functions: "OrderedDict[Tuple[Any, ...], CompiledFeeFunction]" = OrderedDict()
+
+    def get(
+        self,
+        canonical_identifier_in: CanonicalIdentifier,
+        canonical_identifier_out: CanonicalIdentifier,
+        schedule_in: "FeeScheduleState",
+        schedule_out: "FeeScheduleState",
+        balance_in: Balance,
+        balance_out: Balance,
+        receivable: TokenAmount,
+        backwards: bool,
+    ) -> CompiledFeeFunction:
+        key = (
+            canonical_identifier_in,
+            canonical_identifier_out,
+            schedule_in.version(),
+            schedule_out.version(),
+            balance_in,
+            balance_out,
+            receivable,
+            backwards,
+        )
+        compiled = self._functions.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._functions.move_to_end(key)
+            return compiled
+
+        self.misses += 1
+        compiled = CompiledFeeFunction(
+            schedule_in=schedule_in,
+            schedule_out=schedule_out,
+            balance_in=balance_in,
+            balance_out=balance_out,
+            receivable=receivable,
+            backwards=backwards,
+        )
+        self._functions[key] = compiled
+        if len(self._functions) > self.maxsize:
+            self._functions.popitem(last=False)
+        return compiled
+
+    def invalidate(self, canonical_identifier: CanonicalIdentifier) -> None:
+        """Drops the fee functions of the channel"""
+        stale = [key for key in self._functions if canonical_identifier in key[:2]]
+        for key in stale:
+            del self._functions[key]
+
+    def clear(self) -> None:
+        self._functions.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self) -> FeeFunctionCacheInfo:
+        return FeeFunctionCacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            currsize=len(self._functions),
+        )
+
+
+fee_function_cache = FeeFunctionCache()
 
 
 T = TypeVar("T", bound="FeeScheduleState")
 
 
+@lru_cache(maxsize=1024)
+def _penalty_func(imbalance_penalty: Tuple[Tuple[TokenAmount, FeeAmount], ...]) -> Interpolate:
+    """The fee schedule is replaced on every balance change of the channel,
+    while the imbalance penalty only changes with the capacity. The
+    interpolators are not modified after their creation and are shared by the
+    schedules with the same penalty.
+    """
+    x_list, y_list = tuple(zip(*imbalance_penalty))
+    return Interpolate(x_list, y_list)
+
+
 @dataclass
 class FeeScheduleState(State):
     # pylint: disable=not-an-iterable
@@ -186,8 +428,14 @@ def __post_init__(self) -> None:
     def _update_penalty_func(self) -> None:
         if self.imbalance_penalty:
             typecheck(self.imbalance_penalty, list)
-            x_list, y_list = tuple(zip(*self.imbalance_penalty))
-            self._penalty_func = Interpolate(x_list, y_list)
+            self._penalty_func = _penalty_func(tuple((x, y) for x, y in self.imbalance_penalty))
+
+    def version(self) -> Tuple[Any, ...]:
+        """The values the fees are computed from"""
+        imbalance_penalty = (
+            tuple((x, y) for x, y in self.imbalance_penalty) if self.imbalance_penalty else None
+        )
+        return self.flat, self.proportional, imbalance_penalty
 
     def fee(self, balance: Balance, amount: Fraction) -> Fraction:
         return (
@@ -265,6 +513,16 @@ def calculate_imbalance_fees(
     The penalty term takes the following value at the extrema:
     channel_capacity * (proportional_imbalance_fee / 1_000_000)
     """
+    imbalance_fees = _calculate_imbalance_fees(channel_capacity, proportional_imbalance_fee)
+    if imbalance_fees is None:
+        return None
+    return list(imbalance_fees)
+
+
+@lru_cache(maxsize=1024)
+def _calculate_imbalance_fees(
+    channel_capacity: TokenAmount, proportional_imbalance_fee: ProportionalFeeAmount
+) -> Optional[Tuple[Tuple[TokenAmount, FeeAmount], ...]]:
     assert channel_capacity >= 0, "channel_capacity must be larger than zero"
     assert proportional_imbalance_fee >= 0, "prop. imbalance fee must be larger than zero"
 
@@ -295,4 +553,4 @@ def f(x: TokenAmount) -> FeeAmount:
     x_values = linspace(TokenAmount(0), channel_capacity, num_base_points)
     y_values = [f(x) for x in x_values]
 
-    return list(zip(x_values, y_values))
+    return tuple(zip(x_values, y_values))
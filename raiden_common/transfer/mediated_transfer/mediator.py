@@ -23,7 +23,7 @@
     SendLockedTransfer,
     SendSecretReveal,
 )
-from raiden_common.transfer.mediated_transfer.mediation_fee import FeeScheduleState, Interpolate
+from raiden_common.transfer.mediated_transfer.mediation_fee import Interpolate, fee_function_cache
 from raiden_common.transfer.mediated_transfer.state import (
     LockedTransferSignedState,
     LockedTransferUnsignedState,
@@ -56,6 +56,7 @@
     Dict,
     List,
     LockType,
+    Mapping,
     Optional,
     PaymentWithFeeAmount,
     Secret,
@@ -195,6 +196,34 @@ def get_pending_transfer_pairs(
     return pending_pairs
 
 
+def _is_distance_monotonic(
+    fee_func: Interpolate, line: Callable[[int], Fraction], line_start: Fraction
+) -> bool:
+    """Returns whether `fee_func(x) - line(x)` is monotonic
+
+    This is the case when the slope of `fee_func` is nowhere smaller or nowhere
+    larger than the slope of `line`. `line_start` is the value of `line(0)`.
+    """
+    last = len(fee_func.x_list) - 1
+    if last < 1:
+        return False
+
+    # The slope of the line, as a fraction which is not reduced
+    y1, y2 = line_start, line(last)
+    x1, x2 = fee_func.x_list[0], fee_func.x_list[last]
+    numerator = (y2.numerator * y1.denominator - y1.numerator * y2.denominator) * (
+        x1.denominator * x2.denominator
+    )
+    denominator = (x2.numerator * x1.denominator - x1.numerator * x2.denominator) * (
+        y1.denominator * y2.denominator
+    )
+    return all(
+        slope.numerator * denominator <= numerator * slope.denominator for slope in fee_func.slopes
+    ) or all(
+        slope.numerator * denominator >= numerator * slope.denominator for slope in fee_func.slopes
+    )
+
+
 def find_intersection(
     fee_func: Interpolate, line: Callable[[int], Fraction]
 ) -> Optional[Fraction]:
@@ -205,16 +234,41 @@ def find_intersection(
 
     Returns `None` if there is no intersection within `fee_func`s domain, which
     indicates a lack of capacity.
+
+    The first linear section where `fee_func` crosses `line` is searched with
+    an exponential search and a bisection when the distance between both
+    functions is monotonic, and by walking the sections otherwise.
     """
     i = 0
     y = fee_func.y_list[i]
-    compare = operator.lt if y < line(i) else operator.gt
-    while compare(y, line(i)):
-        i += 1
+    y_line = line(i)
+    compare = operator.lt if y < y_line else operator.gt
+    if compare(y, y_line):
+        if _is_distance_monotonic(fee_func, line, y_line):
+            # `compare` holds for all the indexes before the intersection.
+            # Small transfers intersect in the first sections, the search
+            # starts there.
+            low, high = 1, 1
+            while high < len(fee_func.x_list) and compare(fee_func.y_list[high], line(high)):
+                low, high = high + 1, high * 2
+            high = min(high, len(fee_func.x_list))
+            while low < high:
+                middle = (low + high) // 2
+                if compare(fee_func.y_list[middle], line(middle)):
+                    low = middle + 1
+                else:
+                    high = middle
+            i = low
+        else:
+            while compare(y, line(i)):
+                i += 1
+                if i == len(fee_func.x_list):
+                    break
+                y = fee_func.y_list[i]
+
         if i == len(fee_func.x_list):
             # Not enough capacity to send
             return None
-        y = fee_func.y_list[i]
 
     # We found the linear section where the solution is. Now interpolate!
     x1 = fee_func.x_list[i - 1]
@@ -242,15 +296,16 @@ def get_amount_without_fees(
         channel_in.fee_schedule.cap_fees == channel_out.fee_schedule.cap_fees
     ), "Both channels must have the same cap_fees setting for the same mediator."
     try:
-        fee_func = FeeScheduleState.mediation_fee_func(
+        fee_func = fee_function_cache.get(
+            canonical_identifier_in=channel_in.canonical_identifier,
+            canonical_identifier_out=channel_out.canonical_identifier,
             schedule_in=channel_in.fee_schedule,
             schedule_out=channel_out.fee_schedule,
             balance_in=balance_in,
             balance_out=balance_out,
             receivable=receivable,
-            amount_with_fees=amount_with_fees,
-            cap_fees=channel_in.fee_schedule.cap_fees,
-        )
+            backwards=False,
+        ).interpolate(amount_with_fees, cap_fees=channel_in.fee_schedule.cap_fees)
         amount_without_fees = find_intersection(
             fee_func, lambda i: amount_with_fees - fee_func.x_list[i]
         )
@@ -978,7 +1033,7 @@ def secret_learned(
 def mediate_transfer(
     state: MediatorTransferState,
     payer_channel: NettingChannelState,
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
     payer_transfer: LockedTransferSignedState,
     block_number: BlockNumber,
@@ -1043,7 +1098,7 @@ def mediate_transfer(
 def handle_init(
     state_change: ActionInitMediator,
     channelidentifiers_to_channels: Dict[ChannelID, NettingChannelState],
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
     block_number: BlockNumber,
 ) -> TransitionResult[Optional[MediatorTransferState]]:
@@ -1087,7 +1142,7 @@ def handle_block(
     mediator_state: MediatorTransferState,
     state_change: Block,
     channelidentifiers_to_channels: Dict[ChannelID, NettingChannelState],
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
 ) -> TransitionResult[MediatorTransferState]:
     """After Raiden learns about a new block this function must be called to
@@ -1161,7 +1216,7 @@ def handle_refundtransfer(
     mediator_state: MediatorTransferState,
     mediator_state_change: ReceiveTransferRefund,
     channelidentifiers_to_channels: Dict[ChannelID, NettingChannelState],
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
     block_number: BlockNumber,
 ) -> TransitionResult[MediatorTransferState]:
@@ -1402,7 +1457,7 @@ def state_transition(
     mediator_state: Optional[MediatorTransferState],
     state_change: StateChange,
     channelidentifiers_to_channels: Dict[ChannelID, NettingChannelState],
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     pseudo_random_generator: random.Random,
     block_number: BlockNumber,
     block_hash: BlockHash,
@@ -1,3 +1,5 @@
+import heapq
+
 from raiden_common.transfer import channel, token_network, views
 from raiden_common.transfer.architecture import (
     ContractReceiveStateChange,
@@ -40,7 +42,15 @@
     ReceiveTransferRefund,
 )
 from raiden_common.transfer.mediated_transfer.tasks import InitiatorTask, MediatorTask, TargetTask
-from raiden_common.transfer.state import ChainState, TokenNetworkRegistryState, TokenNetworkState
+from raiden_common.transfer.state import (
+    ChainState,
+    ChannelDeadlinesState,
+    MessageQueue,
+    NettingChannelState,
+    PendingTransactionsIndexState,
+    TokenNetworkRegistryState,
+    TokenNetworkState,
+)
 from raiden_common.transfer.state_change import (
     ActionChannelClose,
     ActionChannelCoopSettle,
@@ -76,12 +86,22 @@
     List,
     Optional,
     SecretHash,
+    Sequence,
     TokenNetworkAddress,
     TokenNetworkRegistryAddress,
+    Tuple,
     Union,
     typecheck,
 )
 
+# Transactions cleared by the contract state changes of their channel
+CHANNEL_TRANSACTIONS = (
+    ContractSendChannelClose,
+    ContractSendChannelSettle,
+    ContractSendChannelUpdateTransfer,
+    ContractSendChannelWithdraw,
+)
+
 # All State changes that are subdispatched as token network actions
 TokenNetworkStateChange = Union[
     ActionChannelClose,
@@ -94,6 +114,27 @@
     ContractReceiveChannelWithdraw,
 ]
 
+# State changes which don't change the block deadline of any channel. The
+# payment tasks only change the locks and the balance proofs of the channels.
+STATE_CHANGES_WITHOUT_CHANNEL_DEADLINES = (
+    ActionInitInitiator,
+    ActionInitMediator,
+    ActionInitTarget,
+    ActionTransferReroute,
+    ContractReceiveSecretReveal,
+    ReceiveDelivered,
+    ReceiveLockExpired,
+    ReceiveProcessed,
+    ReceiveSecretRequest,
+    ReceiveSecretReveal,
+    ReceiveTransferCancelRoute,
+    ReceiveTransferRefund,
+    ReceiveUnlock,
+    UpdateServicesAddressesStateChange,
+)
+
+ChannelKey = Tuple[TokenNetworkAddress, ChannelID]
+
 
 def get_token_network_by_address(
     chain_state: ChainState, token_network_address: TokenNetworkAddress
@@ -136,6 +177,119 @@ def subdispatch_to_all_channels(
     return TransitionResult(chain_state, events)
 
 
+def _get_channel(chain_state: ChainState, key: ChannelKey) -> Optional[NettingChannelState]:
+    token_network_address, channel_identifier = key
+    token_network_state = get_token_network_by_address(chain_state, token_network_address)
+    if token_network_state is None:
+        return None
+    return token_network_state.channelidentifiers_to_channels.get(channel_identifier)
+
+
+def _update_channel_deadline(
+    chain_state: ChainState, channel_deadlines: ChannelDeadlinesState, key: ChannelKey
+) -> None:
+    channel_state = _get_channel(chain_state, key)
+    deadline = channel.get_block_deadline(channel_state) if channel_state else None
+
+    if deadline is None:
+        channel_deadlines.deadlines.pop(key, None)
+    elif channel_deadlines.deadlines.get(key) != deadline:
+        channel_deadlines.deadlines[key] = deadline
+        heapq.heappush(channel_deadlines.heap, (deadline, key[0], key[1]))
+
+
+def get_channel_deadlines(chain_state: ChainState) -> ChannelDeadlinesState:
+    """Return the block deadlines of the channels, building the index if
+    it is missing.
+    """
+    if chain_state.channel_deadlines is None:
+        # Only the keys are iterated, the channels are read by the first
+        # `Block`, this does not copy the channels of a copy-on-write clone.
+        chain_state.channel_deadlines = ChannelDeadlinesState(
+            dirty={
+                (token_network_state.address, channel_identifier)
+                for token_network_registry in (
+                    chain_state.identifiers_to_tokennetworkregistries.values()
+                )
+                for token_network_state in token_network_registry.token_network_list
+                for channel_identifier in token_network_state.channelidentifiers_to_channels
+            }
+        )
+
+    return chain_state.channel_deadlines
+
+
+def update_channel_deadlines(chain_state: ChainState, state_change: StateChange) -> None:
+    """Mark the channels changed by `state_change`, their deadlines are
+    recomputed before the next `Block` is dispatched.
+    """
+    channel_deadlines = chain_state.channel_deadlines
+    if channel_deadlines is None or isinstance(
+        state_change, (Block, *STATE_CHANGES_WITHOUT_CHANNEL_DEADLINES)
+    ):
+        return
+
+    canonical_identifier: Optional[CanonicalIdentifier]
+    if isinstance(state_change, ContractReceiveChannelNew):
+        canonical_identifier = state_change.channel_state.canonical_identifier
+    else:
+        canonical_identifier = getattr(state_change, "canonical_identifier", None)
+
+    if canonical_identifier is not None:
+        channel_deadlines.dirty.add(
+            (canonical_identifier.token_network_address, canonical_identifier.channel_identifier)
+        )
+    else:
+        # The changed channels are not known, rebuild the index
+        chain_state.channel_deadlines = None
+
+
+def subdispatch_to_due_channels(
+    chain_state: ChainState,
+    state_change: Block,
+    block_number: BlockNumber,
+    block_hash: BlockHash,
+) -> TransitionResult[ChainState]:
+    """Dispatch `state_change` to the channels with a block deadline up to
+    `block_number`. `Block` has no effect on the other channels, so the work
+    done per block depends on the number of due channels only.
+    """
+    channel_deadlines = get_channel_deadlines(chain_state)
+
+    for key in channel_deadlines.dirty:
+        _update_channel_deadline(chain_state, channel_deadlines, key)
+    channel_deadlines.dirty.clear()
+
+    due_channels: List[ChannelKey] = []
+    heap = channel_deadlines.heap
+    while heap and heap[0][0] <= block_number:
+        deadline, token_network_address, channel_identifier = heapq.heappop(heap)
+        key = (token_network_address, channel_identifier)
+
+        # Skip the entries of channels with a newer deadline
+        if channel_deadlines.deadlines.get(key) == deadline:
+            del channel_deadlines.deadlines[key]
+            due_channels.append(key)
+
+    events = []
+    for key in due_channels:
+        channel_state = _get_channel(chain_state, key)
+        if channel_state is None:
+            continue
+
+        result = channel.state_transition(
+            channel_state=channel_state,
+            state_change=state_change,
+            block_number=block_number,
+            block_hash=block_hash,
+            pseudo_random_generator=chain_state.pseudo_random_generator,
+        )
+        events.extend(result.events)
+        _update_channel_deadline(chain_state, channel_deadlines, key)
+
+    return TransitionResult(chain_state, events)
+
+
 def subdispatch_by_canonical_id(
     chain_state: ChainState, state_change: StateChange, canonical_identifier: CanonicalIdentifier
 ) -> TransitionResult[ChainState]:
@@ -441,6 +595,9 @@ def inplace_delete_message_queue(
             chain_state.queueids_to_queues.pop(queueid)
         return
 
+    if not isinstance(queue, MessageQueue):
+        queue = MessageQueue(queue)
+
     inplace_delete_message(message_queue=queue, state_change=state_change)
 
     if len(queue) == 0:
@@ -454,7 +611,13 @@ def inplace_delete_message(
     state_change: Union[ReceiveDelivered, ReceiveProcessed, ReceiveWithdrawConfirmation],
 ) -> None:
     """Check if the message exists in queue with ID `queueid` and exclude if found."""
-    for message in list(message_queue):
+    candidates: Sequence[SendMessageEvent]
+    if isinstance(message_queue, MessageQueue):
+        candidates = message_queue.get_messages(state_change.message_identifier)
+    else:
+        candidates = list(message_queue)
+
+    for message in candidates:
         # A withdraw request is only confirmed by a withdraw confirmation.
         # This is done because Processed is not an indicator that the partner has
         # processed and **accepted** our withdraw request. Receiving
@@ -474,13 +637,38 @@ def inplace_delete_message(
             message_queue.remove(message)
 
 
+def get_queues_to_clean(
+    chain_state: ChainState, state_change: Union[ReceiveProcessed, ReceiveWithdrawConfirmation]
+) -> List[QueueIdentifier]:
+    """Return the queues which may hold the message acknowledged by
+    `state_change`, or which are empty.
+
+    The queues are only read through the index of their message identifiers.
+    `dict.get` is used because the queues of a copy-on-write clone would
+    otherwise be copied just to be looked at.
+    """
+    queueids_to_queues = chain_state.queueids_to_queues
+    queueids = []
+    for queueid in queueids_to_queues:
+        queue = dict.get(queueids_to_queues, queueid)
+        may_hold_message = (
+            not isinstance(queue, MessageQueue)
+            or not queue
+            or state_change.message_identifier in queue.message_identifiers
+        )
+        if may_hold_message:
+            queueids.append(queueid)
+
+    return queueids
+
+
 def handle_block(chain_state: ChainState, state_change: Block) -> TransitionResult[ChainState]:
     block_number = state_change.block_number
     chain_state.block_number = block_number
     chain_state.block_hash = state_change.block_hash
 
     # Subdispatch Block state change
-    channels_result = subdispatch_to_all_channels(
+    channels_result = subdispatch_to_due_channels(
         chain_state=chain_state,
         state_change=state_change,
         block_number=block_number,
@@ -652,7 +840,7 @@ def handle_receive_withdraw_confirmation(
         canonical_identifier=state_change.canonical_identifier,
     )
     # Clean up any pending SendWithdrawRequest messages
-    for queueid in list(chain_state.queueids_to_queues.keys()):
+    for queueid in get_queues_to_clean(chain_state, state_change):
         inplace_delete_message_queue(chain_state, state_change, queueid)
 
     return iteration
@@ -702,7 +890,7 @@ def handle_receive_processed(
 ) -> TransitionResult[ChainState]:
     events: List[Event] = []
     # Clean up message queue
-    for queueid in list(chain_state.queueids_to_queues.keys()):
+    for queueid in get_queues_to_clean(chain_state, state_change):
         inplace_delete_message_queue(chain_state, state_change, queueid)
 
     return TransitionResult(chain_state, events)
@@ -775,6 +963,7 @@ def handle_state_change(
     if t_state_change in state_change_map:
         func, args = state_change_map[t_state_change]
         iteration = func(chain_state, state_change, *args)
+        update_channel_deadlines(chain_state, state_change)
     else:
         iteration = TransitionResult(chain_state, [])
 
@@ -1015,25 +1204,142 @@ def is_transaction_pending(
     )
 
 
+def _index_pending_transaction(
+    index: PendingTransactionsIndexState, transaction: ContractSendEvent
+) -> None:
+    if id(transaction) in index.members:
+        return
+    index.members.add(id(transaction))
+
+    if isinstance(transaction, ContractSendChannelBatchUnlock):
+        index.batch_unlocks.append(transaction)
+    elif isinstance(transaction, ContractSendSecretReveal):
+        index.by_secret.setdefault(transaction.secret, []).append(transaction)
+    elif isinstance(transaction, CHANNEL_TRANSACTIONS):
+        key = (transaction.token_network_address, transaction.channel_identifier)
+        index.by_channel.setdefault(key, []).append(transaction)
+
+    if isinstance(transaction, (ContractSendChannelUpdateTransfer, ContractSendSecretReveal)):
+        index.sequence += 1
+        heapq.heappush(index.expirations, (transaction.expiration, index.sequence, transaction))
+
+
+def _remove_transaction(
+    transactions: List[ContractSendEvent], transaction: ContractSendEvent
+) -> None:
+    for position, indexed_transaction in enumerate(transactions):
+        if indexed_transaction is transaction:
+            del transactions[position]
+            return
+
+
+def _unindex_pending_transaction(
+    index: PendingTransactionsIndexState, transaction: ContractSendEvent
+) -> None:
+    index.members.discard(id(transaction))
+
+    bucket: Optional[Dict[Any, List[ContractSendEvent]]] = None
+    key: Any = None
+    if isinstance(transaction, ContractSendChannelBatchUnlock):
+        _remove_transaction(index.batch_unlocks, transaction)
+    elif isinstance(transaction, ContractSendSecretReveal):
+        bucket, key = index.by_secret, transaction.secret
+    elif isinstance(transaction, CHANNEL_TRANSACTIONS):
+        bucket = index.by_channel
+        key = (transaction.token_network_address, transaction.channel_identifier)
+
+    if bucket is not None and key in bucket:
+        _remove_transaction(bucket[key], transaction)
+        if not bucket[key]:
+            del bucket[key]
+
+    # The entries of `expirations` are skipped once they are not members
+
+
+def get_pending_transactions_index(chain_state: ChainState) -> PendingTransactionsIndexState:
+    """Return the index of the pending transactions, building it if it is
+    missing or if `chain_state.pending_transactions` was replaced.
+    """
+    index = chain_state.pending_transactions_index
+    if index is None or index.transactions is not chain_state.pending_transactions:
+        index = PendingTransactionsIndexState(transactions=chain_state.pending_transactions)
+        for transaction in index.transactions:
+            _index_pending_transaction(index, transaction)
+        chain_state.pending_transactions_index = index
+
+    return index
+
+
+def get_affected_transactions(
+    chain_state: ChainState,
+    index: PendingTransactionsIndexState,
+    state_change: ContractReceiveStateChange,
+) -> List[ContractSendEvent]:
+    """Return the pending transactions which `state_change` can satisfy,
+    invalidate or which expired.
+
+    This must select every transaction for which one of the predicates
+    `is_transaction_effect_satisfied`, `is_transaction_invalidated` and
+    `is_transaction_expired` can be true. The expired transactions are taken
+    out of `index.expirations`, so they must be removed by the caller.
+    """
+    candidates: List[ContractSendEvent] = []
+    if isinstance(
+        state_change,
+        (
+            ContractReceiveChannelClosed,
+            ContractReceiveChannelSettled,
+            ContractReceiveUpdateTransfer,
+        ),
+    ):
+        key = (state_change.token_network_address, state_change.channel_identifier)
+        candidates.extend(index.by_channel.get(key, []))
+    elif isinstance(state_change, ContractReceiveSecretReveal):
+        candidates.extend(index.by_secret.get(state_change.secret, []))
+    elif isinstance(state_change, ContractReceiveChannelBatchUnlock):
+        candidates.extend(index.batch_unlocks)
+
+    expirations = index.expirations
+    while expirations and expirations[0][0] < chain_state.block_number:
+        _, _, transaction = heapq.heappop(expirations)
+        if id(transaction) in index.members:
+            candidates.append(transaction)
+
+    return candidates
+
+
 def update_queues(iteration: TransitionResult[ChainState], state_change: StateChange) -> None:
     chain_state = iteration.new_state
     assert chain_state is not None, "chain_state must be set"
 
     if isinstance(state_change, ContractReceiveStateChange):
-        pending_transactions = [
-            transaction
-            for transaction in chain_state.pending_transactions
-            if is_transaction_pending(chain_state, transaction, state_change)
-        ]
-        chain_state.pending_transactions = pending_transactions
+        index = get_pending_transactions_index(chain_state)
+        done_transactions = {
+            id(transaction): transaction
+            for transaction in get_affected_transactions(chain_state, index, state_change)
+            if not is_transaction_pending(chain_state, transaction, state_change)
+        }
+        if done_transactions:
+            for transaction in done_transactions.values():
+                _unindex_pending_transaction(index, transaction)
+            # Filtered in place, the index belongs to this list
+            chain_state.pending_transactions[:] = [
+                transaction
+                for transaction in chain_state.pending_transactions
+                if id(transaction) not in done_transactions
+            ]
 
     for event in iteration.events:
         if isinstance(event, SendMessageEvent):
-            queue = chain_state.queueids_to_queues.setdefault(event.queue_identifier, [])
+            queue = chain_state.queueids_to_queues.setdefault(
+                event.queue_identifier, MessageQueue()
+            )
             queue.append(event)
 
         if isinstance(event, ContractSendEvent):
+            index = get_pending_transactions_index(chain_state)
             chain_state.pending_transactions.append(event)
+            _index_pending_transaction(index, event)
 
 
 def state_transition(
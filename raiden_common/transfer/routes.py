@@ -1,10 +1,11 @@
-from typing import Dict, Tuple
+from typing import Tuple
 
 from raiden_common.transfer.state import NettingChannelState, NetworkState, RouteState
 from raiden_common.utils.typing import (
     Address,
     ChannelID,
     List,
+    Mapping,
     NodeNetworkStateMap,
     TokenNetworkAddress,
 )
@@ -36,7 +37,7 @@ def filter_reachable_routes(
 def filter_acceptable_routes(
     route_states: List[RouteState],
     blacklisted_channel_ids: List[ChannelID],
-    addresses_to_channel: Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState],
+    addresses_to_channel: Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState],
     token_network_address: TokenNetworkAddress,
     our_address: Address,
 ) -> List[RouteState]:
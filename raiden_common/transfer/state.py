@@ -40,14 +40,18 @@
     Dict,
     EncodedData,
     FeeAmount,
+    Iterable,
+    Iterator,
     List,
     Locksroot,
+    Mapping,
     MessageID,
     Nonce,
     Optional,
     PaymentWithFeeAmount,
     Secret,
     SecretHash,
+    Set,
     Signature,
     T_Address,
     T_BlockHash,
@@ -216,6 +220,161 @@ def __post_init__(self) -> None:
         self.encoded = self.lock.encoded
 
 
+class LocksDict(Dict[SecretHash, Any]):
+    """Dictionary of locks which keeps the sum of their amounts.
+
+    The sum is updated when a lock is added or removed, so that the locked
+    amount of a channel end does not depend on the number of pending locks.
+    The locks must not be modified while they are in the dictionary.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.total_amount: int = sum(lock.amount for lock in self.values())
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return self.__class__, (dict(self),)
+
+    def __setitem__(self, key: SecretHash, value: Any) -> None:
+        if key in self:
+            self.total_amount -= super().__getitem__(key).amount
+        super().__setitem__(key, value)
+        self.total_amount += value.amount
+
+    def __delitem__(self, key: SecretHash) -> None:
+        lock = super().__getitem__(key)
+        super().__delitem__(key)
+        self.total_amount -= lock.amount
+
+    def pop(self, key: SecretHash, *default: Any) -> Any:
+        if key in self:
+            lock = super().pop(key)
+            self.total_amount -= lock.amount
+            return lock
+        return super().pop(key, *default)
+
+    def popitem(self) -> Tuple[SecretHash, Any]:
+        key, lock = super().popitem()
+        self.total_amount -= lock.amount
+        return key, lock
+
+    def setdefault(self, key: SecretHash, default: Any) -> Any:  # type: ignore
+        if key not in self:
+            self[key] = default
+        return super().__getitem__(key)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, lock in dict(*args, **kwargs).items():
+            self[key] = lock
+
+    def __ior__(self, other: Any) -> "LocksDict":  # type: ignore
+        self.update(other)
+        return self
+
+    def clear(self) -> None:
+        super().clear()
+        self.total_amount = 0
+
+    def copy(self) -> "LocksDict":
+        return self.__class__(self)
+
+
+class MessageQueue(List[SendMessageEvent]):
+    """Queue of messages waiting for an acknowledgement, in send order.
+
+    The messages are indexed by their message identifier, so that checking
+    for and finding an acknowledged message does not depend on the length of
+    the queue. The messages must not be modified while they are in the queue.
+    """
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self._reindex()
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return self.__class__, (list(self),)
+
+    def _reindex(self) -> None:
+        self.message_identifiers: Dict[MessageID, Tuple[SendMessageEvent, ...]] = {}
+        for message in self:
+            self._add(message)
+
+    def _add(self, message: SendMessageEvent) -> None:
+        message_identifier = message.message_identifier
+        messages = self.message_identifiers.get(message_identifier, ())
+        self.message_identifiers[message_identifier] = messages + (message,)
+
+    def _discard(self, message: SendMessageEvent) -> None:
+        message_identifier = message.message_identifier
+        messages = self.message_identifiers[message_identifier]
+        position = next(pos for pos, indexed in enumerate(messages) if indexed is message)
+        messages = messages[:position] + messages[position + 1 :]
+        if messages:
+            self.message_identifiers[message_identifier] = messages
+        else:
+            del self.message_identifiers[message_identifier]
+
+    def get_messages(self, message_identifier: MessageID) -> Tuple[SendMessageEvent, ...]:
+        """Return the messages with `message_identifier`, in send order."""
+        return self.message_identifiers.get(message_identifier, ())
+
+    def append(self, message: SendMessageEvent) -> None:
+        super().append(message)
+        self._add(message)
+
+    def extend(self, messages: Iterable[SendMessageEvent]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def __iadd__(self, messages: Iterable[SendMessageEvent]) -> "MessageQueue":  # type: ignore
+        self.extend(messages)
+        return self
+
+    def __imul__(self, count: int) -> "MessageQueue":  # type: ignore
+        super().__imul__(count)
+        self._reindex()
+        return self
+
+    def insert(self, index: int, message: SendMessageEvent) -> None:  # type: ignore
+        super().insert(index, message)
+        self._add(message)
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        super().__setitem__(index, value)
+        self._reindex()
+
+    def __delitem__(self, index: Any) -> None:
+        if isinstance(index, slice):
+            super().__delitem__(index)
+            self._reindex()
+        else:
+            message = self[index]
+            super().__delitem__(index)
+            self._discard(message)
+
+    def remove(self, message: SendMessageEvent) -> None:
+        del self[self.index(message)]
+
+    def pop(self, index: int = -1) -> SendMessageEvent:  # type: ignore
+        message = super().pop(index)
+        self._discard(message)
+        return message
+
+    def clear(self) -> None:
+        super().clear()
+        self.message_identifiers = {}
+
+    def copy(self) -> "MessageQueue":
+        queue = self.__class__()
+        list.extend(queue, self)
+        # The tuples of the index are never modified in place
+        queue.message_identifiers = dict(self.message_identifiers)
+        return queue
+
+    def __copy__(self) -> "MessageQueue":
+        return self.copy()
+
+
 @dataclass
 class TransactionExecutionStatus(State):
     """Represents the status of a transaction."""
@@ -270,7 +429,20 @@ def __post_init__(self) -> None:
 
 @dataclass
 class PendingLocksState(State):
+    """The encoded pending locks of a channel end, in the order used to
+    compute the locksroot.
+
+    `locks` must not be modified in place, `channel.compute_locks_with` and
+    `channel.compute_locks_without` return a new instance.
+    """
+
     locks: List[EncodedData]
+    #: Cached result of `channel.compute_locksroot`
+    locksroot: Optional[Locksroot] = field(init=False, repr=False, compare=False, default=None)
+    #: Set of `locks` for membership tests, built on first use
+    lock_set: Optional[Set[EncodedData]] = field(
+        init=False, repr=False, compare=False, default=None
+    )
 
 
 def make_empty_pending_locks_state() -> PendingLocksState:
@@ -363,6 +535,12 @@ def __post_init__(self) -> None:
         if self.contract_balance < 0:
             raise ValueError("contract_balance cannot be negative.")
 
+        self.secrethashes_to_lockedlocks = LocksDict(self.secrethashes_to_lockedlocks)
+        self.secrethashes_to_unlockedlocks = LocksDict(self.secrethashes_to_unlockedlocks)
+        self.secrethashes_to_onchain_unlockedlocks = LocksDict(
+            self.secrethashes_to_onchain_unlockedlocks
+        )
+
     @property
     def offchain_total_withdraw(self) -> WithdrawAmount:
         return max(self.withdraws_pending, default=WithdrawAmount(0))
@@ -543,6 +721,118 @@ def add_token_network(self, token_network: TokenNetworkState) -> None:
         ] = token_network.address
 
 
+class AddressesToChannel(Mapping[Tuple[TokenNetworkAddress, Address], NettingChannelState]):
+    """Read-only mapping from the token network and partner addresses to the
+    channel, see `ChainState.addresses_to_channel`.
+
+    Lookups use the `partneraddresses_to_channelidentifiers` of the token
+    networks, which is updated together with the channels and serialized with
+    them, instead of iterating over all the channels. If there are multiple
+    channels with a partner the newest one is used.
+    """
+
+    def __init__(self, chain_state: "ChainState") -> None:
+        self.chain_state = chain_state
+
+    def _get_token_network(
+        self, token_network_address: TokenNetworkAddress
+    ) -> Optional[TokenNetworkState]:
+        registries = self.chain_state.identifiers_to_tokennetworkregistries
+        for token_network_registry in registries.values():
+            token_network = token_network_registry.tokennetworkaddresses_to_tokennetworks.get(
+                token_network_address
+            )
+            if token_network is not None:
+                return token_network
+        return None
+
+    @staticmethod
+    def _get_channel_identifier(
+        token_network: TokenNetworkState, partner_address: Address
+    ) -> Optional[ChannelID]:
+        channel_identifiers = token_network.partneraddresses_to_channelidentifiers.get(
+            partner_address, []
+        )
+        for channel_identifier in reversed(channel_identifiers):
+            if channel_identifier in token_network.channelidentifiers_to_channels:
+                return channel_identifier
+        return None
+
+    def __getitem__(self, key: Tuple[TokenNetworkAddress, Address]) -> NettingChannelState:
+        token_network_address, partner_address = key
+        token_network = self._get_token_network(token_network_address)
+        if token_network is not None:
+            channel_identifier = self._get_channel_identifier(token_network, partner_address)
+            if channel_identifier is not None:
+                return token_network.channelidentifiers_to_channels[channel_identifier]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[Tuple[TokenNetworkAddress, Address]]:
+        registries = self.chain_state.identifiers_to_tokennetworkregistries
+        for token_network_registry in registries.values():
+            for token_network in token_network_registry.token_network_list:
+                for partner_address in list(token_network.partneraddresses_to_channelidentifiers):
+                    if self._get_channel_identifier(token_network, partner_address) is not None:
+                        yield token_network.address, partner_address
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+@dataclass
+class ChannelDeadlinesState:
+    """Index of the block numbers at which the channels have to handle a
+    `Block` state change, see `channel.get_block_deadline`.
+
+    `heap` may contain outdated entries, an entry is only valid if it matches
+    `deadlines`. The deadlines of the channels in `dirty` must be recomputed
+    before the next `Block` is dispatched.
+
+    This is derived data, it is not serialized and is rebuilt from the
+    channels when missing.
+    """
+
+    deadlines: Dict[Tuple[TokenNetworkAddress, ChannelID], BlockNumber] = field(
+        default_factory=dict
+    )
+    heap: List[Tuple[BlockNumber, TokenNetworkAddress, ChannelID]] = field(default_factory=list)
+    dirty: Set[Tuple[TokenNetworkAddress, ChannelID]] = field(default_factory=set)
+
+
+@dataclass
+class PendingTransactionsIndexState:
+    """Index of `ChainState.pending_transactions` by the keys of the contract
+    state changes which can clear them, see `node.update_queues`.
+
+    `expirations` is a heap of the expirable transactions, it may contain
+    transactions which are not pending anymore, only the ones in `members`
+    are valid. The index belongs to the list `transactions` and is rebuilt
+    when `ChainState.pending_transactions` is replaced.
+
+    `members` holds the `id` of the indexed transactions, which are the
+    transactions of the list. The ids are not kept by a copy of the index, so
+    they are recomputed from the copied list when the index is unpickled.
+
+    This is derived data, it is not serialized and is rebuilt from the
+    pending transactions when missing.
+    """
+
+    transactions: List[ContractSendEvent]
+    members: Set[int] = field(default_factory=set)
+    by_channel: Dict[Tuple[TokenNetworkAddress, ChannelID], List[ContractSendEvent]] = field(
+        default_factory=dict
+    )
+    by_secret: Dict[Secret, List[ContractSendEvent]] = field(default_factory=dict)
+    batch_unlocks: List[ContractSendEvent] = field(default_factory=list)
+    expirations: List[Tuple[BlockExpiration, int, ContractSendEvent]] = field(default_factory=list)
+    #: Tie-breaker of the entries of `expirations` with the same expiration
+    sequence: int = 0
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.members = {id(transaction) for transaction in self.transactions}
+
+
 @dataclass(repr=False)
 class ChainState(State):
     """Umbrella object that stores the per blockchain state.
@@ -566,12 +856,28 @@ class ChainState(State):
     tokennetworkaddresses_to_tokennetworkregistryaddresses: Dict[
         TokenNetworkAddress, TokenNetworkRegistryAddress
     ] = field(repr=False, default_factory=dict)
+    channel_deadlines: Optional[ChannelDeadlinesState] = field(
+        repr=False,
+        compare=False,
+        default=None,
+        metadata={"marshmallow_field": marshmallow.fields.Raw(load_only=True)},
+    )
+    pending_transactions_index: Optional[PendingTransactionsIndexState] = field(
+        repr=False,
+        compare=False,
+        default=None,
+        metadata={"marshmallow_field": marshmallow.fields.Raw(load_only=True)},
+    )
 
     def __post_init__(self) -> None:
         typecheck(self.block_number, T_BlockNumber)
         typecheck(self.block_hash, T_BlockHash)
         typecheck(self.chain_id, T_ChainID)
 
+        for queueid, queue in self.queueids_to_queues.items():
+            if not isinstance(queue, MessageQueue):
+                self.queueids_to_queues[queueid] = MessageQueue(queue)
+
     def __repr__(self) -> str:
         return (
             "ChainState(block_number={} block_hash={} networks={} qty_transfers={} chain_id={})"
@@ -586,16 +892,9 @@ def __repr__(self) -> str:
         )
 
     @property
-    def addresses_to_channel(
-        self,
-    ) -> Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState]:
+    def addresses_to_channel(self) -> AddressesToChannel:
         """Find the channel for a partner by his address and token network"""
-        return {
-            (token_network.address, channel.partner_state.address): channel
-            for token_network_registry in self.identifiers_to_tokennetworkregistries.values()
-            for token_network in token_network_registry.token_network_list
-            for channel in token_network.channelidentifiers_to_channels.values()
-        }
+        return AddressesToChannel(self)
 
 
 def get_address_metadata(
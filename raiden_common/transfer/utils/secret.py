@@ -1,15 +1,13 @@
 import json
-from copy import deepcopy
 from dataclasses import dataclass
 from json import JSONDecodeError
 
 from ecies import decrypt, encrypt
 from eth_utils import decode_hex
 from marshmallow import ValidationError
-from marshmallow_dataclass import class_schema
 
 from raiden_common.exceptions import InvalidSecret, SerializationError
-from raiden_common.storage.serialization.schemas import BaseSchema
+from raiden_common.storage.serialization.schemas import schema_for
 from raiden_common.storage.serialization.serializer import SerializationBase
 from raiden_common.utils.signer import get_public_key
 from raiden_common.utils.typing import (
@@ -43,8 +41,7 @@ def serialize(obj: _DecryptedSecret) -> bytes:
         if not isinstance(obj, _DecryptedSecret):
             raise SerializationError(f"Can only serialize {_DecryptedSecret.__name__} objects")
         try:
-            schema = class_schema(_DecryptedSecret, base_schema=BaseSchema)()
-            data = schema.dump(obj)
+            data = schema_for(_DecryptedSecret).dump(obj)
             data = json.dumps(data).encode()
             return data
         except (AttributeError, TypeError, ValidationError, ValueError, JSONDecodeError) as ex:
@@ -54,8 +51,7 @@ def serialize(obj: _DecryptedSecret) -> bytes:
     def deserialize(data: bytes) -> _DecryptedSecret:
         try:
             obj = json.loads(data.decode())
-            schema = class_schema(_DecryptedSecret, base_schema=BaseSchema)()
-            return schema.load(deepcopy(obj))
+            return schema_for(_DecryptedSecret).load(obj)
         except (ValueError, TypeError, ValidationError, JSONDecodeError) as ex:
             raise SerializationError(f"Can't deserialize: {data!r}") from ex
 
@@ -1,7 +1,9 @@
 import pickle
-from typing import TypeVar
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple, TypeVar
 
 T = TypeVar("T")
+K = TypeVar("K")
+V = TypeVar("V")
 
 
 def deepcopy(data: T) -> T:
@@ -11,3 +13,114 @@ def deepcopy(data: T) -> T:
     deserialize a new copy of the objects.
     """
     return pickle.loads(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+
+class CopyOnAccessDict(Dict[K, V]):
+    """A dictionary which shares its values with another dictionary until
+    they are used.
+
+    The values of the source dictionary must be treated as immutable. Python
+    can not detect in-place modifications of a value, so every access which
+    hands out a value (indexing, `get`, `values`, `items`, ...) replaces the
+    shared value with a private copy first. Values which are never accessed
+    are never copied.
+
+    `memo` maps the `id` of a shared value to its copy, it must be shared by
+    all the dictionaries of a clone, otherwise an object reachable from two
+    places would be copied twice.
+    """
+
+    def __init__(
+        self,
+        source: Dict[K, V],
+        copy_function: Callable[[V], V],
+        memo: Optional[Dict[int, Any]] = None,
+    ) -> None:
+        super().__init__(source)
+        self._shared: Set[K] = set(source.keys())
+        self._copy_function = copy_function
+        self._memo: Dict[int, Any] = memo if memo is not None else {}
+
+    def _own(self, key: K) -> None:
+        if key in self._shared:
+            self._shared.discard(key)
+            value = dict.__getitem__(self, key)
+            copy = self._memo.get(id(value))
+            if copy is None:
+                copy = self._copy_function(value)
+                self._memo[id(value)] = copy
+            dict.__setitem__(self, key, copy)
+
+    def _own_all(self) -> None:
+        for key in list(self._shared):
+            self._own(key)
+
+    def __getitem__(self, key: K) -> V:
+        self._own(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self._shared.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key: K) -> None:
+        self._shared.discard(key)
+        dict.__delitem__(self, key)
+
+    def __iter__(self) -> Iterator[K]:
+        # Overwriting `__iter__` disables CPython's fast path for `dict(self)`
+        # and `{**self}`, which would otherwise leak the shared values.
+        return dict.__iter__(self)
+
+    def get(self, key: K, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key: K, default: V) -> V:  # type: ignore
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key: K, *args: Any) -> Any:
+        self._own(key)
+        self._shared.discard(key)
+        return dict.pop(self, key, *args)
+
+    def popitem(self) -> Tuple[K, V]:
+        key = next(reversed(self.keys()))
+        return key, self.pop(key)
+
+    def values(self) -> Any:
+        self._own_all()
+        return dict.values(self)
+
+    def items(self) -> Any:
+        self._own_all()
+        return dict.items(self)
+
+    def copy(self) -> Dict[K, V]:
+        self._own_all()
+        return dict.copy(self)
+
+    def clear(self) -> None:
+        self._shared.clear()
+        super().clear()
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __reduce_ex__(self, protocol: Any) -> Any:
+        return (dict, (self.copy(),))
+
+    def to_dict(self) -> Dict[K, V]:
+        """Return a plain dictionary with the current values, shared values
+        are *not* copied.
+
+        This must only be used once no other code will modify the values
+        through this object, e.g. after a state transition has finished.
+        """
+        # `dict.copy` goes through `__getitem__` for subclasses
+        return dict(zip(dict.keys(self), dict.values(self)))
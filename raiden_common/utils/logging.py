@@ -1,6 +1,36 @@
 from copy import deepcopy
 
-from raiden_common.utils.typing import Dict
+from raiden_common.utils.typing import Any, Callable, Dict, Iterable, List
+
+_UNRESOLVED = object()
+
+
+class LazyField:
+    """Value of a log field which is computed when the record is rendered.
+
+    Expensive fields, e.g. serialized state changes, are wrapped with this,
+    so that nothing is computed for the records which are filtered out. The
+    value is computed by `log_config.resolve_lazy_fields` and cached for the
+    other handlers of the record. The arguments must not be modified until
+    the logging call returns.
+    """
+
+    __slots__ = ("_function", "_args", "_value")
+
+    def __init__(self, function: Callable[..., Any], *args: Any) -> None:
+        self._function = function
+        self._args = args
+        self._value: Any = _UNRESOLVED
+
+    def resolve(self) -> Any:
+        if self._value is _UNRESOLVED:
+            self._value = self._function(*self._args)
+            self._args = ()
+        return self._value
+
+    def __repr__(self) -> str:
+        # Renderers without `resolve_lazy_fields` use the representation
+        return repr(self.resolve())
 
 
 def redact_secret(data: Dict) -> Dict:
@@ -21,3 +51,11 @@ def redact_secret(data: Dict) -> Dict:
             stack.extend(value for value in current.values() if isinstance(value, dict))
 
     return data_copy
+
+
+def serialize_redacted(objects: Iterable[Any]) -> List[Dict]:
+    """Serialize `objects` for a log record, with their secrets redacted."""
+    # put here to avoid cyclic dependencies
+    from raiden_common.storage.serialization import DictSerializer
+
+    return [redact_secret(DictSerializer.serialize(obj)) for obj in objects]
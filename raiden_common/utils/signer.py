@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from typing import Callable
 
 from eth_keys import keys
@@ -10,6 +11,13 @@
 from raiden_common.utils.formatting import to_hex_address
 from raiden_common.utils.typing import Address, AddressHex, Signature
 
+try:
+    from coincurve import PublicKey as CoincurvePublicKey
+except ImportError:
+    CoincurvePublicKey = None  # type: ignore
+
+RECOVER_CACHE_SIZE = 4096
+
 
 def eth_sign_sha3(data: bytes) -> bytes:
     """
@@ -43,9 +51,44 @@ def recover(
     data: bytes, signature: Signature, hasher: Callable[[bytes], bytes] = eth_sign_sha3
 ) -> Address:
     """eth_recover address from data hash and signature"""
-    public_key = get_public_key(data, signature, hasher)
+    return _recover_address(hasher(data), signature)
+
+
+@lru_cache(maxsize=RECOVER_CACHE_SIZE)
+def _recover_address(message_hash: bytes, signature: Signature) -> Address:
+    """Recover the address which signed ``message_hash``
+
+    The senders of messages are recovered more than once, e.g. the signature of
+    a transfer is checked for the message and again for its balance proof, so
+    the addresses are cached by hash and signature.
+    """
+    if CoincurvePublicKey is None or len(signature) != 65 or signature[-1] not in (0, 1, 27, 28):
+        return Address(get_public_key(message_hash, signature, _identity).to_canonical_address())
+
+    # Same as ``get_public_key``, without the validation of the intermediary
+    # ``eth_keys`` objects, which is as expensive as the recovery itself
+    if signature[-1] >= 27:
+        signature = Signature(signature[:-1] + bytes([signature[-1] - 27]))
+    try:
+        public_key = _ecdsa_recover(message_hash, signature)
+    except BadSignature as e:
+        raise InvalidSignature() from e
+    return Address(keccak(public_key)[-20:])
+
+
+def _ecdsa_recover(message_hash: bytes, signature: Signature) -> bytes:
+    """Same as ``keys.ecdsa_recover`` with the coincurve backend, returns the public key bytes"""
+    try:
+        public_key = CoincurvePublicKey.from_signature_and_message(
+            signature, message_hash, hasher=None
+        )
+    except Exception as e:  # pylint: disable=broad-except
+        raise BadSignature(str(e)) from e
+    return public_key.format(compressed=False)[1:]
+
 
-    return Address(public_key.to_canonical_address())
+def _identity(data: bytes) -> bytes:
+    return data
 
 
 class Signer(ABC):
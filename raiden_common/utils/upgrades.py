@@ -9,6 +9,7 @@
 import structlog
 
 from raiden_common.constants import RAIDEN_DB_VERSION
+from raiden_common.storage.migrations.v27_to_v28 import upgrade_v27_to_v28
 from raiden_common.storage.sqlite import SQLiteStorage
 from raiden_common.storage.versions import VERSION_RE, filter_db_names, latest_db_file
 from raiden_common.utils.typing import Any, Callable, DatabasePath, List, NamedTuple
@@ -19,7 +20,9 @@ class UpgradeRecord(NamedTuple):
     function: Callable
 
 
-UPGRADES_LIST: List[UpgradeRecord] = []
+UPGRADES_LIST: List[UpgradeRecord] = [
+    UpgradeRecord(from_version=27, function=upgrade_v27_to_v28),
+]
 
 
 log = structlog.get_logger(__name__)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+Measure the time the node needs to handle a `Block` with many channels and
+in-flight mediations.
+
+Every mediation waits for a route, which is retried on each block and looks
+up the channel of the next hop in `ChainState.addresses_to_channel`. The
+lookups are done once through the index of the token networks and once with
+the dictionary of all the channels rebuilt on every access, which is how the
+property used to work.
+
+Usage:
+    block_handling.py --channels 10000 --mediations 1000 --blocks 3
+"""
+import time
+from unittest.mock import patch
+
+import click
+
+from raiden_common.tests.utils.factories import (
+    UNIT_TRANSFER_SENDER,
+    LockedTransferSignedStateProperties,
+    NettingChannelEndStateProperties,
+    NettingChannelStateProperties,
+    create,
+    make_address,
+    make_block_hash,
+    make_chain_state,
+    make_secret,
+)
+from raiden_common.transfer import node
+from raiden_common.transfer.mediated_transfer.state import (
+    MediatorTransferState,
+    WaitingTransferState,
+)
+from raiden_common.transfer.mediated_transfer.tasks import MediatorTask
+from raiden_common.transfer.state import ChainState, NettingChannelState, RouteState
+from raiden_common.transfer.state_change import Block
+from raiden_common.utils.copy import deepcopy
+from raiden_common.utils.typing import (
+    Address,
+    BlockExpiration,
+    BlockGasLimit,
+    BlockNumber,
+    Dict,
+    TokenAmount,
+    TokenNetworkAddress,
+    Tuple,
+)
+
+
+def rebuilt_addresses_to_channel(
+    chain_state: ChainState,
+) -> Dict[Tuple[TokenNetworkAddress, Address], NettingChannelState]:
+    return {
+        (token_network.address, channel.partner_state.address): channel
+        for token_network_registry in chain_state.identifiers_to_tokennetworkregistries.values()
+        for token_network in token_network_registry.token_network_list
+        for channel in token_network.channelidentifiers_to_channels.values()
+    }
+
+
+def make_state(number_of_channels: int, number_of_mediations: int) -> ChainState:
+    payer_properties = NettingChannelStateProperties(
+        partner_state=NettingChannelEndStateProperties(
+            address=UNIT_TRANSFER_SENDER, balance=TokenAmount(100)
+        )
+    )
+    container = make_chain_state(number_of_channels, properties=[payer_properties])
+    chain_state = container.chain_state
+    payer_channel = container.channels[0]
+
+    # The next hop has no channel, the mediations keep waiting
+    route_state = RouteState(route=[container.our_address, make_address()])
+    for _ in range(number_of_mediations):
+        transfer = create(
+            LockedTransferSignedStateProperties(
+                amount=TokenAmount(10),
+                expiration=BlockExpiration(1000),
+                secret=make_secret(),
+                canonical_identifier=payer_channel.canonical_identifier,
+                recipient=container.our_address,
+                route_states=[route_state],
+            )
+        )
+        secrethash = transfer.lock.secrethash
+        # Only the lookup of the pending lock is needed to keep the task alive,
+        # the balance proof of the payer channel is not updated.
+        payer_channel.partner_state.secrethashes_to_lockedlocks[secrethash] = transfer.lock
+        mediator_state = MediatorTransferState(
+            secrethash=secrethash,
+            routes=[route_state],
+            waiting_transfer=WaitingTransferState(transfer),
+        )
+        chain_state.payment_mapping.secrethashes_to_task[secrethash] = MediatorTask(
+            token_network_address=container.token_network_address,
+            mediator_state=mediator_state,
+        )
+
+    return chain_state
+
+
+def run_blocks(chain_state: ChainState, number_of_blocks: int) -> float:
+    start = time.monotonic()
+    for block_number in range(chain_state.block_number + 1, number_of_blocks + 2):
+        block = Block(
+            block_number=BlockNumber(block_number),
+            gas_limit=BlockGasLimit(1),
+            block_hash=make_block_hash(),
+        )
+        node.state_transition(chain_state, block)
+    return time.monotonic() - start
+
+
+@click.command()
+@click.option("--channels", type=int, default=10000, show_default=True)
+@click.option("--mediations", type=int, default=1000, show_default=True)
+@click.option("--blocks", type=int, default=3, show_default=True)
+def main(channels: int, mediations: int, blocks: int) -> None:
+    chain_state = make_state(channels, mediations)
+
+    indexed = run_blocks(deepcopy(chain_state), blocks)
+    with patch.object(ChainState, "addresses_to_channel", property(rebuilt_addresses_to_channel)):
+        rebuilt = run_blocks(deepcopy(chain_state), blocks)
+
+    click.echo(f"{'channels':>10} {'mediations':>11} {'rebuilt ms':>11} {'index ms':>9}")
+    click.echo(
+        f"{channels:>10} {mediations:>11} "
+        f"{rebuilt / blocks * 1000:>11.3f} {indexed / blocks * 1000:>9.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
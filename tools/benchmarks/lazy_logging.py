@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Measure the cost of the debug logs of state changes when debug logging is
+disabled.
+
+The logging is configured at INFO level, so the records are dropped. The
+state changes are logged once with the serialized and redacted list computed
+for every call, which is how the logs used to be written, and once with a
+`LazyField`, which is only computed for emitted records.
+
+Usage:
+    lazy_logging.py --iterations 1000 --batch-size 10
+"""
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import structlog
+
+from raiden_common.log_config import configure_logging
+from raiden_common.storage.serialization import DictSerializer
+from raiden_common.tests.utils import factories
+from raiden_common.transfer.architecture import StateChange
+from raiden_common.transfer.mediated_transfer.state_change import ReceiveTransferRefund
+from raiden_common.transfer.state_change import Block, ReceiveUnlock
+from raiden_common.utils.logging import LazyField, redact_secret, serialize_redacted
+from raiden_common.utils.typing import BlockGasLimit, BlockNumber, Callable, List, MessageID
+
+log = structlog.get_logger("raiden_common.raiden_service")
+
+
+def make_state_changes(batch_size: int) -> List[StateChange]:
+    balance_proof = factories.create(factories.BalanceProofSignedStateProperties())
+    signed_transfer = factories.create(factories.LockedTransferSignedStateProperties())
+
+    state_changes: List[StateChange] = [
+        Block(BlockNumber(1), BlockGasLimit(1), factories.make_block_hash()),
+        ReceiveUnlock(
+            sender=balance_proof.sender,
+            message_identifier=MessageID(1),
+            secret=factories.make_secret(),
+            balance_proof=balance_proof,
+        ),
+        ReceiveTransferRefund(
+            transfer=signed_transfer,
+            balance_proof=signed_transfer.balance_proof,
+            sender=signed_transfer.balance_proof.sender,  # pylint: disable=no-member
+        ),
+    ]
+    return [state_changes[i % len(state_changes)] for i in range(batch_size)]
+
+
+def log_eagerly(state_changes: List[StateChange]) -> None:
+    log.debug(
+        "State changes",
+        state_changes=[
+            redact_secret(DictSerializer.serialize(state_change)) for state_change in state_changes
+        ],
+    )
+
+
+def log_lazily(state_changes: List[StateChange]) -> None:
+    log.debug("State changes", state_changes=LazyField(serialize_redacted, state_changes))
+
+
+def measure(
+    function: Callable[[List[StateChange]], None],
+    state_changes: List[StateChange],
+    iterations: int,
+) -> float:
+    start = time.monotonic()
+    for _ in range(iterations):
+        function(state_changes)
+    return time.monotonic() - start
+
+
+@click.command()
+@click.option("--iterations", type=int, default=1000, show_default=True)
+@click.option("--batch-size", type=int, default=10, show_default=True)
+def main(iterations: int, batch_size: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        configure_logging(
+            {"": "INFO"},
+            debug_log_file_path=str(Path(directory) / "raiden-debug.log"),
+            colorize=False,
+        )
+        state_changes = make_state_changes(batch_size)
+
+        eager = measure(log_eagerly, state_changes, iterations)
+        lazy = measure(log_lazily, state_changes, iterations)
+
+    click.echo(f"{'batch size':>10} {'eager us':>10} {'lazy us':>9}")
+    click.echo(
+        f"{batch_size:>10} " f"{eager / iterations * 1e6:>10.1f} {lazy / iterations * 1e6:>9.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
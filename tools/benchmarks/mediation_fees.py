@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+Measure the computation of the mediation fees.
+
+The fee schedule of a channel is replaced on every balance change. It is
+built once with the cached imbalance penalties and their interpolators, and
+once with both computed for every schedule, which is how the schedules used
+to be built.
+
+The fees of transfers of amounts spread over the capacity of the channels are
+then computed like `mediator.get_amount_without_fees` does, once with the fee
+function of the channel pair built for every transfer and once with the
+compiled function of `fee_function_cache`.
+
+Usage:
+    mediation_fees.py --capacity 1000000000000000000000 --iterations 1000
+"""
+import time
+from unittest.mock import patch
+
+import click
+
+from raiden_common.tests.utils.factories import make_canonical_identifier
+from raiden_common.transfer.mediated_transfer import mediation_fee
+from raiden_common.transfer.mediated_transfer.mediation_fee import (
+    FeeScheduleState,
+    calculate_imbalance_fees,
+    fee_function_cache,
+)
+from raiden_common.transfer.mediated_transfer.mediator import find_intersection
+from raiden_common.utils.typing import (
+    Balance,
+    ChannelID,
+    FeeAmount,
+    PaymentWithFeeAmount,
+    ProportionalFeeAmount,
+    TokenAmount,
+)
+
+PROPORTIONAL_IMBALANCE_FEE = ProportionalFeeAmount(10_000)
+
+
+def build_schedules(capacity: TokenAmount, iterations: int) -> float:
+    start = time.monotonic()
+    for _ in range(iterations):
+        FeeScheduleState(
+            flat=FeeAmount(100),
+            proportional=ProportionalFeeAmount(4_000),
+            imbalance_penalty=calculate_imbalance_fees(capacity, PROPORTIONAL_IMBALANCE_FEE),
+        )
+    return time.monotonic() - start
+
+
+def compute_fees(capacity: TokenAmount, iterations: int, cached: bool) -> float:
+    schedule = FeeScheduleState(
+        flat=FeeAmount(100),
+        proportional=ProportionalFeeAmount(4_000),
+        imbalance_penalty=calculate_imbalance_fees(capacity, PROPORTIONAL_IMBALANCE_FEE),
+    )
+    balance = Balance(capacity // 2)
+    channel_in = make_canonical_identifier(channel_identifier=ChannelID(1))
+    channel_out = make_canonical_identifier(channel_identifier=ChannelID(2))
+
+    start = time.monotonic()
+    for i in range(iterations):
+        amount_with_fees = PaymentWithFeeAmount(1 + balance * (i % 100) // 100)
+        if cached:
+            fee_func = fee_function_cache.get(
+                canonical_identifier_in=channel_in,
+                canonical_identifier_out=channel_out,
+                schedule_in=schedule,
+                schedule_out=schedule,
+                balance_in=balance,
+                balance_out=balance,
+                receivable=TokenAmount(capacity - balance),
+                backwards=False,
+            ).interpolate(amount_with_fees, cap_fees=True)
+        else:
+            fee_func = FeeScheduleState.mediation_fee_func(
+                schedule_in=schedule,
+                schedule_out=schedule,
+                balance_in=balance,
+                balance_out=balance,
+                receivable=TokenAmount(capacity - balance),
+                amount_with_fees=amount_with_fees,
+                cap_fees=True,
+            )
+        find_intersection(
+            fee_func, lambda i: amount_with_fees - fee_func.x_list[i]  # pylint: disable=W0640
+        )
+    return time.monotonic() - start
+
+
+@click.command()
+@click.option("--capacity", type=int, default=10**21, show_default=True)
+@click.option("--iterations", type=int, default=1000, show_default=True)
+def main(capacity: int, iterations: int) -> None:
+    cached = build_schedules(TokenAmount(capacity), iterations)
+    with patch.object(
+        mediation_fee,
+        "_calculate_imbalance_fees",
+        mediation_fee._calculate_imbalance_fees.__wrapped__,
+    ), patch.object(mediation_fee, "_penalty_func", mediation_fee._penalty_func.__wrapped__):
+        uncached = build_schedules(TokenAmount(capacity), iterations)
+    fees = compute_fees(TokenAmount(capacity), iterations, cached=False)
+    cached_fees = compute_fees(TokenAmount(capacity), iterations, cached=True)
+
+    click.echo(f"{'schedule us':>12} {'cached us':>10} {'fees us':>8} {'cached us':>10}")
+    click.echo(
+        f"{uncached / iterations * 1e6:>12.1f} {cached / iterations * 1e6:>10.1f} "
+        f"{fees / iterations * 1e6:>8.1f} {cached_fees / iterations * 1e6:>10.1f}"
+    )
+    click.echo(fee_function_cache.cache_info())
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
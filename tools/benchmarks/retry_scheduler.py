@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Measure the overhead of the retry scheduler of the Matrix transport.
+
+`--messages` messages to `--receivers` partners are queued and retried for
+`--duration` seconds. The messages are never acknowledged, so they are retried
+with the exponential backoff until the end. Sending is replaced by a counter.
+
+The number of checks of the retry queues is reported next to the wakeups which
+polling every queue each `--retry-interval` seconds would have needed, together
+with the CPU time used by the process while retrying.
+
+Usage:
+    retry_scheduler.py --receivers 1000 --messages 10000 --duration 10
+"""
+import time
+from unittest.mock import patch
+
+import click
+import gevent
+
+from raiden_common.constants import EMPTY_SIGNATURE, Environment
+from raiden_common.log_config import configure_logging
+from raiden_common.messages.synchronization import Processed
+from raiden_common.network.transport.matrix import transport as transport_module
+from raiden_common.network.transport.matrix.client import GMatrixClient
+from raiden_common.network.transport.matrix.transport import MatrixTransport, _RetryQueue
+from raiden_common.settings import MatrixTransportConfig
+from raiden_common.tests.utils.factories import make_address, make_message_identifier
+from raiden_common.tests.utils.mocks import MockRaidenService
+from raiden_common.transfer.events import SendProcessed
+from raiden_common.transfer.identifiers import (
+    CANONICAL_IDENTIFIER_UNORDERED_QUEUE,
+    QueueIdentifier,
+)
+
+
+@click.command()
+@click.option("--receivers", type=int, default=1000, show_default=True)
+@click.option("--messages", type=int, default=10_000, show_default=True)
+@click.option("--retry-interval", type=float, default=1.0, show_default=True)
+@click.option("--duration", type=float, default=10.0, show_default=True)
+def main(receivers: int, messages: int, retry_interval: float, duration: float) -> None:
+    configure_logging({"": "INFO"}, disable_debug_logfile=True, colorize=False)
+    config = MatrixTransportConfig(
+        retries_before_backoff=2,
+        retry_interval_initial=retry_interval,
+        retry_interval_max=retry_interval * 8,
+        server="http://none",
+        available_servers=[],
+    )
+
+    def make_client(handle_messages_callback, servers, *args, **kwargs):  # type: ignore
+        # pylint: disable=unused-argument
+        return GMatrixClient(handle_messages_callback, base_url=servers[0])
+
+    with patch.object(transport_module, "make_client", make_client):
+        transport = MatrixTransport(config=config, environment=Environment.PRODUCTION)
+    transport._raiden_service = MockRaidenService()  # type: ignore
+    transport._stop_event.clear()
+    transport._prioritize_broadcast_messages = False
+    # Pretend the transport greenlet is running
+    transport.greenlet = True
+
+    sent = 0
+
+    def send_raw(*args, **kwargs):  # type: ignore  # pylint: disable=unused-argument
+        nonlocal sent
+        sent += 1
+
+    transport._send_raw = send_raw  # type: ignore
+
+    checks = 0
+    check_and_send = _RetryQueue._check_and_send
+
+    def counting_check_and_send(self):  # type: ignore
+        nonlocal checks
+        checks += 1
+        return check_and_send(self)
+
+    _RetryQueue._check_and_send = counting_check_and_send  # type: ignore
+
+    addresses = [make_address() for _ in range(receivers)]
+    queues = transport._queueids_to_queues
+
+    start = time.monotonic()
+    for i in range(messages):
+        queue_identifier = QueueIdentifier(
+            recipient=addresses[i % receivers],
+            canonical_identifier=CANONICAL_IDENTIFIER_UNORDERED_QUEUE,
+        )
+        message_identifier = make_message_identifier()
+        queues.setdefault(queue_identifier, []).append(
+            SendProcessed(
+                recipient=queue_identifier.recipient,
+                recipient_metadata=None,
+                canonical_identifier=CANONICAL_IDENTIFIER_UNORDERED_QUEUE,
+                message_identifier=message_identifier,
+            )
+        )
+        message = Processed(message_identifier=message_identifier, signature=EMPTY_SIGNATURE)
+        transport._get_retrier(queue_identifier.recipient).enqueue(
+            queue_identifier, [(message, None)]
+        )
+    enqueue = time.monotonic() - start
+
+    start_cpu = time.process_time()
+    gevent.sleep(duration)
+    cpu = time.process_time() - start_cpu
+
+    transport._stop_event.set()
+    transport._retry_scheduler.notify()
+    gevent.joinall({transport._retry_scheduler.greenlet}, raise_error=True)
+
+    polling = int(receivers * duration / retry_interval)
+    click.echo(
+        f"{'enqueue ms':>10} {'sent':>8} {'checks':>8} {'polling':>8} {'cpu ms':>8} "
+        f"{'cpu %':>6}"
+    )
+    click.echo(
+        f"{enqueue * 1e3:>10.1f} {sent:>8} {checks:>8} {polling:>8} {cpu * 1e3:>8.1f} "
+        f"{cpu / duration * 100:>6.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmarks for the storage serializers, for the most common state
+changes, events and the `ChainState`.
+
+Every object is serialized and deserialized with the `JSONSerializer`, which
+reuses one marshmallow schema per class, and with a schema instantiated for
+every call plus a defensive copy of the decoded data, which is how the
+serializer used to work. The `BinarySerializer` is measured as well, together
+with the size of the encoded data.
+
+Usage:
+    serialization.py --iterations 2000 --channels 100
+"""
+import json
+import time
+from copy import deepcopy
+
+import click
+
+from raiden_common.storage.serialization import BinarySerializer, JSONSerializer
+from raiden_common.storage.serialization.schemas import BaseSchema, class_schema
+from raiden_common.storage.serialization.serializer import _import_type
+from raiden_common.tests.utils import factories
+from raiden_common.transfer.events import EventPaymentSentSuccess
+from raiden_common.transfer.mediated_transfer.events import SendLockedTransfer
+from raiden_common.transfer.mediated_transfer.state_change import ReceiveTransferRefund
+from raiden_common.transfer.state_change import Block, ReceiveUnlock
+from raiden_common.utils.typing import (
+    Any,
+    BlockGasLimit,
+    BlockNumber,
+    Callable,
+    Dict,
+    List,
+    MessageID,
+    PaymentAmount,
+    PaymentID,
+    Tuple,
+)
+
+
+def serialize_uncached(obj: Any) -> str:
+    schema = class_schema(obj.__class__, base_schema=BaseSchema)()
+    return json.dumps(schema.dump(obj))
+
+
+def deserialize_uncached(data: str) -> Any:
+    decoded: Dict = json.loads(data)
+    schema = class_schema(_import_type(decoded["_type"]), base_schema=BaseSchema)()
+    return schema.load(deepcopy(decoded))
+
+
+def make_objects(number_of_channels: int) -> List[Tuple[str, Any]]:
+    balance_proof = factories.create(factories.BalanceProofSignedStateProperties())
+    signed_transfer = factories.create(factories.LockedTransferSignedStateProperties())
+    unsigned_transfer = factories.create(factories.LockedTransferUnsignedStateProperties())
+
+    registry_address = factories.make_token_network_registry_address()
+    chain_state = factories.make_chain_state(
+        number_of_channels=number_of_channels,
+        properties=[
+            factories.NettingChannelStateProperties(
+                token_network_registry_address=registry_address
+            )
+            for _ in range(number_of_channels)
+        ],
+    ).chain_state
+
+    return [
+        (
+            "Block",
+            Block(BlockNumber(1), BlockGasLimit(1), factories.make_block_hash()),
+        ),
+        (
+            "ReceiveUnlock",
+            ReceiveUnlock(
+                sender=balance_proof.sender,
+                message_identifier=MessageID(1),
+                secret=factories.make_secret(),
+                balance_proof=balance_proof,
+            ),
+        ),
+        (
+            "ReceiveTransferRefund",
+            ReceiveTransferRefund(
+                transfer=signed_transfer,
+                balance_proof=signed_transfer.balance_proof,
+                sender=signed_transfer.balance_proof.sender,  # pylint: disable=no-member
+            ),
+        ),
+        (
+            "SendLockedTransfer",
+            SendLockedTransfer(
+                recipient=factories.make_address(),
+                recipient_metadata=None,
+                canonical_identifier=unsigned_transfer.balance_proof.canonical_identifier,
+                message_identifier=MessageID(1),
+                transfer=unsigned_transfer,
+            ),
+        ),
+        (
+            "EventPaymentSentSuccess",
+            EventPaymentSentSuccess(
+                token_network_registry_address=registry_address,
+                token_network_address=factories.make_token_network_address(),
+                identifier=PaymentID(1),
+                amount=PaymentAmount(1),
+                target=factories.make_target_address(),
+                secret=factories.make_secret(),
+                route=[factories.make_address(), factories.make_address()],
+            ),
+        ),
+        (f"ChainState ({number_of_channels} channels)", chain_state),
+    ]
+
+
+def measure(function: Callable[[Any], Any], argument: Any, iterations: int) -> float:
+    """Return the mean time per call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(argument)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+@click.command()
+@click.option("--iterations", type=int, default=1000, show_default=True)
+@click.option("--channels", type=int, default=100, show_default=True)
+def main(iterations: int, channels: int) -> None:
+    click.echo(
+        f"{'type':>28} {'dump us':>10} {'cached':>10} {'binary':>10} "
+        f"{'load us':>10} {'cached':>10} {'binary':>10} {'json B':>8} {'binary B':>8}"
+    )
+    for name, obj in make_objects(channels):
+        # The big objects are much slower, keep the runtime reasonable
+        runs = iterations if "ChainState" not in name else max(1, iterations // 100)
+        data = JSONSerializer.serialize(obj)
+        binary_data = BinarySerializer.serialize(obj)
+        assert JSONSerializer.deserialize(data) == obj, f"{name} does not roundtrip"
+        assert BinarySerializer.deserialize(binary_data) == obj, f"{name} does not roundtrip"
+
+        click.echo(
+            f"{name:>28} "
+            f"{measure(serialize_uncached, obj, runs):>10.1f} "
+            f"{measure(JSONSerializer.serialize, obj, runs):>10.1f} "
+            f"{measure(BinarySerializer.serialize, obj, runs):>10.1f} "
+            f"{measure(deserialize_uncached, data, runs):>10.1f} "
+            f"{measure(JSONSerializer.deserialize, data, runs):>10.1f} "
+            f"{measure(BinarySerializer.deserialize, binary_data, runs):>10.1f} "
+            f"{len(data):>8} {len(binary_data):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
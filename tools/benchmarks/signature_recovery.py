@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Measure the validation of a batch of signed messages received over Matrix.
+
+`validate_and_parse_message` deserializes the messages and recovers their
+senders. The senders are recovered through `eth_keys`, directly with
+`coincurve`, and with `coincurve` in chunks by the hub's threadpool, which
+only pays off with more than one CPU. The caches of the deserialization and of
+the recovered addresses are cleared before every batch.
+
+Usage:
+    signature_recovery.py --messages 500 --iterations 10
+"""
+import time
+from unittest.mock import patch
+
+import click
+
+from raiden_common.messages.synchronization import Processed
+from raiden_common.network.transport.matrix import utils as matrix_utils
+from raiden_common.network.transport.matrix.utils import (
+    cached_deserialize,
+    validate_and_parse_message,
+)
+from raiden_common.storage.serialization.serializer import MessageSerializer
+from raiden_common.tests.utils.factories import make_signature, make_signer
+from raiden_common.utils import signer as signer_module
+from raiden_common.utils.typing import Address, MessageID
+
+
+def measure(data: str, sender: Address, messages: int, iterations: int) -> float:
+    start = time.monotonic()
+    for _ in range(iterations):
+        cached_deserialize.cache_clear()
+        signer_module._recover_address.cache_clear()
+        assert len(validate_and_parse_message(data, sender)) == messages, "Messages dropped"
+    return time.monotonic() - start
+
+
+@click.command()
+@click.option("--messages", type=int, default=500, show_default=True)
+@click.option("--iterations", type=int, default=10, show_default=True)
+def main(messages: int, iterations: int) -> None:
+    signer = make_signer()
+    lines = []
+    for message_identifier in range(messages):
+        message = Processed(
+            message_identifier=MessageID(message_identifier), signature=make_signature()
+        )
+        message.sign(signer)
+        lines.append(MessageSerializer.serialize(message))
+    data = "\n".join(lines)
+
+    with patch.object(signer_module, "CoincurvePublicKey", None), patch.object(
+        matrix_utils, "RECOVER_SENDERS_CHUNK_SIZE", messages
+    ):
+        eth_keys = measure(data, signer.address, messages, iterations)
+    with patch.object(matrix_utils, "RECOVER_SENDERS_CHUNK_SIZE", messages):
+        coincurve = measure(data, signer.address, messages, iterations)
+    threadpool = measure(data, signer.address, messages, iterations)
+
+    count = messages * iterations
+    click.echo(f"{'eth_keys us':>12} {'coincurve us':>13} {'threadpool us':>14}")
+    click.echo(
+        f"{eth_keys / count * 1e6:>12.1f} {coincurve / count * 1e6:>13.1f} "
+        f"{threadpool / count * 1e6:>14.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
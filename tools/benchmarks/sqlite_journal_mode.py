@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+Measure the commit latency of the node's database for the supported journal
+modes and synchronous settings, and whether another process can read the
+database while the node writes to it.
+
+Every write is a single state change with one event, committed on its own,
+which is the worst case for the node. The reader uses a separate connection,
+as `tools/debugging/replay_wal.py` would, and counts how many queries succeed
+while the writes are running.
+
+Usage:
+    sqlite_journal_mode.py --writes 1000
+"""
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import click
+
+from raiden_common.constants import SQLiteJournalMode, SQLiteSynchronous
+from raiden_common.storage.sqlite import SQLiteStorage
+from raiden_common.utils.typing import List, NamedTuple, Optional, Tuple
+
+CONFIGURATIONS: List[Tuple[SQLiteJournalMode, Optional[SQLiteSynchronous]]] = [
+    (SQLiteJournalMode.PERSIST, None),
+    (SQLiteJournalMode.WAL, SQLiteSynchronous.FULL),
+    (SQLiteJournalMode.WAL, SQLiteSynchronous.NORMAL),
+]
+
+STATE_CHANGE = '{"_type": "raiden_common.transfer.state_change.Block", "block_number": "1"}'
+EVENT = '{"_type": "raiden_common.transfer.events.EventPaymentSentFailed", "reason": "none"}'
+
+
+class Result(NamedTuple):
+    latencies: List[float]
+    reads: int
+    blocked_reads: int
+
+
+def reader(database_path: Path, stop: threading.Event, counters: List[int]) -> None:
+    conn = sqlite3.connect(str(database_path), timeout=0)
+    while not stop.is_set():
+        try:
+            conn.execute("SELECT COUNT(1) FROM state_events").fetchone()
+            counters[0] += 1
+        except sqlite3.OperationalError:
+            counters[1] += 1
+        time.sleep(0.001)
+    conn.close()
+
+
+def run(
+    database_path: Path,
+    journal_mode: SQLiteJournalMode,
+    synchronous: Optional[SQLiteSynchronous],
+    writes: int,
+) -> Result:
+    storage = SQLiteStorage(database_path, journal_mode=journal_mode, synchronous=synchronous)
+
+    stop = threading.Event()
+    counters = [0, 0]
+    reader_thread = threading.Thread(target=reader, args=(database_path, stop, counters))
+    reader_thread.start()
+
+    latencies = []
+    for _ in range(writes):
+        start = time.monotonic()
+        with storage.transaction():
+            state_change_id = storage.write_state_changes([STATE_CHANGE])[0]
+            storage.write_events([(state_change_id, EVENT)])
+        latencies.append(time.monotonic() - start)
+
+    stop.set()
+    reader_thread.join()
+    storage.close()
+
+    return Result(latencies=latencies, reads=counters[0], blocked_reads=counters[1])
+
+
+@click.command()
+@click.option("--writes", type=int, default=500, show_default=True)
+def main(writes: int) -> None:
+    click.echo(
+        f"{'journal':>8} {'synchronous':>12} {'mean ms':>8} {'p99 ms':>8} "
+        f"{'reads':>7} {'blocked':>8}"
+    )
+    for journal_mode, synchronous in CONFIGURATIONS:
+        with tempfile.TemporaryDirectory() as directory:
+            result = run(Path(directory) / "bench.db", journal_mode, synchronous, writes)
+
+        latencies_ms = sorted(latency * 1000 for latency in result.latencies)
+        p99 = latencies_ms[int(len(latencies_ms) * 0.99) - 1]
+        synchronous_name = synchronous.value if synchronous else "default"
+        click.echo(
+            f"{journal_mode.value:>8} {synchronous_name:>12} "
+            f"{statistics.mean(latencies_ms):>8.3f} {p99:>8.3f} "
+            f"{result.reads:>7} {result.blocked_reads:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
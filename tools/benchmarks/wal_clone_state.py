@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+Compare the time the write-ahead log needs to apply a batch of state changes
+when the `ChainState` is cloned with a full pickle copy versus the
+copy-on-write clone (`StorageConfig.copy_on_write_state`).
+
+Every batch touches a single channel, so the cost is dominated by cloning the
+state and grows with the number of channels for the full copy.
+
+Usage:
+    wal_clone_state.py --channels 10 --channels 100 --channels 1000 --batches 200
+"""
+import time
+
+import click
+
+from raiden_common.storage.serialization import JSONSerializer
+from raiden_common.storage.sqlite import SerializedSQLiteStorage
+from raiden_common.storage.wal import WriteAheadLog
+from raiden_common.tests.utils.factories import make_chain_state
+from raiden_common.transfer import node
+from raiden_common.transfer.state import ChainState
+from raiden_common.transfer.state_change import ActionChannelSetRevealTimeout
+from raiden_common.utils.copy import deepcopy
+from raiden_common.utils.typing import BlockTimeout, List, Tuple
+
+
+def run_batches(
+    chain_state: ChainState,
+    state_changes: List[ActionChannelSetRevealTimeout],
+    copy_on_write: bool,
+) -> float:
+    storage = SerializedSQLiteStorage(":memory:", JSONSerializer())
+    storage.write_first_state_snapshot(chain_state)
+    wal = WriteAheadLog(chain_state, storage, node.state_transition, copy_on_write=copy_on_write)
+
+    start = time.monotonic()
+    for state_change in state_changes:
+        with wal.process_state_change_atomically() as dispatcher:
+            dispatcher.dispatch(state_change)
+    return time.monotonic() - start
+
+
+def benchmark(number_of_channels: int, number_of_batches: int) -> Tuple[float, float]:
+    container = make_chain_state(number_of_channels=number_of_channels)
+    channels = container.channels
+    state_changes = [
+        ActionChannelSetRevealTimeout(
+            canonical_identifier=channels[i % len(channels)].canonical_identifier,
+            reveal_timeout=BlockTimeout(7 + i % 2),
+        )
+        for i in range(number_of_batches)
+    ]
+
+    full_copy = run_batches(deepcopy(container.chain_state), state_changes, copy_on_write=False)
+    copy_on_write = run_batches(deepcopy(container.chain_state), state_changes, copy_on_write=True)
+    return full_copy, copy_on_write
+
+
+@click.command()
+@click.option(
+    "--channels",
+    "channel_counts",
+    type=int,
+    multiple=True,
+    default=(10, 100, 1000),
+    show_default=True,
+    help="Number of channels in the benchmarked state, can be given multiple times.",
+)
+@click.option("--batches", type=int, default=100, show_default=True)
+def main(channel_counts: Tuple[int, ...], batches: int) -> None:
+    click.echo(f"{'channels':>10} {'full copy ms':>14} {'cow ms':>10} {'speedup':>8}")
+    for number_of_channels in channel_counts:
+        full_copy, copy_on_write = benchmark(number_of_channels, batches)
+        click.echo(
+            f"{number_of_channels:>10} "
+            f"{full_copy / batches * 1000:>14.3f} "
+            f"{copy_on_write / batches * 1000:>10.3f} "
+            f"{full_copy / copy_on_write:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Measure the latency of applying a batch of state changes through the
+write-ahead log when every `--snapshot-every` batches a snapshot is taken, as
+`RaidenService.handle_state_changes` does, with the snapshot written inline
+versus in the background (`StorageConfig.background_snapshots`).
+
+Inline, the batch which triggers the snapshot also pays for serializing and
+writing the whole `ChainState`, which shows up in the maximum latency.
+
+Usage:
+    wal_snapshot_latency.py --channels 1000 --batches 500 --snapshot-every 50
+"""
+import statistics
+import time
+
+import click
+import gevent
+
+from raiden_common.storage.serialization import JSONSerializer
+from raiden_common.storage.sqlite import SerializedSQLiteStorage
+from raiden_common.storage.wal import WriteAheadLog
+from raiden_common.tests.utils.factories import (
+    NettingChannelStateProperties,
+    make_chain_state,
+    make_token_network_registry_address,
+)
+from raiden_common.transfer import node
+from raiden_common.transfer.state import ChainState
+from raiden_common.transfer.state_change import ActionChannelSetRevealTimeout
+from raiden_common.utils.copy import deepcopy
+from raiden_common.utils.typing import BlockTimeout, List
+
+
+def run_batches(
+    chain_state: ChainState,
+    state_changes: List[ActionChannelSetRevealTimeout],
+    snapshot_every: int,
+    background_snapshots: bool,
+) -> List[float]:
+    storage = SerializedSQLiteStorage(":memory:", JSONSerializer())
+    storage.write_first_state_snapshot(chain_state)
+    wal = WriteAheadLog(
+        chain_state,
+        storage,
+        node.state_transition,
+        copy_on_write=True,
+        background_snapshots=background_snapshots,
+    )
+
+    latencies = []
+    for qty, state_change in enumerate(state_changes, start=1):
+        start = time.monotonic()
+        with wal.process_state_change_atomically() as dispatcher:
+            dispatcher.dispatch(state_change)
+        if qty % snapshot_every == 0:
+            wal.snapshot(qty)
+        latencies.append(time.monotonic() - start)
+
+        # Give the snapshot worker a chance to run, as the node does while
+        # waiting for the next message
+        gevent.sleep(0)
+
+    wal.flush()
+    storage.close()
+    return latencies
+
+
+@click.command()
+@click.option("--channels", type=int, default=1000, show_default=True)
+@click.option("--batches", type=int, default=500, show_default=True)
+@click.option("--snapshot-every", type=int, default=50, show_default=True)
+def main(channels: int, batches: int, snapshot_every: int) -> None:
+    registry_address = make_token_network_registry_address()
+    container = make_chain_state(
+        number_of_channels=channels,
+        properties=[
+            NettingChannelStateProperties(token_network_registry_address=registry_address)
+            for _ in range(channels)
+        ],
+    )
+    state_changes = [
+        ActionChannelSetRevealTimeout(
+            canonical_identifier=container.channels[i % channels].canonical_identifier,
+            reveal_timeout=BlockTimeout(7 + i % 2),
+        )
+        for i in range(batches)
+    ]
+
+    click.echo(f"{'snapshots':>10} {'mean ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for background_snapshots in (False, True):
+        latencies = run_batches(
+            deepcopy(container.chain_state), state_changes, snapshot_every, background_snapshots
+        )
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        p99 = latencies_ms[int(len(latencies_ms) * 0.99) - 1]
+        mode = "background" if background_snapshots else "inline"
+        click.echo(
+            f"{mode:>10} {statistics.mean(latencies_ms):>8.3f} {p99:>8.3f} "
+            f"{latencies_ms[-1]:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
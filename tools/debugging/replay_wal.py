@@ -18,6 +18,7 @@
 import click
 from eth_utils import encode_hex, is_address, to_canonical_address, to_checksum_address
 
+from raiden_common.constants import SQLiteJournalMode
 from raiden_common.storage.serialization import JSONSerializer
 from raiden_common.storage.sqlite import (
     LOW_STATECHANGE_ULID,
@@ -276,8 +277,20 @@ def replay_wal(
     'checksummed) with "[Bob]" and all mentions of "identifier" with "[XXX]. '
     'It also allows you to use "Bob" as parameter value for "-n" and "-p" switches.',
 )
+@click.option(
+    "--journal-mode",
+    type=click.Choice([mode.value for mode in SQLiteJournalMode], case_sensitive=False),
+    default=SQLiteJournalMode.PERSIST.value,
+    show_default=True,
+    help="Must match the journal mode of the node. Use WAL to read the database of a running "
+    "node configured with the WAL journal mode.",
+)
 def main(
-    db_file: str, token_network_address: str, partner_address: str, names_translator: TextIO
+    db_file: str,
+    token_network_address: str,
+    partner_address: str,
+    names_translator: TextIO,
+    journal_mode: str,
 ) -> None:
     translator: Optional[Translator]
 
@@ -292,7 +305,10 @@ def main(
     assert is_address(token_network_address), "token_network_address must be provided"
     assert is_address(partner_address), "partner_address must be provided"
 
-    with closing(SerializedSQLiteStorage(Path(db_file), JSONSerializer())) as storage:
+    storage = SerializedSQLiteStorage(
+        Path(db_file), JSONSerializer(), journal_mode=SQLiteJournalMode(journal_mode.upper())
+    )
+    with closing(storage):
         replay_wal(
             storage=storage,
             token_network_address=TokenNetworkAddress(to_canonical_address(token_network_address)),